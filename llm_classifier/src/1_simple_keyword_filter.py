@@ -13,32 +13,30 @@ if __name__ == "__main__":
     candidate_page_list = json.load(open(os.path.join(SHARED_DATA_DIR, CAND_FILE), "r")) 
     print("Total candidate pages: ", len(candidate_page_list))
     # Check all the candidate pages, filter out the web pages that are not looking glass pages.
-    os.makedirs(PROCS_DIR, exist_ok=True)
+    near_dup_path = os.path.join(OUTPUT_DIR, NEAR_DUP_FILE)
+    near_dup_index = NearDuplicateIndex.load(near_dup_path)
+    seen_dup_groups = set()
     filtered_page_list = []
     count = 0
-    processed_count = 0      # For breakpoint resume
-    for lg_info in candidate_page_list:
-        # Check if the webpage contains any filter words.
-        dst_filepath = os.path.join(PROCS_DIR, lg_info["filename"])
-        if not os.path.exists(dst_filepath) and count > processed_count:
-            src_filepath = os.path.join(SAVE_DIR, lg_info["filename"])
-            html_str = open(src_filepath, "r", encoding="utf-8").read()
-            cleaned_str = collect_text_in_order(html_str)
-            if cleaned_str is not None:
-                context_content = extract_context_around_keywords(cleaned_str)
-                if context_content:
-                    # save the content to the PROCS_DIR
-                    filename = lg_info["filename"]
-                    filepath = os.path.join(PROCS_DIR, filename)
-                    with open(filepath, "w", encoding="utf-8") as f:
-                        f.write(context_content)
-                    filtered_page_list.append(lg_info)
-        elif os.path.exists(dst_filepath):
-            filtered_page_list.append(lg_info)
+    dup_count = 0
+    # Processed pages are tracked in the state file for breakpoint resume
+    state_path = os.path.join(OUTPUT_DIR, FILTER_STATE_FILE)
+    for lg_info, record in keyword_filter_pages(candidate_page_list, state_path):
+        if record["has_context"]:
+            # Only keep one page per near-duplicate group for the following stages
+            dup_group = near_dup_index.add_fingerprint(lg_info["url"], int(record["fingerprint"], 16))
+            lg_info["dup_group"] = dup_group
+            if dup_group in seen_dup_groups:
+                dup_count += 1
+            else:
+                seen_dup_groups.add(dup_group)
+                filtered_page_list.append(lg_info)
         count += 1
         if count % 1000 == 0:
-            print("{} processed, {} filtered".format(count, len(filtered_page_list)))
+            print("{} processed, {} filtered, {} near-duplicates".format(count, len(filtered_page_list), dup_count))
+    near_dup_index.save(near_dup_path)
     print("Total filtered pages: ", len(filtered_page_list))
+    print("Skipped near-duplicate pages: ", dup_count)
     # Save the filtered page list to file
     with open(os.path.join(OUTPUT_DIR, "filtered_page_list.json"), "w", encoding="utf-8") as f:
         json.dump(filtered_page_list, f, indent=4)
\ No newline at end of file
@@ -1,55 +1,39 @@
+import asyncio
 import json
 import time
-import shutil
-import pandas as pd
 import pickle as pkl
 import random
-from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
-from typing import Callable
 
 from configs import *
 from utils import *
 
-feat_logs = {}
-
-def request_llm_and_get_response(payload):
+def parse_features(content: str | None) -> list | None:
     """
-    Request the LLM and get the response.
+    Parse the "index-value" lines of the response into the 4 features, None if the request failed.
     """
-    retry_count = 0
-    res = None
-    while res is None:
-        try:
-            response = requests.request("POST", API_URL, json=payload, headers=API_HEADER)
-            response_dict = response.json()
-            content = response_dict["choices"][0]["message"]["content"]
-            # find four "\d-\d" in the content
-            feat_pattern = r"\d-\d"
-            res = re.findall(feat_pattern, content)
-        except Exception as e:
-            res = None
-            retry_count += 1
-            time.sleep(retry_count)
-            if retry_count > 5:
-                break
+    if content is None:
+        return None
+    # find four "\d-\d" in the content
+    feat_pattern = r"\d-\d"
+    res = re.findall(feat_pattern, content)
     feat = [0, 0, 0, 0]
-    if res:
-        # convert the result to a list of integers
-        for item in res:
-            index, value = item.split("-")
-            index = int(index) - 1
-            value = int(value)
+    # convert the result to a list of integers
+    for item in res:
+        index, value = item.split("-")
+        index = int(index) - 1
+        value = int(value)
+        if 0 <= index < len(feat):
             feat[index] = value
-    return feat        
+    return feat
 
-def interpret_one_page(data):
+def build_interpret_payload(data):
     """
     Interpret the webpage content using the LLM.
     """
     html_text, sample_prompt = data[0], data[1]
         
     new_base_prompt = {
-        "model": "Pro/deepseek-ai/DeepSeek-V3",
+        "model": LLM_MODEL,
         "stream": False,
         "max_tokens": 256,
         "temperature": 0.5,
@@ -93,17 +77,18 @@ Output Format:
         "content": input_prompt,
         "role": "user"
     })
-    
-    result = request_llm_and_get_response(new_base_prompt)
-    return result
+    return new_base_prompt
+
+async def interpret_one_page(client: AsyncLLMClient, data):
+    return parse_features(await client.chat(build_interpret_payload(data)))
 
-def criticize_one_page(data):
+def build_criticize_payload(data):
     """
     Criticize the webpage content using the LLM.
     """
     html_text, original_features, correct_label = data[0], data[1], data[2]
     new_base_prompt = {
-        "model": "Pro/deepseek-ai/DeepSeek-V3",
+        "model": LLM_MODEL,
         "stream": False,
         "max_tokens": 256,
         "temperature": 0.5,
@@ -143,81 +128,38 @@ Output the same index-value format only. No more explanations.""".format(
         "content": system_prompt,
         "role": "user"
     })
-    
-    
-    result = request_llm_and_get_response(new_base_prompt)
-    return result
+    return new_base_prompt
 
-def non_batched_classification(dataset: list, method: Callable) -> pd.DataFrame:
-    finish_count = 0
+async def criticize_one_page(client: AsyncLLMClient, data):
+    return parse_features(await client.chat(build_criticize_payload(data)))
+
+async def parallel_requests(client: AsyncLLMClient, dataset: list, method) -> list:
+    """
+    Run `method` over the dataset concurrently on the shared client, results in the input order.
+    """
     start_time = time.time()
-    task_idx = 0
-    result_list = [[] for _ in range(len(dataset))]
-    
-    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        future_set = set()
-        future_mapping = {}
-        # Initial tasks
-        for i in range(NUM_THREADS):
-            data = dataset[task_idx]
-            task_idx += 1
-            future = executor.submit(method, data)
-            future_set.add(future)
-            future_mapping[future] = (task_idx, url, text_path)
-            time.sleep(0.2)
-        
-        # After one task complete, start another one
-        while future_set:
-            done, future_set = wait(future_set, return_when=FIRST_COMPLETED, timeout=60)
-            
-            if len(done) == 0:
-                # If more than 2 mins without update, direct shut down the progress.
-                break
-            
-            for future in done:
-                result = future.result()
-                if result is not None:
-                    future_info = future_mapping[future]
-                    task_idx = future_info[0]
-                    result_list[task_idx - 1] = result
-                    finish_count += 1
-                    if finish_count % 50 == 0:
-                        print("Finished {} tasks, time elapsed: {:.2f} seconds".format(finish_count, time.time() - start_time))
-                    if task_idx < len(dataset):
-                        data = dataset[task_idx]
-                        html_text, url, text_path = data
-                        task_idx += 1
-                        future = executor.submit(method, html_text)
-                        future_set.add(future)
-                        future_mapping[future] = (task_idx, url, text_path)
-                        time.sleep(0.2)
-                else:
-                    future_info = future_mapping[future]
-                    origin_idx = future_info[0]
-                    data = dataset[origin_idx]
-                    html_text, url, text_path = data
-                    future = executor.submit(method, html_text)
-                    future_set.add(future)
-                    future_mapping[future] = (origin_idx, url, text_path)
-                    time.sleep(0.2)
-    return result_list
+    results = await asyncio.gather(*(method(client, data) for data in dataset))
+    print("Finished {} tasks, time elapsed: {:.2f} seconds".format(len(dataset), time.time() - start_time))
+    return list(results)
 
 def format_feature(sample: list) -> str:
     """
     Format the features to a string.
     """
     feature_str = ""
-    if sample["feature"] is None:
+    # The initial random samples are not interpreted yet
+    if sample.get("feature") is None:
         return "... 4-{}".format(sample["label"])
     for i, feature in enumerate(sample["feature"]):
         feature_str += "{}-{}\n".format(i + 1, feature)
     return feature_str
 
-def interpreter_model(dataset: list, samples: list) -> pd.DataFrame:
+async def interpreter_model(client: AsyncLLMClient, dataset: list, samples: list) -> list:
     """
     Interpret the dataset using the interpreter model, then parse the result to get features.
+    Unchanged (few-shot prompt, content) pairs are answered by the response cache of the client.
     """
-    original_features = []    
+    original_features = []
     example_prompt = """Examples:
 `Sample 1: {} -> {}`
 `Sample 2: {} -> {}`
@@ -227,10 +169,10 @@ def interpreter_model(dataset: list, samples: list) -> pd.DataFrame:
         samples[1][1]["content"], format_feature(samples[1][1]),
         samples[2][1]["content"], format_feature(samples[2][1]),
         samples[3][1]["content"], format_feature(samples[3][1])
-    )        
-    
-    input_dataset = [(example_prompt, sample["content"]) for sample in dataset]
-    results = non_batched_classification(input_dataset, interpret_one_page)
+    )
+
+    input_dataset = [(sample["content"], example_prompt) for sample in dataset]
+    results = await parallel_requests(client, input_dataset, interpret_one_page)
 
     for idx, result in enumerate(results):
         sample = dataset[idx]
@@ -239,23 +181,25 @@ def interpreter_model(dataset: list, samples: list) -> pd.DataFrame:
             "text_path": sample["text_path"],
             "label": sample["label"],
             "content": sample["content"],
-            "feature": result
+            "feature": result,
+            # The 4th feature is the prediction of the LG service page
+            "result": result[3] if result is not None else None
         }
         original_features.append(one_feature)
-    return orginial_features
+    return original_features
 
-def criticize_model(err_samples: list) -> list:
+async def criticize_model(client: AsyncLLMClient, err_samples: list) -> list:
     """
     According to the result of the interpreter model, criticize the dataset.
-    Get the refined samples and the corresponding features.
+    Get the refined samples and the corresponding features, every sample must have its features.
     """
     revised_samples = []
     input_dataset = []
     for index_sample in err_samples:
         index, sample = index_sample[0], index_sample[1]
         input_dataset.append((sample["content"], sample["feature"], sample["label"]))
-    result = non_batched_classification(input_dataset, criticize_one_page)
-    for idx, result in enumerate(result):
+    results = await parallel_requests(client, input_dataset, criticize_one_page)
+    for idx, result in enumerate(results):
         original_idx = err_samples[idx][0]
         sample = err_samples[idx][1]
         one_feature = {
@@ -263,58 +207,69 @@ def criticize_model(err_samples: list) -> list:
             "text_path": sample["text_path"],
             "label": sample["label"],
             "content": sample["content"],
-            "feature": result
+            "feature": result,
+            "result": result[3] if result is not None else None
         }
         revised_samples.append((original_idx, one_feature))
     return revised_samples
 
-def diff_and_get_new_sample(revised_samples: list, err_samples: list) -> pd.DataFrame:
+def diff_and_get_new_sample(revised_samples: list, err_samples: list) -> tuple:
     """
     Compare the new result with the old result, calculate the difference.
+    A changed prediction (the 4th feature) weighs twice as much as the other features.
     """
     max_diff = 0
     max_diff_idx = None
     for idx, sample in enumerate(revised_samples):
-        original_sample = err_samples[idx][1]
-        revised_sample = sample[1]
-        label_diff = abs(original_sample["label"] - revised_sample["label"]) * 2
-        feat_diff = sum(abs(original_sample["feature"] - revised_sample["feature"]))
+        original_feature = err_samples[idx][1]["feature"]
+        revised_feature = sample[1]["feature"]
+        if revised_feature is None:
+            continue
+        label_diff = abs(original_feature[3] - revised_feature[3]) * 2
+        feat_diff = sum(abs(a - b) for a, b in zip(original_feature[:3], revised_feature[:3]))
         diff = label_diff + feat_diff
         if diff > max_diff:
             max_diff = diff
             max_diff_idx = idx
     # If the max_diff is 0, then return the original sample
+    if max_diff_idx is None:
+        return err_samples[0]
     max_diff_sample = revised_samples[max_diff_idx]
     return max_diff_sample
 
-def select_new_few_shots(err_samples: list, few_shot_samples: list, new_sample: tuple) -> pd.DataFrame:
+async def select_new_few_shots(client: AsyncLLMClient, err_samples: list, few_shot_samples: list, new_sample: tuple) -> list:
     """
     Select each shot from the few_shot_samples samples, replace it with the new sample.
     Then check the classification result of the interpreter model on those erroneous samples.
     Choose the one replacement that has the best classification result.
+    All the replacements are evaluated concurrently.
     """
     # if the new sample is the same as the old sample, directly replace it
     for index, sample in enumerate(few_shot_samples):
         if sample[0] == new_sample[0]:
             few_shot_samples[index] = new_sample
             return few_shot_samples
-    best_index = None
-    max_recall = 0
-    max_precision = 0
     input_error_samples = [err_sample[1] for err_sample in err_samples]
-    for index, sample in enumerate(few_shot_samples):
+    candidate_few_shots = []
+    for index in range(len(few_shot_samples)):
         # replace the sample with the new sample
         new_few_shot_samples = few_shot_samples.copy()
         new_few_shot_samples[index] = new_sample
-        # interpret the dataset again
-        new_features = interpreter_model(input_error_samples, new_few_shot_samples)
+        candidate_few_shots.append(new_few_shot_samples)
+    # interpret the error samples again, for all the candidates at once
+    candidate_features = await asyncio.gather(*(
+        interpreter_model(client, input_error_samples, candidate) for candidate in candidate_few_shots
+    ))
+    best_index = 0
+    max_recall = -1
+    max_precision = -1
+    for index, new_features in enumerate(candidate_features):
         precision, recall = calcualte_metrics(new_features)
         if recall > max_recall or (recall == max_recall and precision > max_precision):
             max_recall = recall
             max_precision = precision
             best_index = index
-    few_shot_samples[best_index] = new_sample
-    return few_shot_samples
+    return candidate_few_shots[best_index]
 
 def calcualte_metrics(features: list) -> tuple:
     """
@@ -337,46 +292,67 @@ def calcualte_metrics(features: list) -> tuple:
     recall = tp / (tp + fn) if (tp + fn) > 0 else 0
     return precision, recall
 
-if __name__ == "__main__":
-    # including: [{url, text_path, content, label}]
-    with open(os.path.join(OUTPUT_DIR, "representative_dataset.pkl"), "rb") as f:
-        rep_dataset = pkl.load(f)
-    print("Total dataset: ", len(rep_dataset))
+async def autoselection(rep_dataset: list) -> dict:
     # Log the iteration, about the acc and the selected few shots
     few_shot_logs = {}
-    delta_acc = 0
-    max_iter = 20
+    best_score = (-1, -1)
+    no_improve_count = 0
     cur_iter = 0
     # Randomly select 4 samples from the dataset
     rand_idx_list = random.sample(range(len(rep_dataset)), 4)
     few_shot_samples = [(idx, rep_dataset[idx]) for idx in rand_idx_list]
-    while cur_iter < max_iter:
-        print("Iteration: ", cur_iter)
-        # 1. Iterpret the dataset
-        orginial_features = interpreter_model(rep_dataset, few_shot_samples)
-        # check the error samples
-        err_samples = []
-        for idx, sample in enumerate(orginial_features):
-            if sample["result"] != sample["label"]:
-                err_samples.append((idx, sample))
-        precision, recall = calcualte_metrics(orginial_features)
-        few_shot_logs[cur_iter] = {
-            "few_shot_samples": [sample[0] for sample in few_shot_samples],
-            "precision": precision,
-            "recall": recall,
-        }
-        if len(err_samples) == 0:
-            print("No error samples, break the loop.")
-            break
-        # 2. Criticize the dataset
-        revised_samples = criticize_model(err_samples)
-        # 3. Select the new shot
-        new_sample = diff_and_get_new_sample(revised_samples, err_samples)
-        # 4. Replace the new sample with the old sample
-        few_shot_samples = select_new_few_shots(err_samples, few_shot_samples, new_sample)
-        cur_iter += 1
-    
+    async with AsyncLLMClient(API_URL, API_HEADER, cache=LLM_CACHE) as client:
+        while cur_iter < AUTOSELECT_MAX_ITER:
+            print("Iteration: ", cur_iter)
+            # 1. Iterpret the dataset
+            original_features = await interpreter_model(client, rep_dataset, few_shot_samples)
+            # check the error samples
+            err_samples = []
+            for idx, sample in enumerate(original_features):
+                if sample["result"] != sample["label"]:
+                    err_samples.append((idx, sample))
+            precision, recall = calcualte_metrics(original_features)
+            few_shot_logs[cur_iter] = {
+                "few_shot_samples": [sample[0] for sample in few_shot_samples],
+                "precision": precision,
+                "recall": recall,
+                "llm_stats": client.stats.summary(),
+            }
+            print(f"Precision: {precision:.4f}, Recall: {recall:.4f}, {len(err_samples)} error samples.")
+            if len(err_samples) == 0:
+                print("No error samples, break the loop.")
+                break
+            # Early stop when neither recall nor precision improves for AUTOSELECT_PATIENCE iterations
+            if recall > best_score[0] + AUTOSELECT_MIN_DELTA or (
+                recall >= best_score[0] - AUTOSELECT_MIN_DELTA and precision > best_score[1] + AUTOSELECT_MIN_DELTA
+            ):
+                best_score = (recall, precision)
+                no_improve_count = 0
+            else:
+                no_improve_count += 1
+                if no_improve_count >= AUTOSELECT_PATIENCE:
+                    print("Precision and recall plateaued, break the loop.")
+                    break
+            # 2. Criticize the dataset, samples whose interpretation failed have no features to criticize
+            critic_samples = [err_sample for err_sample in err_samples if err_sample[1]["feature"] is not None]
+            if critic_samples:
+                revised_samples = await criticize_model(client, critic_samples)
+                # 3. Select the new shot
+                new_sample = diff_and_get_new_sample(revised_samples, critic_samples)
+            else:
+                new_sample = err_samples[0]
+            # 4. Replace the new sample with the old sample
+            few_shot_samples = await select_new_few_shots(client, err_samples, few_shot_samples, new_sample)
+            cur_iter += 1
+    return few_shot_logs
+
+if __name__ == "__main__":
+    # including: [{url, text_path, content, label}]
+    with open(os.path.join(OUTPUT_DIR, "representative_dataset.pkl"), "rb") as f:
+        rep_dataset = pkl.load(f)
+    print("Total dataset: ", len(rep_dataset))
+    few_shot_logs = asyncio.run(autoselection(rep_dataset))
+
     # dump the few shot logs to file
     with open(os.path.join(OUTPUT_DIR, "few_shot_logs.json"), "w") as f:
         json.dump(few_shot_logs, f)
-    
\ No newline at end of file
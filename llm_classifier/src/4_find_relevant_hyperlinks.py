@@ -2,139 +2,67 @@
 # 1. If it is a related page, find all the urls around the tag with text in filter words.
 # 2. If it is a LG page, find all the urls within any list with the same secondary domain, without content in the footer and the header.
 import json
-from urllib.parse import urljoin
-import regex as re
+from concurrent.futures import ProcessPoolExecutor
 import pickle as pkl
 
 from configs import *
 from utils import *
 
-def get_candidate_urls_from_related(html_txt:str, url:str):
+def extract_one_page(task):
     """
-    Extract the candidate URLs from the related page.
+    Process pool worker, stream one HTML file and return its candidate links.
     """
-    candidate_urls = set()
-    soup = parse_webpages(html_txt)
-    if soup is None:
-        return candidate_urls
-        
-    tags_with_lg = []
-    for text_node in soup.find_all(string=True):
-        text_str = text_node.strip().lower()
-        if "looking glass" in text_str or "lookingglass" in text_str:
-            tags_with_lg.append(text_node)
+    filepath, url, is_lg = task
+    try:
+        return filepath, extract_candidate_links(filepath, url, is_lg)
+    except FileNotFoundError:
+        return filepath, None
 
-    for tag in tags_with_lg:
-        parent_tag = tag.parent if tag.parent is not None else tag
-        a_tags = parent_tag.find_all("a", href=True)
-        for a in a_tags:
-            link = a['href'].rstrip("/")
-            try:
-                link = urljoin(url, link)
-            except:
-                continue
-            candidate_urls.add(link)
-    return candidate_urls
-
-def get_candidate_urls_from_lg(html_txt:str):
-    """
-    Extract the candidate URLs from the LG page.
-    Directly find all the urls with the same 
-    """
-    urls = set()
-    # Directly find all the urls using regex
-    pattern = re.compile(r'https?://[^\s\'"<>]+')
-    matched_urls = re.findall(pattern, html_txt)
-    # Remove the urls that are not looking glass pages
-    for url in matched_urls:
-        url_lower = url.lower()
-        # Check if the url is a looking glass page
-        for word in URL_FILTER_WORDS:
-            if word in url_lower:
-                urls.add(url)
-                break
-    return urls
-
-def get_candidate_urls_from_html(html_txt:str, url:str, is_lg=False):
-    if is_lg:
-        urls = get_candidate_urls_from_lg(html_txt)
-    else:
-        urls = get_candidate_urls_from_related(html_txt, url)
-    # filter out all the shown urls
-    return urls
+def build_tasks(page_list, page_dir, is_lg):
+    return [(os.path.join(page_dir, info["filename"]), info["url"], is_lg) for info in page_list]
 
 if __name__ == "__main__":
     with open(os.path.join(SHARED_DATA_DIR, CAND_FILE), "r") as f:
         candidate_page_list = json.load(f)
     # build the set of all the appeared urls
     set_crawled_url = {info["url"] for info in candidate_page_list}
-    
+
     with open(os.path.join(OUTPUT_DIR, RELATED_FILE), "r") as f:
         related_page_list = json.load(f)
     print(f"{len(related_page_list)} related pages.")
-    
+
     with open(os.path.join(SHARED_DATA_DIR, UNIQ_FILE), "r") as f:
         old_lg_page_list = json.load(f)
     print(f"{len(old_lg_page_list)} old LG pages.")
-    
+
     with open(os.path.join(OUTPUT_DIR, UNIQ_FILE), "r") as f:
         lg_page_list = json.load(f)
     print(f"{len(lg_page_list)} LG pages.")
+
+    # Related pages are copied to RELATED_DIR, new and old LG pages are in SAVE_DIR
+    tasks = build_tasks(related_page_list, RELATED_DIR, is_lg=False)
+    tasks += build_tasks(lg_page_list, SAVE_DIR, is_lg=True)
+    tasks += build_tasks(old_lg_page_list, SAVE_DIR, is_lg=True)
+
     set_candidate_urls = set()
-        
     count = 0
-    for page_info in related_page_list:
-        count += 1
-        if count % 500 == 0:
-            print(f"{count} webpages processed.")
-        url = page_info["url"]
-        filename = page_info["filename"]
-        filepath = os.path.join(RELATED_DIR, filename)
-        try:
-            html_str = open(filepath, "r", encoding="utf-8").read()
-        except:
-            print(f"{filepath} not found.")
-            continue
-        urls = get_candidate_urls_from_html(html_str, url, is_lg=False)
-        urls = urls - set_crawled_url
-        set_candidate_urls.update(urls)
-        set_crawled_url.update(urls)
-        
-    for lg_info in lg_page_list:
-        count += 1
-        if count % 500 == 0:
-            print(f"{count} webpages processed.")
-        url = lg_info["url"]
-        filename = lg_info["filename"]
-        filepath = os.path.join(SAVE_DIR, filename)
-        try:
-            html_str = open(filepath, "r", encoding="utf-8").read()
-        except:
-            print(f"{filepath} not found.")
-            continue
-        urls = get_candidate_urls_from_html(html_str, url, is_lg=True)
-        urls = urls - set_crawled_url
-        set_candidate_urls.update(urls)
-        set_crawled_url.update(urls)
-    
-    # old uniq file
-    for lg_info in old_lg_page_list:
-        count += 1
-        if count % 500 == 0:
-            print(f"{count} webpages processed.")
-        url = lg_info["url"]
-        filename = lg_info["filename"]
-        filepath = os.path.join(SAVE_DIR, filename)
-        try:
-            html_str = open(filepath, "r", encoding="utf-8").read()
-        except:
-            print(f"{filepath} not found.")
-            continue
-        urls = get_candidate_urls_from_html(html_str, is_lg=True)
-        urls = urls - set_crawled_url
-        set_candidate_urls.update(urls)
-        set_crawled_url.update(urls)
-    
+    # Write the new candidate links with their context incrementally
+    with open(os.path.join(OUTPUT_DIR, LINK_FILE), "w", encoding="utf-8") as link_file:
+        with ProcessPoolExecutor(max_workers=NUM_PROCESSES) as executor:
+            for filepath, candidates in executor.map(extract_one_page, tasks, chunksize=64):
+                count += 1
+                if count % 500 == 0:
+                    print(f"{count} webpages processed, {len(set_candidate_urls)} candidate urls found.")
+                if candidates is None:
+                    print(f"{filepath} not found.")
+                    continue
+                for candidate in candidates:
+                    if candidate["url"] in set_crawled_url:
+                        continue
+                    set_crawled_url.add(candidate["url"])
+                    set_candidate_urls.add(candidate["url"])
+                    link_file.write(json.dumps(candidate) + "\n")
+
     list_candidate_urls = []
     for url in set_candidate_urls:
         try:
@@ -145,7 +73,7 @@ if __name__ == "__main__":
             "url": url,
             "filename": filename
         })
-    
+
     print("Total candidate urls: ", len(set_candidate_urls))
     with open(os.path.join(OUTPUT_DIR, "new_candidate_urls.bin"), "wb") as f:
-        pkl.dump(set_candidate_urls, f)
\ No newline at end of file
+        pkl.dump(set_candidate_urls, f)
@@ -1,29 +1,20 @@
-import hashlib
+import asyncio
 import json
-import shutil
 import time
-import pandas as pd
-import pickle as pkl
-from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
-from typing import Callable
 
 from configs import *
 from utils import *
+from pre_classifier import pre_classify_dataset
+from llm_backends import build_stage_backends, describe_backends, two_stage_classification_async
+from result_store import ResultStore, open_result_store, pages_of_label, copy_pages
 
-def build_new_dataset(label=None):
+def build_new_dataset(store: ResultStore):
     """
-    Build the dataset for the LLM classifier.
+    Build the dataset for the LLM classifier, pages already in the result store are skipped.
     """
     with open(os.path.join(OUTPUT_DIR, "new_filtered_page_list.json"), "r") as f:
         filtered_page_list = json.load(f)
-    set_finished_url = set()
-    # Filter out all the finished samples, each line is an url
-    with open(os.path.join(OUTPUT_DIR, "tmp_logs.txt"), "r") as f:
-        lines = f.readlines()
-        for line in lines:
-            line = line.strip()
-            url, _, _ = line.split("\t")
-            set_finished_url.add(url)
+    set_finished_url = store.finished_urls()
 
     dataset = []
     for page_info in filtered_page_list:
@@ -34,106 +25,81 @@ def build_new_dataset(label=None):
         with open(text_path, "r", encoding="utf-8") as f:
             text = f.read()
             text = f"{url}: {text}"
-            dataset.append((text, label, url, page_info["filename"]))
+            dataset.append((text, url, page_info["filename"]))
     return dataset
 
-def non_batched_classification(dataset: list, method: Callable) -> pd.DataFrame:
+async def async_classification(dataset: list, store: ResultStore, batched=LLM_BATCH_ENABLED):
+    """
+    Classify all pages on the shared asynchronous client, results are appended to the result store on arrival.
+    Pages failed after all retries are not stored, so they are classified again in the next run.
+    In batched mode several pages are packed into one request by pack_batches.
+    Each stage runs on the backend selected by LLM_STAGE_BACKENDS.
+    """
     finish_count = 0
+    failed_count = 0
     start_time = time.time()
-    task_idx = 0
-        
-    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        future_set = set()
-        result_log = []
-        future_mapping = {}
-        # Initial tasks
-        for i in range(NUM_THREADS):
-            data = dataset[task_idx]
-            html_text, label, url, text_path = data
-            task_idx += 1
-            future = executor.submit(method, html_text)
-            future_set.add(future)
-            future_mapping[future] = (task_idx, label, url, text_path)
-            time.sleep(0.3)
-        
-        # After one task complete, start another one
-        while future_set:
-            done, future_set = wait(future_set, return_when=FIRST_COMPLETED, timeout=120)
-            
-            if len(done) == 0:
-                # If more than 2 mins without update, direct shut down the progress.
-                break
-            
-            for future in done:
-                result = future.result()
-                if result is not None:
-                    future_info = future_mapping[future]
-                    #  task_idx, label, url, text_path, retry_count
-                    result_log.append((result, future_info[1], future_info[2], future_info[3]))
-                    
-                    with open(os.path.join(OUTPUT_DIR, "tmp_logs.txt"), "a") as f:
-                        f.write("{}\t{}\t{}\n".format(future_info[2], future_info[3], result))
-                    
-                    finish_count += 1
-                    if finish_count % 100 == 0:
-                        print("Finished {} tasks, time elapsed: {:.2f} seconds".format(finish_count, time.time() - start_time))
-                    if task_idx < len(dataset):
-                        data = dataset[task_idx]
-                        html_text, label, url, text_path = data
-                        task_idx += 1
-                        future = executor.submit(method, html_text)
-                        future_set.add(future)
-                        future_mapping[future] = (task_idx, label, url, text_path)
-                        time.sleep(0.3)
-                else:
-                    future_info = future_mapping[future]
-                    origin_idx = future_info[0]
-                    data = dataset[origin_idx]
-                    html_text, label, url, text_path = data
-                    future = executor.submit(method, html_text)
-                    future_set.add(future)
-                    future_mapping[future] = (origin_idx, label, url, text_path)
-                    time.sleep(0.3)
-        # Change res_mapping to pandas dataframe
-        res_df = pd.DataFrame(result_log, columns=["result", "label", "url", "text_path"])
-    return res_df
+    async with AsyncLLMClient(API_URL, API_HEADER, cache=LLM_CACHE) as client:
+        backends = build_stage_backends(client, cache=LLM_CACHE)
+        model = describe_backends(backends)
+        if batched:
+            batches = pack_batches(dataset)
+        else:
+            batches = [[data] for data in dataset]
+
+        async def method(client, batch):
+            batch_start = time.perf_counter()
+            batch_results = await two_stage_classification_async(backends, [data[0] for data in batch])
+            return batch_results, time.perf_counter() - batch_start
+
+        print(f"{len(dataset)} pages in {len(batches)} batches.")
+        async for batch, (batch_results, latency) in client.map_unordered(method, batches):
+            for data, result in zip(batch, batch_results):
+                html_text, url, filename = data
+                if result is None:
+                    failed_count += 1
+                    continue
+                store.append({
+                    "url": url,
+                    "filename": filename,
+                    "label": result,
+                    "source": "llm",
+                    "model": model,
+                    "prompt_version": PROMPT_VERSION,
+                    "latency": latency,
+                    "prompt_tokens": estimate_tokens(html_text),
+                })
+                finish_count += 1
+                if finish_count % 100 == 0:
+                    print("Finished {} tasks, {} failed, time elapsed: {:.2f} seconds".format(finish_count, failed_count, time.time() - start_time))
+        print("LLM client stats: ", client.stats.summary())
 
 if __name__ == "__main__":
-    dataset = build_new_dataset()
+    store = open_result_store()
+    dataset = build_new_dataset(store)
     print("Total dataset: ", len(dataset))
     random.shuffle(dataset)
 
-    print("Start testing...")
-    res_df = non_batched_classification(dataset, prompted_binary_classification)
-    print("Prompted binary classification finished.")
+    with store:
+        # Confident pages are labelled by the local pre-classifier, only the uncertain ones go to the LLM
+        routed, dataset = pre_classify_dataset(dataset)
+        for result, (html_text, url, filename) in routed:
+            store.append({
+                "url": url,
+                "filename": filename,
+                "label": result,
+                "source": "pre_classifier",
+                "model": "pre_classifier",
+                "prompt_tokens": estimate_tokens(html_text),
+            })
 
-    res_path = os.path.join(OUTPUT_DIR, "classification_result.pkl")
-    if os.path.exists(res_path):
-        with open(res_path, "rb") as f:
-            res_df_old = pkl.load(f)
-        res_df = pd.concat([res_df_old, res_df], ignore_index=True)
-    # Save the result to file
-    with open(res_path, "wb") as f:
-        pkl.dump(res_df, f)
+        print("Start testing...")
+        asyncio.run(async_classification(dataset, store))
+    print("Prompted binary classification finished.")
 
-    # For each webpage with label 3, extract the result to build UNIQ_FILE
-    res_3_df = res_df[res_df["result"] == 3]
-    unique_lg_page_list = []
-    for i in range(len(res_3_df)):
-        url = res_3_df.iloc[i]["url"]
-        text_path = res_3_df.iloc[i]["text_path"]
-        filename = os.path.basename(text_path)
-        # copy the src_path to the dst_path
-        src_path = os.path.join(SAVE_DIR, filename)
-        dst_path = os.path.join(VERIFIED_DIR, filename)
-        try:
-            shutil.copy(src_path, dst_path)
-        except Exception as e:
-            pass
-        unique_lg_page_list.append({
-            "url": url,
-            "filename": filename,
-        })
+    # All the results, old and new, from the store; the webpages with label 3 build UNIQ_FILE
+    res_df = store.load()
+    unique_lg_page_list = pages_of_label(res_df, 3)
+    copy_pages(unique_lg_page_list, VERIFIED_DIR)
     with open(os.path.join(OUTPUT_DIR, UNIQ_FILE), "w") as f:
         json.dump(unique_lg_page_list, f, indent=2)
         
@@ -154,10 +120,12 @@ if __name__ == "__main__":
         json.dump(total_lg_page_list, f, indent=2)
     print(f"Total {len(total_lg_page_list)} unique URLs.")
     
-    # de-duplication
-    hash_to_urls = {}
+    # de-duplication by near-duplicate groups
+    group_to_urls = {}
     page_contents = {}
-    # Calculate hash for each page
+    near_dup_path = os.path.join(OUTPUT_DIR, NEAR_DUP_FILE)
+    near_dup_index = NearDuplicateIndex.load(near_dup_path)
+    # Find the near-duplicate group for each page
     count = 0
     for lg_info in total_lg_page_list:
         count += 1
@@ -185,14 +153,15 @@ if __name__ == "__main__":
                 
         page_contents[lg_info["url"]] = content
         
-        hash_val = hashlib.md5(content.encode()).hexdigest()
-        if hash_val not in hash_to_urls:
-            hash_to_urls[hash_val] = []
-        hash_to_urls[hash_val].append(lg_info["url"])
+        dup_group = near_dup_index.add(lg_info["url"], content)
+        if dup_group not in group_to_urls:
+            group_to_urls[dup_group] = []
+        group_to_urls[dup_group].append(lg_info["url"])
+    near_dup_index.save(near_dup_path)
 
-    # Select shortest non-IP URL for each hash
+    # Select shortest non-IP URL for each group
     unique_urls = {min(urls, key=lambda url: (bool(re.search(r'\b([0-9]{1,3}\.){3}[0-9]{1,3}\b', url)), len(url)))
-                for urls in hash_to_urls.values()}
+                for urls in group_to_urls.values()}
     
     total_lg_page_list = [{"url": url, "filename": url_to_filename(url)} for url in unique_urls]
     print(f"Total {len(total_lg_page_list)} unique URLs after de-duplication.")
@@ -0,0 +1,203 @@
+# Focused crawler, iterating the hyperlink expansion (4 -> 5 -> re-classify) hop by hop automatically.
+# 1. Score the outgoing links by anchor text, URL tokens and the class of the page they come from.
+# 2. Fetch the best links within the budget of this hop and the budget of each domain.
+# 3. Classify the fetched pages, expand the links of related / LG pages as the frontier of the next hop.
+# 4. Stop when the yield of LG pages in one hop is too low, or no more budget and links.
+import heapq
+import json
+import random
+import tld
+import requests
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from configs import *
+from utils import *
+
+PTN_URL_TOKEN = re.compile(r"[a-z0-9]+")
+
+def get_domain(url: str) -> str:
+    """
+    Budget is counted by the first level domain, fallback to the hostname.
+    """
+    domain_info = tld.get_tld(url, as_object=True, fail_silently=True)
+    if domain_info is not None:
+        return domain_info.fld # type: ignore
+    return urlparse(url).hostname or url
+
+def score_link(candidate: dict, parent_label: int) -> float:
+    """
+    Score one outgoing link, the higher the more likely it leads to a LG page.
+    """
+    anchor_hits = len(set(PTN_KEYWORD.findall(candidate.get("anchor", "").lower())))
+    url_tokens = set(PTN_URL_TOKEN.findall(candidate["url"].lower()))
+    url_hits = len(url_tokens & URL_FILTER_WORDS)
+    return FOCUSED_ANCHOR_WEIGHT * anchor_hits + FOCUSED_URL_WEIGHT * url_hits + FOCUSED_PARENT_WEIGHT.get(parent_label, 0)
+
+class Frontier:
+    """
+    Priority queue of the links to fetch, with the per-domain fetch budget.
+    """
+    def __init__(self, set_crawled_url: set):
+        self.heap = []
+        self.set_seen_url = set(set_crawled_url)
+        self.domain_fetch_count = {}
+
+    def push(self, candidate: dict, parent_label: int):
+        url = candidate["url"]
+        if url in self.set_seen_url or not url.startswith("http"):
+            return
+        score = score_link(candidate, parent_label)
+        if score < FOCUSED_MIN_SCORE:
+            return
+        self.set_seen_url.add(url)
+        heapq.heappush(self.heap, (-score, url, candidate.get("source", "")))
+
+    def pop_hop(self, budget: int) -> list:
+        """
+        Pop the best links for one hop. Links of domains out of budget are dropped.
+        """
+        selected = []
+        while self.heap and len(selected) < budget:
+            neg_score, url, source = heapq.heappop(self.heap)
+            domain = get_domain(url)
+            if self.domain_fetch_count.get(domain, 0) >= FOCUSED_DOMAIN_BUDGET:
+                continue
+            self.domain_fetch_count[domain] = self.domain_fetch_count.get(domain, 0) + 1
+            selected.append((url, -neg_score, source))
+        return selected
+
+    def __len__(self):
+        return len(self.heap)
+
+def fetch_hop(selected: list) -> list:
+    """
+    Download the selected links of one hop, return the downloaded pages.
+    """
+    fetched = []
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        with requests.Session() as session:
+            partial_crawl = partial(fetch_one_page, session=session)
+            futures = {executor.submit(partial_crawl, url): (url, score, source) for url, score, source in selected}
+            for future in as_completed(futures):
+                result = future.result()
+                if not result["success"]:
+                    continue
+                url, score, source = futures[future]
+                fetched.append({
+                    "url": result["final_url"],
+                    "filename": url_to_filename(result["final_url"]),
+                    "score": score,
+                    "source": source,
+                })
+    return fetched
+
+def classify_one_page(page_info: dict) -> dict:
+    """
+    Keyword filter then LLM classification, pages without any keyword are unrelated (1).
+    """
+    filepath = os.path.join(SAVE_DIR, page_info["filename"])
+    try:
+        html_str = open(filepath, "r", encoding="utf-8").read()
+    except Exception:
+        return {**page_info, "label": None}
+    cleaned_str = collect_text_in_order(html_str)
+    context_content = extract_context_around_keywords(cleaned_str) if cleaned_str else None
+    if not context_content:
+        return {**page_info, "label": 1}
+    with open(os.path.join(PROCS_DIR, page_info["filename"]), "w", encoding="utf-8") as f:
+        f.write(context_content)
+    label = prompted_binary_classification(f"{page_info['url']}: {context_content}")
+    return {**page_info, "label": label}
+
+def classify_hop(fetched: list) -> list:
+    results = []
+    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
+        for result in executor.map(classify_one_page, fetched):
+            results.append(result)
+    return results
+
+def load_seed_frontier(frontier: Frontier):
+    """
+    Seed the frontier by the links extracted by 4_find_relevant_hyperlinks.py.
+    """
+    with open(os.path.join(OUTPUT_DIR, LINK_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                candidate = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            frontier.push(candidate, 3 if candidate.get("is_lg") else 2)
+
+if __name__ == "__main__":
+    with open(os.path.join(SHARED_DATA_DIR, CAND_FILE), "r") as f:
+        candidate_page_list = json.load(f)
+    set_crawled_url = {info["url"] for info in candidate_page_list}
+    # Allowing continuous crawling from the breakpoint
+    result_path = os.path.join(OUTPUT_DIR, FOCUSED_RESULT_FILE)
+    lg_page_list = []
+    if os.path.exists(result_path):
+        with open(result_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                set_crawled_url.add(result["url"])
+                if result["label"] == 3:
+                    lg_page_list.append({"url": result["url"], "filename": result["filename"]})
+
+    frontier = Frontier(set_crawled_url)
+    load_seed_frontier(frontier)
+    print(f"{len(frontier)} links in the seed frontier.")
+
+    os.makedirs(PROCS_DIR, exist_ok=True)
+    hop_logs = []
+    for hop in range(FOCUSED_MAX_HOPS):
+        selected = frontier.pop_hop(FOCUSED_HOP_BUDGET)
+        if len(selected) == 0:
+            print("No more links within the budget, stop crawling.")
+            break
+        random.shuffle(selected)
+        print(f"Hop {hop}: fetching {len(selected)} links, {len(frontier)} left in the frontier.")
+        fetched = fetch_hop(selected)
+        results = classify_hop(fetched)
+
+        label_count = {1: 0, 2: 0, 3: 0}
+        with open(result_path, "a", encoding="utf-8") as f:
+            for result in results:
+                if result["label"] is None:
+                    continue
+                result["hop"] = hop
+                f.write(json.dumps(result) + "\n")
+                label_count[result["label"]] = label_count.get(result["label"], 0) + 1
+                if result["label"] == 3:
+                    lg_page_list.append({"url": result["url"], "filename": result["filename"]})
+                # Expand the links of related and LG pages for the next hop
+                if result["label"] in (2, 3):
+                    filepath = os.path.join(SAVE_DIR, result["filename"])
+                    for candidate in extract_candidate_links(filepath, result["url"], is_lg=result["label"] == 3):
+                        frontier.push(candidate, result["label"])
+
+        hop_yield = label_count[3] / len(selected)
+        hop_logs.append({
+            "hop": hop,
+            "selected": len(selected),
+            "fetched": len(fetched),
+            "related": label_count[2],
+            "lg": label_count[3],
+            "yield": hop_yield,
+            "frontier": len(frontier),
+        })
+        print(f"Hop {hop}: {len(fetched)} fetched, {label_count[2]} related, {label_count[3]} LG pages, yield {hop_yield:.4f}.")
+        with open(os.path.join(OUTPUT_DIR, FOCUSED_LOG_FILE), "w") as f:
+            json.dump(hop_logs, f, indent=2)
+        if hop_yield < FOCUSED_MIN_YIELD:
+            print("Yield is below the threshold, stop crawling.")
+            break
+
+    print(f"Total {len(lg_page_list)} LG pages found by the focused crawler.")
+    with open(os.path.join(OUTPUT_DIR, "focused_lg_page_list.json"), "w") as f:
+        json.dump(lg_page_list, f, indent=2)
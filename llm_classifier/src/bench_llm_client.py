@@ -0,0 +1,98 @@
+# Benchmark the classification throughput of the LLM client, against the mock server by default.
+# Reports pages/s, request latency p50 / p99, retries and rate-limited responses for one setting of
+# concurrency and batching, so they can be tuned without network or spend.
+# Usage:
+#   python bench_llm_client.py --pages 2000 --concurrency 32 --batched --mock-args "--rate-429 0.02"
+#   python bench_llm_client.py --url http://127.0.0.1:8000/v1/chat/completions --source procs
+import argparse
+import asyncio
+import json
+import random
+import shlex
+import time
+
+from aiohttp import web
+
+from configs import *
+from utils import *
+import mock_llm_server
+
+def build_bench_dataset(num_pages: int, source: str) -> list:
+    """
+    Real processed pages from PROCS_DIR, or synthetic pages of similar length.
+    """
+    dataset = []
+    if source == "procs" and os.path.exists(PROCS_DIR):
+        filenames = os.listdir(PROCS_DIR)
+        random.shuffle(filenames)
+        for filename in filenames[:num_pages]:
+            with open(os.path.join(PROCS_DIR, filename), "r", encoding="utf-8") as f:
+                dataset.append(f"{filename}: {f.read()}")
+    while len(dataset) < num_pages:
+        words = random.choices(list(SIMPLE_FILETER_WORDS) + ["network", "server", "status", "[Input]:IP"], k=random.randint(50, 400))
+        dataset.append(f"https://example{len(dataset)}.net: " + " ".join(words))
+    return dataset
+
+async def run_bench(args) -> dict:
+    runner = None
+    url = args.url
+    if url is None:
+        # Start the mock server in the same event loop
+        mock_args = mock_llm_server.parse_args(shlex.split(args.mock_args) + ["--port", str(args.port)])
+        runner = web.AppRunner(mock_llm_server.build_app(mock_args))
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+        url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+
+    dataset = build_bench_dataset(args.pages, args.source)
+    if args.batched:
+        batches = pack_batches([(text,) for text in dataset])
+        method = lambda client, batch: batched_binary_classification_async(client, [data[0] for data in batch])
+    else:
+        batches = [[(text,)] for text in dataset]
+        method = lambda client, batch: prompted_binary_classification_async(client, batch[0][0])
+
+    finished, failed = 0, 0
+    start_time = time.time()
+    # No response cache, every page is a real request to the server
+    async with AsyncLLMClient(url, API_HEADER, concurrency=args.concurrency, max_retry=args.max_retry) as client:
+        async for batch, results in client.map_unordered(method, batches):
+            if not args.batched:
+                results = [results]
+            for result in results:
+                if result is None:
+                    failed += 1
+                else:
+                    finished += 1
+        stats = client.stats.summary()
+    elapsed = time.time() - start_time
+    if runner is not None:
+        await runner.cleanup()
+    return {
+        "pages": len(dataset),
+        "batches": len(batches),
+        "finished": finished,
+        "failed": failed,
+        "elapsed": elapsed,
+        "pages_per_second": finished / elapsed if elapsed > 0 else 0.0,
+        "latency_p50": stats["latency_p50"],
+        "latency_p99": stats["latency_p99"],
+        "calls": stats["calls"],
+        "retries": stats["retries"],
+        "rate_limited": stats["rate_limited"],
+        "tokens_per_second": stats["tokens_per_second"],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the LLM client throughput.")
+    parser.add_argument("--url", default=None, help="Chat completion URL, start the mock server if not given")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the in-process mock server")
+    parser.add_argument("--mock-args", default="", help="Arguments passed to the mock server")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--source", choices=("synthetic", "procs"), default="synthetic")
+    parser.add_argument("--concurrency", type=int, default=LLM_CONCURRENCY)
+    parser.add_argument("--max-retry", type=int, default=LLM_MAX_RETRY)
+    parser.add_argument("--batched", action="store_true")
+    args = parser.parse_args()
+    random.seed(0)
+    print(json.dumps(asyncio.run(run_bench(args)), indent=2))
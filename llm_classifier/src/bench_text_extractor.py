@@ -0,0 +1,71 @@
+# Benchmark the single-pass text extractor against the BeautifulSoup + html2text version.
+# Usage: python bench_text_extractor.py [sample_size]
+# 1. Throughput (pages/s and MB/s) of both extractors on the same sample of downloaded pages.
+# 2. Output agreement: exact match, token Jaccard similarity, and the keyword filter decision.
+import json
+import random
+import sys
+import time
+
+from configs import *
+from utils import *
+
+def run_extractor(func, html_list: list):
+    outputs = []
+    start = time.perf_counter()
+    for html_str in html_list:
+        outputs.append(func(html_str))
+    return outputs, time.perf_counter() - start
+
+def token_jaccard(text_a: str, text_b: str) -> float:
+    tokens_a, tokens_b = set(text_a.split()), set(text_b.split())
+    if not tokens_a and not tokens_b:
+        return 1.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+if __name__ == "__main__":
+    sample_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with open(os.path.join(SHARED_DATA_DIR, CAND_FILE), "r") as f:
+        candidate_page_list = json.load(f)
+    random.seed(0)
+    random.shuffle(candidate_page_list)
+
+    html_list = []
+    for info in candidate_page_list:
+        if len(html_list) >= sample_size:
+            break
+        try:
+            with open(os.path.join(SAVE_DIR, info["filename"]), "r", encoding="utf-8") as f:
+                html_list.append(f.read())
+        except Exception:
+            continue
+    total_mb = sum(len(html_str) for html_str in html_list) / 1024 / 1024
+    print(f"{len(html_list)} pages sampled, {total_mb:.1f} MB in total.")
+
+    legacy_outputs, legacy_time = run_extractor(collect_text_in_order_legacy, html_list)
+    new_outputs, new_time = run_extractor(collect_text_in_order, html_list)
+    for name, cost in (("legacy", legacy_time), ("single-pass", new_time)):
+        print(f"{name:>12}: {cost:.2f}s, {len(html_list) / cost:.1f} pages/s, {total_mb / cost:.2f} MB/s")
+    print(f"Speedup: {legacy_time / new_time:.2f}x")
+
+    # The legacy version gives up on the large pages, only compare the pages both extractors handled
+    compared, exact, skipped_by_legacy, filter_agree = 0, 0, 0, 0
+    list_jaccard = []
+    for legacy_text, new_text in zip(legacy_outputs, new_outputs):
+        if legacy_text is None:
+            skipped_by_legacy += 1
+            continue
+        if new_text is None:
+            continue
+        compared += 1
+        exact += legacy_text == new_text
+        list_jaccard.append(token_jaccard(legacy_text, new_text))
+        legacy_hit = bool(legacy_text) and extract_context_around_keywords(legacy_text) is not None
+        new_hit = bool(new_text) and extract_context_around_keywords(new_text) is not None
+        filter_agree += legacy_hit == new_hit
+    print(f"{skipped_by_legacy} pages skipped by the legacy extractor, {compared} pages compared.")
+    if compared > 0:
+        list_jaccard.sort()
+        print(f"Exact match: {exact / compared:.2%}")
+        print(f"Token Jaccard: mean {sum(list_jaccard) / compared:.3f}, median {list_jaccard[compared // 2]:.3f}")
+        print(f"Keyword filter agreement: {filter_agree / compared:.2%}")
@@ -16,6 +16,10 @@ TOTAL_FILE = "total_lg_page_list.json"
 CAND_FILE = "candidate_lg_page_list.json"
 UNIQ_FILE = "unique_lg_page_list.json"
 RELATED_FILE = "related_page_list.json"
+NEAR_DUP_FILE = "near_duplicate_index.json"
+LINK_FILE = "new_candidate_links.jsonl"
+FILTER_STATE_FILE = "keyword_filter_state.jsonl"
+NEW_FILTER_STATE_FILE = "new_keyword_filter_state.jsonl"
 
 # crawler configs
 MAX_RETRY = 2
@@ -58,6 +62,8 @@ PTN_CHAR = r'^[^\p{L}\u4e00-\u9fff\u0400-\u04FF]*$'
 PTN_IP = r'\b([0-9]{1,3}\.){3}[0-9]{1,3}\b'
 PTN_KEYWORD = re.compile(r'\b(?:' + '|'.join(SIMPLE_FILETER_WORDS) + r')\b', re.IGNORECASE)
 PTN_LINK = r'\[(.+?)\]\((.+?)\)'
+# Substring matching of all filter words in one scan, the longer word first
+PTN_FILTER_WORDS = re.compile('|'.join(re.escape(word) for word in sorted(SIMPLE_FILETER_WORDS, key=len, reverse=True)), re.IGNORECASE)
 URL_FILTER_WORDS = {
     "lookingglass",
     "lg",
@@ -69,6 +75,79 @@ URL_FILTER_WORDS = {
 
 MAX_WORKERS = 48
 NUM_THREADS = 8
+NUM_PROCESSES = max(1, (os.cpu_count() or 2) - 1)  # For CPU-bound parsing stages
+FILTER_CHUNK_SIZE = 32  # Pages dispatched to one worker at a time in the keyword filter
 IGNORE_THRESHOLD = 3 # The text with characters less than this threshold will be ignored
 TEXT_LEN_MAX_THRESHOLD = 200  # The threshold of the text length, remove the text if it's too long
-TEXT_LEN_MIN_THRESHOLD = 10  # The threshold of the text length, remove the text if it's too short
\ No newline at end of file
+TEXT_LEN_MIN_THRESHOLD = 10  # The threshold of the text length, remove the text if it's too short
+
+# ====================== LLM Backend Configs ====================== #
+# Fill in your API key here, or set the environment variables
+LLM_API_URL = os.environ.get("GLASSMINER_API_URL", "https://api.siliconflow.cn/v1/chat/completions")
+LLM_API_KEY = os.environ.get("GLASSMINER_API_KEY", "<Your API Key>")
+LLM_MODEL = os.environ.get("GLASSMINER_MODEL", "Pro/deepseek-ai/DeepSeek-V3")
+# Backend of each classification stage: "remote" (OpenAI-compatible API), "llama_cpp" (local GGUF model on CPU),
+# or "encoder" (fine-tuned encoder classifier). Stage 1: unrelated vs LG related; stage 2: LG related vs LG service.
+LLM_STAGE_BACKENDS = {
+    1: os.environ.get("GLASSMINER_STAGE1_BACKEND", "remote"),
+    2: os.environ.get("GLASSMINER_STAGE2_BACKEND", "remote"),
+}
+LLAMA_CPP_MODEL_PATH = os.environ.get("GLASSMINER_LLAMA_CPP_MODEL", os.path.join(OUTPUT_DIR, "models", "classifier.gguf"))
+LLAMA_CPP_THREADS = max(1, (os.cpu_count() or 2) - 1)
+LLAMA_CPP_CONTEXT = 8192
+# Directory of a HuggingFace sequence classification model, label ids 0 / 1 are the classes 1 / 2 of the stage
+ENCODER_MODEL_PATHS = {
+    1: os.environ.get("GLASSMINER_STAGE1_ENCODER", os.path.join(OUTPUT_DIR, "models", "encoder_stage1")),
+    2: os.environ.get("GLASSMINER_STAGE2_ENCODER", os.path.join(OUTPUT_DIR, "models", "encoder_stage2")),
+}
+ENCODER_BATCH_SIZE = 32
+
+# ====================== LLM Client Configs ====================== #
+LLM_CONCURRENCY = 32  # Max in-flight requests to the LLM provider
+LLM_TIMEOUT = 60  # Seconds for one request, including reading the response
+LLM_MAX_RETRY = 6
+LLM_BACKOFF_BASE = 1.0  # Seconds, doubled for every retry, with full jitter
+LLM_BACKOFF_MAX = 60.0
+LLM_CACHE_ENABLED = True  # Reuse the responses of unchanged (model, prompt template, content)
+LLM_CACHE_FILE = os.path.join(OUTPUT_DIR, "llm_cache.sqlite")
+LLM_BATCH_ENABLED = True  # Pack several pages into one classification request
+LLM_BATCH_MAX_PAGES = 8
+LLM_BATCH_TOKEN_BUDGET = 6000  # Estimated input tokens of the pages in one request
+CHARS_PER_TOKEN = 4  # Rough estimation of the tokens without the tokenizer
+RESULT_STORE_FILE = "classification_results.jsonl"  # Append-only store of the classification results
+RESULT_FSYNC_EVERY = 100  # Records written between two fsync of the result store
+CONTEXT_TOKEN_BUDGET = 800  # Estimated tokens of the context kept for one page
+CONTEXT_WINDOW_TOKENS = 40  # Tokens kept on each side of a keyword
+CONTEXT_SIGNAL_WEIGHT = 3  # Score of one [Input]/[Meta] marker in a window, one keyword hit scores 1
+
+# ====================== Near-duplicate Configs ====================== #
+SIMHASH_BITS = 64
+SIMHASH_SHINGLE_SIZE = 3  # Number of consecutive words hashed as one feature
+SIMHASH_MAX_DISTANCE = 3  # Pages whose fingerprints differ in at most this many bits are near-duplicates
+
+# ====================== Focused Crawler Configs ====================== #
+FOCUSED_RESULT_FILE = "focused_crawl_result.jsonl"
+FOCUSED_LOG_FILE = "focused_crawl_hops.json"
+FOCUSED_MAX_HOPS = 5  # Stop after this many hops even if the frontier is not empty
+FOCUSED_HOP_BUDGET = 5000  # Max pages fetched in one hop
+FOCUSED_DOMAIN_BUDGET = 20  # Max pages fetched from one first level domain over the whole crawl
+FOCUSED_MIN_YIELD = 0.005  # Stop when the ratio of LG pages in one hop is lower than this
+FOCUSED_MIN_SCORE = 1.0  # Links with lower score are not added to the frontier
+FOCUSED_ANCHOR_WEIGHT = 2.0  # Per distinct filter word in the anchor text
+FOCUSED_URL_WEIGHT = 1.0  # Per URL token in URL_FILTER_WORDS
+FOCUSED_PARENT_WEIGHT = {2: 0.5, 3: 1.0}  # Bonus by the class of the page the link comes from
+
+# ====================== Pre-classifier Configs ====================== #
+PRE_CLS_ENABLED = True  # Label the confident pages locally, only the uncertain ones go to the LLM
+PRE_CLS_MODEL_FILE = "pre_classifier.pkl"
+PRE_CLS_NUM_FEATURES = 2 ** 20  # Hashed word unigrams and bigrams
+PRE_CLS_C = 4.0  # Inverse regularization strength of the logistic regression
+PRE_CLS_HELD_OUT = 0.3  # Split for calibration and report, half each
+PRE_CLS_TARGET_PRECISION = 0.98  # Precision of the local decisions on held-out data
+PRE_CLS_MIN_THRESHOLD = 0.9  # Never route a page locally under this probability
+PRE_CLS_MIN_SUPPORT = 20  # Min held-out pages above the threshold to trust the calibration
+
+# ====================== Few-shot Autoselection Configs ====================== #
+AUTOSELECT_MAX_ITER = 20
+AUTOSELECT_PATIENCE = 3  # Stop after this many iterations without improvement
+AUTOSELECT_MIN_DELTA = 0.005  # Min change of precision / recall counted as improvement
@@ -0,0 +1,128 @@
+# Pluggable backends of the two classification stages, selected by LLM_STAGE_BACKENDS.
+# Stage 1: unrelated (1) vs LG related (2); stage 2: LG related (1) vs direct LG service (2).
+# 1. remote: the OpenAI-compatible API on the shared AsyncLLMClient.
+# 2. llama_cpp: a local GGUF chat model on CPU, with the same prompts and batching as the remote one.
+# 3. encoder: a fine-tuned sequence classification model, one forward pass per batch.
+# All backends take the batches packed by pack_batches, and return one label (or None) per page.
+import asyncio
+import time
+
+from configs import *
+from utils import *
+from llm_client import LLMStats
+
+class LlamaCppClient:
+    """
+    Same chat interface as AsyncLLMClient, answered by a local llama.cpp model.
+    Requests are serialized, the model already uses all the CPU threads.
+    """
+    def __init__(self, model_path=LLAMA_CPP_MODEL_PATH, cache=None):
+        from llama_cpp import Llama
+        self.model_name = "llama_cpp:" + os.path.basename(model_path)
+        self.llm = Llama(model_path=model_path, n_ctx=LLAMA_CPP_CONTEXT, n_threads=LLAMA_CPP_THREADS, verbose=False)
+        self.cache = cache
+        self.lock = asyncio.Lock()
+        self.stats = LLMStats()
+
+    async def chat(self, payload: dict, is_valid=None) -> str | None:
+        # The local model has its own entries in the response cache
+        payload = {**payload, "model": self.model_name}
+        if self.cache is not None:
+            content = await asyncio.to_thread(self.cache.get, payload, is_valid)
+            self.stats.record_cache(content is not None)
+            if content is not None:
+                return content
+        async with self.lock:
+            start = time.perf_counter()
+            try:
+                response = await asyncio.to_thread(
+                    self.llm.create_chat_completion,
+                    messages=payload["messages"],
+                    max_tokens=payload.get("max_tokens", 256),
+                    temperature=payload.get("temperature", 0.5),
+                    top_p=payload.get("top_p", 0.7),
+                    top_k=payload.get("top_k", 50),
+                )
+                content = response["choices"][0]["message"]["content"]
+            except Exception as e:
+                print(f"Local model failed: {e}")
+                self.stats.record_failure()
+                return None
+            self.stats.record(time.perf_counter() - start, response.get("usage"))
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put_valid, payload, content, is_valid)
+        return content
+
+class ChatBackend:
+    """
+    Prompted classification on a chat client (remote or local), a batch of one page uses the single-page prompt.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.name = getattr(client, "model_name", "remote:" + LLM_MODEL)
+
+    async def classify(self, stage: int, html_text_list: list) -> list:
+        return await classify_stage_batch_async(self.client, stage, html_text_list)
+
+class EncoderBackend:
+    """
+    Fine-tuned encoder classifier of one stage, label ids 0 / 1 are the classes 1 / 2.
+    """
+    def __init__(self, model_path: str):
+        from transformers import pipeline
+        self.classifier = pipeline("text-classification", model=model_path, device=-1)
+        self.name = "encoder:" + os.path.basename(os.path.normpath(model_path))
+        self.lock = asyncio.Lock()
+
+    def _predict(self, html_text_list: list) -> list:
+        outputs = self.classifier(html_text_list, batch_size=ENCODER_BATCH_SIZE, truncation=True)
+        labels = []
+        for output in outputs:
+            label_id = self.classifier.model.config.label2id.get(output["label"])
+            if label_id is None:
+                # Default label names are LABEL_0 / LABEL_1
+                label_id = int(output["label"].rsplit("_", 1)[-1])
+            labels.append(label_id + 1)
+        return labels
+
+    async def classify(self, stage: int, html_text_list: list) -> list:
+        async with self.lock:
+            return await asyncio.to_thread(self._predict, html_text_list)
+
+def build_stage_backends(client, cache=None) -> dict:
+    """
+    The backend of each stage by LLM_STAGE_BACKENDS, a local model shared by both stages is loaded once.
+    """
+    backends = {}
+    llama_backend = None
+    for stage, kind in LLM_STAGE_BACKENDS.items():
+        if kind == "remote":
+            backends[stage] = ChatBackend(client)
+        elif kind == "llama_cpp":
+            if llama_backend is None:
+                llama_backend = ChatBackend(LlamaCppClient(LLAMA_CPP_MODEL_PATH, cache=cache))
+            backends[stage] = llama_backend
+        elif kind == "encoder":
+            backends[stage] = EncoderBackend(ENCODER_MODEL_PATHS[stage])
+        else:
+            raise ValueError(f"Unknown backend {kind} for stage {stage}")
+    return backends
+
+def describe_backends(backends: dict) -> str:
+    """
+    The model recorded with the results, e.g. remote:<model>+encoder:<path>.
+    """
+    return "+".join(backends[stage].name for stage in sorted(backends))
+
+async def two_stage_classification_async(backends: dict, html_text_list: list) -> list:
+    """
+    Classify a batch of pages by the stage backends, returns the labels 1 / 2 / 3 (or None) in the input order.
+    Pages classified as related in stage 1 go to stage 2.
+    """
+    results = await backends[1].classify(1, html_text_list)
+    related_index = [i for i, result in enumerate(results) if result == 2]
+    if related_index:
+        stage_2_results = await backends[2].classify(2, [html_text_list[i] for i in related_index])
+        for i, result in zip(related_index, stage_2_results):
+            results[i] = result + 1 if result is not None else None
+    return results
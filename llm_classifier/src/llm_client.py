@@ -0,0 +1,403 @@
+# Shared LLM clients for the classifier stages.
+# 1. AsyncLLMClient: one pooled aiohttp session, bounded concurrency, for the large classification runs.
+# 2. SyncLLMClient: one pooled requests session, for the thread-based callers.
+# Both retry with jittered exponential backoff, follow 429 / Retry-After, and account tokens and latency.
+# 3. LLMResponseCache: persistent SQLite cache of the responses, shared by both clients.
+# Usage: python llm_client.py stats | invalidate [model] [template_hash]
+import asyncio
+import hashlib
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from configs import *
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Retry-After is either the seconds to wait or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full jitter: uniform in [0, min(max, base * 2^attempt)].
+    """
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+class LLMStats:
+    """
+    Per-call accounting of the LLM requests, shared by all the workers of one client.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latencies = []
+
+    def record(self, latency: float, usage: dict | None):
+        with self.lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            if usage:
+                self.prompt_tokens += usage.get("prompt_tokens", 0)
+                self.completion_tokens += usage.get("completion_tokens", 0)
+
+    def record_retry(self, is_rate_limited=False):
+        with self.lock:
+            self.retries += 1
+            self.rate_limited += is_rate_limited
+
+    def record_cache(self, is_hit: bool):
+        with self.lock:
+            if is_hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def summary(self) -> dict:
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cache_hits": self.cache_hits,
+                "cache_hit_rate": self.cache_hits / max(1, self.cache_hits + self.cache_misses),
+                "latency_p50": float(np.percentile(latencies, 50)),
+                "latency_p99": float(np.percentile(latencies, 99)),
+                "calls_per_second": self.calls / elapsed if elapsed > 0 else 0.0,
+                "tokens_per_second": (self.prompt_tokens + self.completion_tokens) / elapsed if elapsed > 0 else 0.0,
+            }
+
+def payload_cache_key(payload: dict) -> tuple:
+    """
+    (model, template hash, content hash) of one request.
+    The template is everything but the user messages: sampling parameters and system prompts (few-shot included).
+    """
+    messages = payload.get("messages", [])
+    template = {
+        "params": {k: v for k, v in payload.items() if k not in ("model", "messages", "stream")},
+        "system": [message["content"] for message in messages if message["role"] != "user"],
+    }
+    contents = [message["content"] for message in messages if message["role"] == "user"]
+    template_hash = hashlib.sha256(json.dumps(template, sort_keys=True).encode()).hexdigest()
+    content_hash = hashlib.sha256(json.dumps(contents).encode()).hexdigest()
+    return payload.get("model", ""), template_hash, content_hash
+
+class LLMResponseCache:
+    """
+    Persistent cache of the LLM responses keyed by (model, template hash, content hash).
+    One connection per process shared by all threads, writes are serialized by the lock.
+    The file is opened on first use, so importing the module (or forking a worker) does not create it.
+    """
+    def __init__(self, filepath=LLM_CACHE_FILE):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # A connection inherited by a forked worker must not be used, the worker opens its own
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            conn = sqlite3.connect(self.filepath, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                model TEXT NOT NULL,
+                template_hash TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, template_hash, content_hash)
+            )""")
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, payload: dict, is_valid=None) -> str | None:
+        """
+        The cached response, a response rejected by is_valid (cached by an older run) is deleted.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE model = ? AND template_hash = ? AND content_hash = ?",
+                payload_cache_key(payload),
+            ).fetchone()
+        if row is None:
+            return None
+        if is_valid is not None and not is_valid(row[0]):
+            self.delete(payload)
+            return None
+        return row[0]
+
+    def put(self, payload: dict, response: str):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (*payload_cache_key(payload), response, time.time()),
+            )
+            self.conn.commit()
+
+    def put_valid(self, payload: dict, response: str | None, is_valid=None):
+        """
+        Cache the response only if it is not None and accepted by is_valid.
+        """
+        if response is None or (is_valid is not None and not is_valid(response)):
+            return
+        self.put(payload, response)
+
+    def delete(self, payload: dict):
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM responses WHERE model = ? AND template_hash = ? AND content_hash = ?",
+                payload_cache_key(payload),
+            )
+            self.conn.commit()
+
+    def invalidate(self, model=None, template_hash=None) -> int:
+        """
+        Delete the cached responses of one model and / or one template, all of them if both are None.
+        """
+        conditions, params = [], []
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(model)
+        if template_hash is not None:
+            conditions.append("template_hash = ?")
+            params.append(template_hash)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        with self.lock:
+            deleted = self.conn.execute("DELETE FROM responses" + where, params).rowcount
+            self.conn.commit()
+        return deleted
+
+    def summary(self) -> list:
+        """
+        Number of cached responses per (model, template hash).
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT model, template_hash, COUNT(*) FROM responses GROUP BY model, template_hash ORDER BY 3 DESC"
+            ).fetchall()
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+class AsyncLLMClient:
+    """
+    Asynchronous chat completion client, used as `async with AsyncLLMClient(...) as client`.
+    A 429 pauses all the requests of this client until Retry-After has passed.
+    """
+    def __init__(self, api_url: str, headers: dict, concurrency=LLM_CONCURRENCY, timeout=LLM_TIMEOUT, max_retry=LLM_MAX_RETRY, cache=None):
+        self.api_url = api_url
+        self.headers = headers
+        self.cache = cache
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retry = max_retry
+        self.stats = LLMStats()
+        self.blocked_until = 0.0
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def chat(self, payload: dict, is_valid=None) -> str | None:
+        """
+        Send one chat completion request, return the message content or None after all retries.
+        is_valid: only the responses it accepts are cached (and served from the cache), so unparseable
+        responses are requested again on the next run.
+        The blocking SQLite calls of the cache run in a thread, off the event loop.
+        """
+        if self.cache is not None:
+            content = await asyncio.to_thread(self.cache.get, payload, is_valid)
+            self.stats.record_cache(content is not None)
+            if content is not None:
+                return content
+        content = await self._request(payload)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put_valid, payload, content, is_valid)
+        return content
+
+    async def _request(self, payload: dict) -> str | None:
+        for attempt in range(self.max_retry + 1):
+            wait_time = self.blocked_until - time.time()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            delay = None
+            is_rate_limited = False
+            async with self.semaphore:
+                start = time.perf_counter()
+                try:
+                    async with self.session.post(self.api_url, json=payload) as response:
+                        if response.status in RETRY_STATUS:
+                            is_rate_limited = response.status == 429
+                            delay = parse_retry_after(response.headers.get("Retry-After"))
+                        elif response.status >= 400:
+                            # Other client errors (bad key, bad payload) will not be fixed by retrying
+                            print(f"LLM request failed with status {response.status}")
+                            self.stats.record_failure()
+                            return None
+                        else:
+                            response_dict = await response.json(content_type=None)
+                            content = response_dict["choices"][0]["message"]["content"]
+                            self.stats.record(time.perf_counter() - start, response_dict.get("usage"))
+                            return content
+                except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError, ValueError):
+                    pass
+            if attempt == self.max_retry:
+                break
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if is_rate_limited:
+                self.blocked_until = max(self.blocked_until, time.time() + delay)
+            self.stats.record_retry(is_rate_limited)
+            await asyncio.sleep(delay)
+        self.stats.record_failure()
+        return None
+
+    async def map_unordered(self, method, items):
+        """
+        Run `await method(self, item)` for all items, yield (item, result) in the finishing order.
+        At most 2 * concurrency tasks are in flight, so the item list can be large.
+        """
+        items = iter(items)
+        is_exhausted = False
+        pending = {}
+        while True:
+            while not is_exhausted and len(pending) < 2 * self.concurrency:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    is_exhausted = True
+                    break
+                pending[asyncio.ensure_future(method(self, item))] = item
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                yield item, task.result()
+
+class SyncLLMClient:
+    """
+    Blocking counterpart of AsyncLLMClient, safe to share between threads.
+    """
+    def __init__(self, api_url: str, headers: dict, timeout=LLM_TIMEOUT, max_retry=LLM_MAX_RETRY, cache=None):
+        self.api_url = api_url
+        self.headers = headers
+        self.cache = cache
+        self.timeout = timeout
+        self.max_retry = max_retry
+        self.stats = LLMStats()
+        self.blocked_until = 0.0
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=LLM_CONCURRENCY))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=LLM_CONCURRENCY))
+
+    def chat(self, payload: dict, is_valid=None) -> str | None:
+        if self.cache is not None:
+            content = self.cache.get(payload, is_valid)
+            self.stats.record_cache(content is not None)
+            if content is not None:
+                return content
+        content = self._request(payload)
+        if self.cache is not None:
+            self.cache.put_valid(payload, content, is_valid)
+        return content
+
+    def _request(self, payload: dict) -> str | None:
+        for attempt in range(self.max_retry + 1):
+            wait_time = self.blocked_until - time.time()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            delay = None
+            is_rate_limited = False
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.api_url, json=payload, headers=self.headers, timeout=self.timeout)
+                if response.status_code in RETRY_STATUS:
+                    is_rate_limited = response.status_code == 429
+                    delay = parse_retry_after(response.headers.get("Retry-After"))
+                elif response.status_code >= 400:
+                    print(f"LLM request failed with status {response.status_code}")
+                    self.stats.record_failure()
+                    return None
+                else:
+                    response_dict = response.json()
+                    content = response_dict["choices"][0]["message"]["content"]
+                    self.stats.record(time.perf_counter() - start, response_dict.get("usage"))
+                    return content
+            except (requests.RequestException, KeyError, IndexError, ValueError):
+                pass
+            if attempt == self.max_retry:
+                break
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if is_rate_limited:
+                self.blocked_until = max(self.blocked_until, time.time() + delay)
+            self.stats.record_retry(is_rate_limited)
+            time.sleep(delay)
+        self.stats.record_failure()
+        return None
+
+if __name__ == "__main__":
+    cache = LLMResponseCache()
+    if len(sys.argv) > 1 and sys.argv[1] == "invalidate":
+        model = sys.argv[2] if len(sys.argv) > 2 else None
+        template_hash = sys.argv[3] if len(sys.argv) > 3 else None
+        print(f"{cache.invalidate(model, template_hash)} cached responses deleted.")
+    else:
+        for model, template_hash, count in cache.summary():
+            print(f"{model}\t{template_hash}\t{count}")
+    cache.close()
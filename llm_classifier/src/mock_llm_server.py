@@ -0,0 +1,130 @@
+# Local stand-in of the OpenAI-compatible chat completion API, for benchmarking without network or spend.
+# 1. Latency of every request is sampled from a fixed / uniform / lognormal distribution.
+# 2. 429 (with Retry-After) and 500 responses are injected with the given rates.
+# 3. Responses are replayed from the LLM response cache when the request was recorded before,
+#    otherwise a deterministic synthetic answer in the format expected by the prompt is returned.
+# Usage: python mock_llm_server.py --port 8000 --latency lognormal --latency-median 0.8 --rate-429 0.02
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sqlite3
+import time
+
+import numpy as np
+import regex as re
+from aiohttp import web
+
+from configs import *
+from llm_client import payload_cache_key
+
+PTN_BATCH_PAGE = re.compile(r"^### Page (\d+)$", re.MULTILINE)
+
+class MockLLMServer:
+    def __init__(self, args):
+        self.args = args
+        self.replay_conn = None
+        if args.replay and os.path.exists(args.replay):
+            self.replay_conn = sqlite3.connect(args.replay, check_same_thread=False)
+        self.stats = {"requests": 0, "replayed": 0, "synthetic": 0, "injected_429": 0, "injected_500": 0}
+
+    def sample_latency(self) -> float:
+        if self.args.latency == "fixed":
+            return self.args.latency_median
+        if self.args.latency == "uniform":
+            return random.uniform(0, 2 * self.args.latency_median)
+        # Lognormal with the given median, sigma controls the tail
+        return float(np.random.lognormal(np.log(self.args.latency_median), self.args.latency_sigma))
+
+    def replay(self, payload: dict) -> str | None:
+        if self.replay_conn is None:
+            return None
+        row = self.replay_conn.execute(
+            "SELECT response FROM responses WHERE model = ? AND template_hash = ? AND content_hash = ?",
+            payload_cache_key(payload),
+        ).fetchone()
+        return row[0] if row else None
+
+    def synthetic_answer(self, payload: dict) -> str:
+        """
+        Deterministic answer by the hash of the user content, in the format the prompt asks for.
+        """
+        messages = payload.get("messages", [])
+        system_text = " ".join(message["content"] for message in messages if message["role"] != "user")
+        user_text = " ".join(message["content"] for message in messages if message["role"] == "user")
+        seed = int.from_bytes(hashlib.md5(user_text.encode()).digest()[:4], "big")
+        rng = random.Random(seed)
+        if "index-value" in system_text + user_text or "Output Format:" in system_text:
+            return "\n".join(f"{i}-{rng.randint(0, 1)}" for i in range(1, 5))
+        page_indexes = PTN_BATCH_PAGE.findall(user_text)
+        if page_indexes:
+            return "\n".join(f"{index}: {rng.choice((1, 2))}" for index in page_indexes)
+        return str(rng.choice((1, 2)))
+
+    async def handle_chat(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        payload = await request.json()
+        await asyncio.sleep(self.sample_latency())
+        dice = random.random()
+        if dice < self.args.rate_429:
+            self.stats["injected_429"] += 1
+            return web.json_response(
+                {"error": {"message": "rate limited", "type": "rate_limit"}},
+                status=429,
+                headers={"Retry-After": str(self.args.retry_after)},
+            )
+        if dice < self.args.rate_429 + self.args.error_rate:
+            self.stats["injected_500"] += 1
+            return web.json_response({"error": {"message": "injected error"}}, status=500)
+
+        content = self.replay(payload)
+        if content is None:
+            content = self.synthetic_answer(payload)
+            self.stats["synthetic"] += 1
+        else:
+            self.stats["replayed"] += 1
+        prompt_chars = sum(len(message["content"]) for message in payload.get("messages", []))
+        return web.json_response({
+            "id": f"mock-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_chars // CHARS_PER_TOKEN + 1,
+                "completion_tokens": len(content) // CHARS_PER_TOKEN + 1,
+                "total_tokens": (prompt_chars + len(content)) // CHARS_PER_TOKEN + 2,
+            },
+        })
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+def build_app(args) -> web.Application:
+    server = MockLLMServer(args)
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", server.handle_chat)
+    app.router.add_get("/stats", server.handle_stats)
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completion server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--latency-median", type=float, default=0.8, help="Seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Sigma of the lognormal latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Ratio of the requests answered by 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of the injected 429, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Ratio of the requests answered by 500")
+    parser.add_argument("--replay", default=LLM_CACHE_FILE, help="LLM response cache to replay, ignored if missing")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    web.run_app(build_app(args), host=args.host, port=args.port)
@@ -0,0 +1,157 @@
+# Local pre-classifier in front of the LLM, trained by the LLM labels in the result store.
+# 1. Hashed word n-gram features + logistic regression over the 3 classes of the LLM (1 unrelated, 2 related, 3 LG).
+# 2. Per-class probability thresholds are calibrated on the held-out split to reach PRE_CLS_TARGET_PRECISION.
+# 3. Pages above the threshold of one class are labelled locally, only the uncertain ones go to the LLM.
+# Usage: python pre_classifier.py  (train, calibrate, report and save the model)
+import pickle as pkl
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+
+from configs import *
+from result_store import open_result_store
+
+# LLM calls spent on one page by prompted_binary_classification, the second call only for related pages
+LLM_CALLS_PER_LABEL = {1: 1, 2: 2, 3: 2}
+
+class PreClassifier:
+    def __init__(self):
+        self.vectorizer = HashingVectorizer(
+            n_features=PRE_CLS_NUM_FEATURES,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm="l2",
+        )
+        self.model = LogisticRegression(max_iter=1000, C=PRE_CLS_C, class_weight="balanced")
+        # No page is routed locally before calibration
+        self.thresholds = {1: 1.01, 2: 1.01, 3: 1.01}
+
+    def fit(self, texts: list, labels: np.ndarray):
+        self.model.fit(self.vectorizer.transform(texts), labels)
+        return self
+
+    def predict_proba(self, texts: list) -> np.ndarray:
+        return self.model.predict_proba(self.vectorizer.transform(texts))
+
+    def calibrate(self, texts: list, labels: np.ndarray):
+        """
+        For each class, the lowest threshold whose local decisions reach the target precision on held-out data.
+        """
+        proba = self.predict_proba(texts)
+        for col, label in enumerate(self.model.classes_):
+            order = np.argsort(-proba[:, col])
+            sorted_proba = proba[order, col]
+            is_correct = labels[order] == label
+            # Precision of routing the top-k pages to this class, for every k
+            precision = np.cumsum(is_correct) / np.arange(1, len(order) + 1)
+            valid = np.nonzero((precision >= PRE_CLS_TARGET_PRECISION) & (np.arange(1, len(order) + 1) >= PRE_CLS_MIN_SUPPORT))[0]
+            if len(valid) == 0:
+                self.thresholds[int(label)] = 1.01
+            else:
+                self.thresholds[int(label)] = max(float(sorted_proba[valid[-1]]), PRE_CLS_MIN_THRESHOLD)
+        return self.thresholds
+
+    def route(self, texts: list) -> list:
+        """
+        The local label of each page, None if the page should be sent to the LLM.
+        """
+        if len(texts) == 0:
+            return []
+        proba = self.predict_proba(texts)
+        best_col = proba.argmax(axis=1)
+        best_proba = proba[np.arange(len(texts)), best_col]
+        labels = self.model.classes_[best_col]
+        thresholds = np.array([self.thresholds[int(label)] for label in labels])
+        return [int(label) if is_routed else None for label, is_routed in zip(labels, best_proba >= thresholds)]
+
+    def save(self, filepath: str):
+        # Plain state only, a pickled instance would refer to __main__.PreClassifier when trained as a script
+        state = {
+            "vectorizer": self.vectorizer.get_params(),
+            "model": self.model,
+            "thresholds": self.thresholds,
+        }
+        with open(filepath, "wb") as f:
+            pkl.dump(state, f)
+
+    @classmethod
+    def load(cls, filepath: str):
+        with open(filepath, "rb") as f:
+            state = pkl.load(f)
+        pre_classifier = cls()
+        pre_classifier.vectorizer.set_params(**state["vectorizer"])
+        pre_classifier.model = state["model"]
+        pre_classifier.thresholds = state["thresholds"]
+        return pre_classifier
+
+def pre_classify_dataset(dataset: list, text_index=0):
+    """
+    Split the dataset into the locally labelled [(label, data)] and the remaining samples for the LLM.
+    Everything goes to the LLM if the pre-classifier is disabled or not trained yet.
+    """
+    model_path = os.path.join(OUTPUT_DIR, PRE_CLS_MODEL_FILE)
+    if not PRE_CLS_ENABLED or not os.path.exists(model_path):
+        return [], dataset
+    pre_classifier = PreClassifier.load(model_path)
+    labels = pre_classifier.route([data[text_index] for data in dataset])
+    routed = [(label, data) for label, data in zip(labels, dataset) if label is not None]
+    remaining = [data for label, data in zip(labels, dataset) if label is None]
+    print(f"Pre-classifier: {len(routed)} pages labelled locally, {len(remaining)} pages sent to the LLM.")
+    return routed, remaining
+
+def load_labelled_texts():
+    """
+    The LLM labels of the classified pages, with the same text as the LLM input.
+    Labels given by the pre-classifier itself are not used for training.
+    """
+    res_df = open_result_store().load()
+    res_df = res_df[res_df["source"] != "pre_classifier"]
+    texts, labels = [], []
+    for url, filename, result in zip(res_df["url"], res_df["filename"], res_df["label"]):
+        try:
+            with open(os.path.join(PROCS_DIR, filename), "r", encoding="utf-8") as f:
+                texts.append(f"{url}: {f.read()}")
+        except FileNotFoundError:
+            continue
+        labels.append(int(result))
+    return texts, np.array(labels)
+
+def report(pre_classifier: PreClassifier, texts: list, labels: np.ndarray) -> dict:
+    """
+    LLM calls saved and accuracy change on held-out data, taking the LLM labels as the reference.
+    """
+    routed = pre_classifier.route(texts)
+    is_routed = np.array([label is not None for label in routed])
+    routed_labels = np.array([label if label is not None else 0 for label in routed])
+    total_calls = sum(LLM_CALLS_PER_LABEL[int(label)] for label in labels)
+    saved_calls = sum(LLM_CALLS_PER_LABEL[int(label)] for label in labels[is_routed])
+    num_wrong = int((routed_labels[is_routed] != labels[is_routed]).sum())
+    result = {
+        "held_out_pages": len(labels),
+        "routed_pages": int(is_routed.sum()),
+        "routed_by_class": {int(c): int((routed_labels == c).sum()) for c in pre_classifier.model.classes_},
+        "llm_calls_saved": saved_calls,
+        "llm_calls_saved_ratio": saved_calls / max(1, total_calls),
+        "routed_accuracy": 1 - num_wrong / max(1, int(is_routed.sum())),
+        # Overall agreement with the LLM labels drops by exactly the wrongly routed pages
+        "accuracy_change": -num_wrong / max(1, len(labels)),
+        "thresholds": pre_classifier.thresholds,
+    }
+    return result
+
+if __name__ == "__main__":
+    texts, labels = load_labelled_texts()
+    print(f"{len(texts)} labelled pages, class count: {dict(zip(*np.unique(labels, return_counts=True)))}")
+    train_texts, test_texts, train_labels, test_labels = train_test_split(
+        texts, labels, test_size=PRE_CLS_HELD_OUT, stratify=labels, random_state=0
+    )
+    pre_classifier = PreClassifier().fit(train_texts, train_labels)
+    # Calibrate on one half of the held-out split, report on the other half
+    calib_texts, eval_texts, calib_labels, eval_labels = train_test_split(
+        test_texts, test_labels, test_size=0.5, stratify=test_labels, random_state=0
+    )
+    print("Calibrated thresholds: ", pre_classifier.calibrate(calib_texts, calib_labels))
+    for key, value in report(pre_classifier, eval_texts, eval_labels).items():
+        print(f"{key}: {value}")
+    pre_classifier.save(os.path.join(OUTPUT_DIR, PRE_CLS_MODEL_FILE))
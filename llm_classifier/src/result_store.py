@@ -0,0 +1,211 @@
+# Append-only store of the classification results, replacing tmp_logs.txt and classification_result.pkl.
+# 1. One JSON line per classified page with typed fields, see RESULT_FIELDS.
+# 2. Lines are flushed and fsynced every RESULT_FSYNC_EVERY records, a torn last line (crash in the middle
+#    of a write) is skipped when reading and cut off before the next append.
+# 3. Restart only needs the set of finished URLs; the related / verified splits are boolean masks on one DataFrame.
+# 4. The deduplicated records are snapshotted with the byte offset they cover, later loads only parse the new lines.
+# Usage: python result_store.py  (summary of the stored results by label, source and model)
+import json
+import pickle as pkl
+import shutil
+import time
+import pandas as pd
+
+from configs import *
+
+# Field name -> type, every record is coerced to these types before being written
+RESULT_FIELDS = {
+    "url": str,
+    "filename": str,
+    "label": int,  # 1 unrelated, 2 LG related, 3 direct LG service
+    "source": str,  # llm / pre_classifier / legacy
+    "model": str,  # Backends of the two stages, e.g. remote:<model>+encoder:<path>
+    "prompt_version": str,  # Hash of the classification prompts
+    "latency": float,  # Seconds of the request (batch) the page was classified in
+    "prompt_tokens": int,  # Estimated input tokens of the page
+    "created_at": float,
+}
+
+class ResultStore:
+    def __init__(self, filepath=os.path.join(OUTPUT_DIR, RESULT_STORE_FILE), fsync_every=RESULT_FSYNC_EVERY):
+        self.filepath = filepath
+        # Deduplicated records and the byte offset they cover, so a run only parses the new records
+        self.snapshot_path = filepath + ".snapshot.pkl"
+        self.fsync_every = fsync_every
+        self.file = None
+        self.num_pending = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        self._truncate_torn_tail()
+        self.file = open(self.filepath, "a", encoding="utf-8")
+        return self
+
+    def _truncate_torn_tail(self):
+        """
+        Cut the last line if it has no newline, so the next record does not continue a broken one.
+        """
+        if not os.path.exists(self.filepath):
+            return
+        with open(self.filepath, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Search backward for the end of the last complete line
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                newline = f.read(step).rfind(b"\n")
+                if newline >= 0:
+                    pos = pos - step + newline + 1
+                    break
+                pos -= step
+            f.truncate(pos)
+            print(f"Result store: dropped a torn record of {size - pos} bytes.")
+
+    def append(self, record: dict):
+        record = {field: cast(record[field]) if record.get(field) is not None else None for field, cast in RESULT_FIELDS.items()}
+        if record["created_at"] is None:
+            record["created_at"] = time.time()
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.num_pending += 1
+        if self.num_pending >= self.fsync_every:
+            self.flush()
+
+    def flush(self):
+        if self.file is None or self.num_pending == 0:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.num_pending = 0
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def iter_records(self, offset=0):
+        """
+        Yield (record, end offset) of the complete records after the byte offset, torn or broken lines are skipped.
+        Keep the last offset to read only the new results next time.
+        """
+        if not os.path.exists(self.filepath):
+            return
+        with open(self.filepath, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                offset += len(line)
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    yield json.loads(line), offset
+                except json.JSONDecodeError:
+                    continue
+
+    def _load_snapshot(self):
+        """
+        The deduplicated records up to the saved offset, empty if missing or stale (store truncated or replaced).
+        """
+        empty = pd.DataFrame(columns=list(RESULT_FIELDS)), 0
+        if not os.path.exists(self.snapshot_path) or not os.path.exists(self.filepath):
+            return empty
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = pkl.load(f)
+        except Exception:
+            return empty
+        if snapshot["offset"] > os.path.getsize(self.filepath) or snapshot["head"] != self._head():
+            return empty
+        return snapshot["df"], snapshot["offset"]
+
+    def _head(self) -> bytes:
+        # The first record identifies the store, a replaced store invalidates the snapshot
+        with open(self.filepath, "rb") as f:
+            return f.readline()
+
+    def _save_snapshot(self, res_df: pd.DataFrame, offset: int):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pkl.dump({"offset": offset, "head": self._head(), "df": res_df}, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def finished_urls(self) -> set:
+        return set(self.load()["url"])
+
+    def load(self) -> pd.DataFrame:
+        """
+        The stored results as a typed DataFrame, the last record of an URL wins.
+        Only the records after the offset of the snapshot are parsed, then the snapshot is updated.
+        """
+        res_df, offset = self._load_snapshot()
+        new_records, new_offset = [], offset
+        for record, end_offset in self.iter_records(offset):
+            new_records.append(record)
+            new_offset = end_offset
+        if new_records:
+            res_df = pd.concat([res_df, pd.DataFrame(new_records, columns=list(RESULT_FIELDS))], ignore_index=True)
+            res_df = res_df.drop_duplicates(subset=["url"], keep="last").reset_index(drop=True)
+            self._save_snapshot(res_df, new_offset)
+        return res_df.astype({"label": "int64", "latency": "float64", "prompt_tokens": "Int64", "created_at": "float64"})
+
+    def import_tmp_logs(self, log_path: str) -> int:
+        """
+        One-off import of the old tmp_logs.txt (url, filename, label per line) into an empty store.
+        """
+        if not os.path.exists(log_path) or (os.path.exists(self.filepath) and os.path.getsize(self.filepath) > 0):
+            return 0
+        count = 0
+        with open(log_path, "r") as f, self:
+            for line in f:
+                parts = line.strip().split("\t")
+                if len(parts) != 3 or not parts[2].isdigit():
+                    continue
+                url, filename, label = parts
+                self.append({"url": url, "filename": os.path.basename(filename), "label": label, "source": "legacy"})
+                count += 1
+        print(f"Result store: imported {count} results from {log_path}.")
+        return count
+
+def open_result_store() -> ResultStore:
+    """
+    The result store of the classifier, filled from the legacy tmp_logs.txt on the first run.
+    """
+    store = ResultStore()
+    store.import_tmp_logs(os.path.join(OUTPUT_DIR, "tmp_logs.txt"))
+    return store
+
+def pages_of_label(res_df: pd.DataFrame, label: int) -> list:
+    selected = res_df.loc[res_df["label"].to_numpy() == label, ["url", "filename"]]
+    return selected.to_dict("records")
+
+def copy_pages(page_list: list, dst_dir: str):
+    """
+    Copy the downloaded pages to dst_dir, missing pages are skipped.
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    for page_info in page_list:
+        try:
+            shutil.copy(os.path.join(SAVE_DIR, page_info["filename"]), os.path.join(dst_dir, page_info["filename"]))
+        except OSError:
+            pass
+
+if __name__ == "__main__":
+    res_df = open_result_store().load()
+    print(f"{len(res_df)} classified pages.")
+    print(res_df.groupby(["source", "label"]).size().to_string())
+    print(res_df.groupby(["model", "prompt_version"]).agg(
+        pages=("url", "size"),
+        latency_mean=("latency", "mean"),
+        prompt_tokens=("prompt_tokens", "sum"),
+    ).to_string())
@@ -1,6 +1,8 @@
 import random
 import ssl
 import time
+import json
+import hashlib
 from bs4 import BeautifulSoup
 import regex as re
 import warnings
@@ -8,8 +10,13 @@ import html2text
 import requests
 import zstandard as zstd
 import io
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 
 from configs import *
+from llm_client import AsyncLLMClient, SyncLLMClient, LLMResponseCache
 
 requests.packages.urllib3.disable_warnings() # type: ignore
 context = ssl.create_default_context()
@@ -17,13 +24,13 @@ context.set_ciphers('HIGH:!DH:!aNULL')
 
 
 API_HEADER = {
-    "Authorization": "Bearer <Your API Key>",
+    "Authorization": f"Bearer {LLM_API_KEY}",
     "Content-Type": "application/json"
 }
 
-API_URL = "https://api.siliconflow.cn/v1/chat/completions"
+API_URL = LLM_API_URL
 BASE_PROMPT = {
-    "model": "Pro/deepseek-ai/DeepSeek-V3",
+    "model": LLM_MODEL,
     "stream": False,
     "max_tokens": 256,
     "temperature": 0.5,
@@ -33,6 +40,8 @@ BASE_PROMPT = {
     "n": 1,
     "messages": []
 }
+LLM_CACHE = LLMResponseCache() if LLM_CACHE_ENABLED else None
+LLM_CLIENT = SyncLLMClient(API_URL, API_HEADER, cache=LLM_CACHE)
 
 class CustomHTMLParser(html2text.HTML2Text):
     """
@@ -63,11 +72,7 @@ def contain_filter_words(contents: str) -> bool:
     """
     Check if the webpage contains any filter words.
     """
-    text_lower = contents.lower()
-    for word in SIMPLE_FILETER_WORDS:
-        if word.lower() in text_lower:
-            return True
-    return False
+    return PTN_FILTER_WORDS.search(contents) is not None
 
 def parse_webpages(webpage) -> BeautifulSoup:
     """
@@ -90,7 +95,10 @@ def is_symbols(token):
         return True
     return False
 
-def collect_text_in_order(html_str):
+def collect_text_in_order_legacy(html_str):
+    """
+    BeautifulSoup + html2text version of collect_text_in_order, kept for benchmark and comparison.
+    """
     if len(html_str) > 500000:
         return None
     # Part one: Extract text in input / meta, change them into direct text
@@ -147,97 +155,295 @@ def collect_text_in_order(html_str):
             text = text.replace(f"[{match[0]}]({match[1]})", match[0])
     return text.strip()
 
+# For single-pass conversion of the webpage into the text for LLM.
+TEXT_SKIP_TAGS = {"script", "style", "head", "template", "svg"}
+TEXT_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "body", "br", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "header", "hr", "html", "legend", "main", "nav",
+    "option", "p", "pre", "section", "select", "table", "tbody", "td", "textarea", "tfoot", "th",
+    "thead", "tr", "ul", "ol", "li", "h1", "h2", "h3", "h4", "h5", "h6",
+}
+TEXT_HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+TEXT_META_NAMES = ("hyperglass", "title", "description")
+
+class LLMTextExtractor(HTMLParser):
+    """
+    Single-pass replacement of the BeautifulSoup + html2text conversion in collect_text_in_order_legacy.
+    Keeps the same conventions: [Meta]:{name}:{content} in front, [Input]:{text} in place,
+    headings as "# ", list items as "* " or "1. ", and [text](link) only if the text contains filter words.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self.line = []
+        self.meta_text = []
+        self.skip_stack = []
+        self.list_stack = []
+        # Each open link is [href, list of text], nested links are flattened into the outer one
+        self.link_stack = []
+        self.pre_depth = 0
+
+    def _append(self, text: str):
+        if self.link_stack:
+            self.link_stack[-1][1].append(text)
+        else:
+            self.line.append(text)
+
+    def _break_line(self):
+        if self.link_stack:
+            self.link_stack[-1][1].append(" ")
+            return
+        if self.line:
+            self.lines.append("".join(self.line))
+            self.line = []
+
+    def _close_link(self):
+        href, texts = self.link_stack.pop()
+        text = re.sub(r"\s+", " ", "".join(texts)).strip()
+        if not text:
+            return
+        if href and not href.startswith("#") and contain_filter_words(text):
+            self._append(f"[{text}]({href})")
+        else:
+            self._append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            name, content = attrs.get("name"), attrs.get("content")
+            if name and content is not None and any(word in name for word in TEXT_META_NAMES):
+                self.meta_text.append(f"[Meta]:{name}:{content}")
+            return
+        if tag == "body" and "head" in self.skip_stack:
+            # The head is not closed explicitly
+            self.skip_stack = [t for t in self.skip_stack if t != "head"]
+        if tag in TEXT_SKIP_TAGS:
+            self.skip_stack.append(tag)
+            return
+        if self.skip_stack:
+            return
+        if tag == "input":
+            attrs = dict(attrs)
+            text = attrs.get("placeholder") or attrs.get("value")
+            if text:
+                self._append(f" [Input]:{text} ")
+            return
+        if tag == "a":
+            self.link_stack.append([dict(attrs).get("href"), []])
+            return
+        if tag in TEXT_BLOCK_TAGS:
+            self._break_line()
+        if tag in ("ul", "ol"):
+            self.list_stack.append(0 if tag == "ol" else None)
+        elif tag == "li":
+            if self.list_stack and self.list_stack[-1] is not None:
+                self.list_stack[-1] += 1
+                self._append(f"{self.list_stack[-1]}. ")
+            else:
+                self._append("* ")
+        elif tag in TEXT_HEADING_TAGS:
+            self._append("#" * TEXT_HEADING_TAGS[tag] + " ")
+        elif tag in ("td", "th"):
+            self._append(" ")
+        elif tag == "pre":
+            self.pre_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # A self-closing tag is already closed, a skipped one (e.g. <script src=.../>) hides nothing
+        if tag in TEXT_SKIP_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag in ("a", "ul", "ol", "pre") and not self.skip_stack:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in TEXT_SKIP_TAGS:
+            if tag in self.skip_stack:
+                while self.skip_stack.pop() != tag:
+                    pass
+            return
+        if self.skip_stack:
+            return
+        if tag == "a":
+            if self.link_stack:
+                self._close_link()
+            return
+        if tag in ("ul", "ol") and self.list_stack:
+            self.list_stack.pop()
+        elif tag == "pre" and self.pre_depth > 0:
+            self.pre_depth -= 1
+        if tag in TEXT_BLOCK_TAGS:
+            self._break_line()
+
+    def handle_data(self, data):
+        if self.skip_stack:
+            return
+        if self.pre_depth > 0 and not self.link_stack:
+            # Keep the lines of preformatted text
+            parts = data.split("\n")
+            for i, part in enumerate(parts):
+                if i > 0:
+                    self._break_line()
+                self._append(part)
+            return
+        self._append(data)
+
+    def close(self):
+        super().close()
+        while self.link_stack:
+            self._close_link()
+        self._break_line()
+
+    def get_text(self) -> str:
+        # Remove empty lines and lines too long
+        filtered_lines = []
+        for line in self.lines:
+            line = re.sub(r"\s+", " ", line).strip()
+            if len(line) > 0 and len(line) < TEXT_LEN_MAX_THRESHOLD:
+                filtered_lines.append(line)
+        text = " ".join(self.meta_text) + " " + " ".join(filtered_lines)
+        return re.sub(r"\s+", " ", text).strip()
+
+def collect_text_in_order(html_str):
+    """
+    Convert the webpage into the text for LLM in one pass, no limit on the page size.
+    """
+    extractor = LLMTextExtractor()
+    try:
+        extractor.feed(html_str)
+        extractor.close()
+    except Exception as e:
+        print(f"Error parsing webpage: {e}")
+        return None
+    return extractor.get_text()
+
+# For token-aware context extraction, whitespace-separated tokens with the estimated token cost.
+PTN_TOKEN = re.compile(r"\S+")
+PTN_HIGH_SIGNAL = re.compile(r"\[(?:Input|Meta)\]:")
+
+def _tokenize_for_context(text: str):
+    """
+    Tokenize once: token char spans, estimated cost, keyword hits and high-signal markers per token.
+    """
+    spans = np.array([match.span() for match in PTN_TOKEN.finditer(text)], dtype=np.int64).reshape(-1, 2)
+    costs = (spans[:, 1] - spans[:, 0] + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    keyword_pos = np.array([match.start() for match in PTN_KEYWORD.finditer(text)], dtype=np.int64)
+    signal_pos = np.array([match.start() for match in PTN_HIGH_SIGNAL.finditer(text)], dtype=np.int64)
+    # Char position -> index of the token containing it
+    keyword_token = np.searchsorted(spans[:, 0], keyword_pos, side="right") - 1
+    signal_token = np.searchsorted(spans[:, 0], signal_pos, side="right") - 1
+    return spans, costs, keyword_token, signal_token
+
+def extract_context_batch(contents: list, token_budget=CONTEXT_TOKEN_BUDGET) -> list:
+    """
+    Token-aware version of the keyword context extraction, over a batch of pages at once.
+    1. The pages are joined by newlines and tokenized in one pass, the tokens, windows and scores of all pages
+       are computed on the joined arrays, with the windows clipped to the tokens of their page.
+    2. Every keyword hit or [Input]/[Meta] marker opens a window of CONTEXT_WINDOW_TOKENS tokens on both sides,
+       scored by keyword hits plus CONTEXT_SIGNAL_WEIGHT per [Input]/[Meta] marker inside.
+    3. Per page, the best windows are kept until the token budget, each charged only for the tokens not
+       covered by the windows already kept, then merged in document order. This greedy pick depends on the
+       windows kept before, so it is the only step walking the windows one by one.
+    Pages without keywords get None, pages within the budget are kept as a whole.
+    """
+    contents = [content or "" for content in contents]
+    results = [None] * len(contents)
+    if len(contents) == 0:
+        return results
+    # A newline never belongs to a token or a keyword, so nothing spans two pages
+    text = "\n".join(contents)
+    doc_offsets = np.cumsum([0] + [len(content) + 1 for content in contents[:-1]])
+    spans, costs, keyword_token, signal_token = _tokenize_for_context(text)
+    num_tokens = len(spans)
+    token_doc = np.searchsorted(doc_offsets, spans[:, 0], side="right") - 1
+    # Tokens of page i are [doc_lo[i], doc_hi[i])
+    doc_lo = np.searchsorted(token_doc, np.arange(len(contents)), side="left")
+    doc_hi = np.searchsorted(token_doc, np.arange(len(contents)), side="right")
+    doc_keywords = np.bincount(token_doc[keyword_token], minlength=len(contents))
+    doc_costs = np.bincount(token_doc, weights=costs, minlength=len(contents))
+    for doc_id in np.flatnonzero((doc_keywords > 0) & (doc_costs <= token_budget)).tolist():
+        results[doc_id] = contents[doc_id]
+
+    cum_keyword = np.concatenate(([0], np.cumsum(np.bincount(keyword_token, minlength=num_tokens))))
+    cum_signal = np.concatenate(([0], np.cumsum(np.bincount(signal_token, minlength=num_tokens))))
+    # [Input]/[Meta] markers open windows as well, even without keywords around
+    centers = np.unique(np.concatenate((keyword_token, signal_token)))
+    center_doc = token_doc[centers]
+    is_long = (doc_keywords > 0) & (doc_costs > token_budget)
+    centers, center_doc = centers[is_long[center_doc]], center_doc[is_long[center_doc]]
+    starts = np.maximum(centers - CONTEXT_WINDOW_TOKENS, doc_lo[center_doc])
+    ends = np.minimum(centers + CONTEXT_WINDOW_TOKENS + 1, doc_hi[center_doc])
+    scores = (cum_keyword[ends] - cum_keyword[starts]) + CONTEXT_SIGNAL_WEIGHT * (cum_signal[ends] - cum_signal[starts])
+
+    # Per page, best windows first, earlier window first on ties; the best window of a page is always kept
+    order = np.lexsort((starts, -scores, center_doc))
+    covered = np.zeros(num_tokens, dtype=bool)
+    used = np.zeros(len(contents), dtype=np.int64)
+    is_full = np.zeros(len(contents), dtype=bool)
+    for doc_id, start, end in zip(center_doc[order].tolist(), starts[order].tolist(), ends[order].tolist()):
+        if is_full[doc_id]:
+            continue
+        marginal = int(costs[start:end][~covered[start:end]].sum())
+        if used[doc_id] > 0 and used[doc_id] + marginal > token_budget:
+            continue
+        covered[start:end] = True
+        used[doc_id] += marginal
+        is_full[doc_id] = used[doc_id] >= token_budget
+
+    # Merge the kept windows in document order: the runs of covered tokens, cut at the page boundaries
+    is_page_start = np.zeros(num_tokens, dtype=bool)
+    is_page_start[doc_lo[doc_lo < doc_hi]] = True
+    joins_prev = np.concatenate(([False], covered[:-1])) & ~is_page_start
+    joins_next = np.concatenate((covered[1:] & ~is_page_start[1:], [False]))
+    run_firsts = np.flatnonzero(covered & ~joins_prev)
+    run_lasts = np.flatnonzero(covered & ~joins_next)
+    contexts = {}
+    for first, last in zip(run_firsts.tolist(), run_lasts.tolist()):
+        contexts.setdefault(int(token_doc[first]), []).append(text[spans[first, 0]:spans[last, 1]])
+    for doc_id, context in contexts.items():
+        results[doc_id] = " ".join(context)
+    return results
+
 def extract_context_around_keywords(content: str) -> str | None:
     """
     If the web page content length is too long, we need to extract the context between the keywords.
     """
-    match_strs = re.finditer(PTN_KEYWORD, content)
-    list_match_pos = []
-    for match_str in match_strs:
-        list_match_pos.append(match_str.start())
-    # If no match, return None
-    if len(list_match_pos) == 0:
+    return extract_context_batch([content])[0]
+
+CLASSIFY_PROMPT_1 = "Categorize webpage content: 1. Unrelated; 2. Looking Glass-related (links to LG or similar network tools). Example A: ```Innovative Technological Solutions ### Network Tools * Network Status * Looking Glass * DNS Lookup * IP Lookup * WhoIs``` contains word Looking Glass, but no related links -> classify as 1. Example B: ```Welcome to the webserver of RLP-NET. The only public service offered so far on this server is a [traceroute](/cgi-bin/tracer.cgi) server.``` contains link to traceroute server -> classify as 2. Output 1 or 2 only."
+CLASSIFY_PROMPT_2 = """Categorize webpage content: 1. Looking Glass related (link to LG or similar webpages) but no direct service; 2. Direct LG service. If it allows commands (traceroute, ping, etc.), selection of parameters (addresses, etc.), it should be class 2. If it is a whois or network information page or only provide links to LG or similar services, it should be class 1. The input starts with its url, and hyperlinks are presented as `[text](link)`.
+        Example A: ```[Ping Testi](https://atlantisnet.com.tr/internet-ping-testi/) *  ##### Yardım * [ Atlantis Looking Glass ](https://lg.atlantisnet.com.tr/)``` All commands are links to other pages but no direct service -> class 1; 
+        Example B: ```The only public service offered so far on this server is a [traceroute](/cgi-bin/tracer.cgi) server.``` contains command keywords but only links -> class 1; 
+        Example C: ```[Meta]:og:title:INS BGP looking glass [Meta]:description:International Network Services Network Looking Glass [Meta]:hyperglass * ## FRA Marseille, MRS1 FM * ## ZAF Durban, DMO ZD``` contains `hyperglass` from template LG webpage. -> class 2.
+        Example D: ```www.ip2location.com:...``` or ``` www.peeringdb.com: ...``` are likely information pages -> class 1.
+        Output 1 or 2 only."""
+
+def parse_label(content: str | None) -> int | None:
+    """
+    Find the first number in the response.
+    """
+    if content is None:
         return None
-    # 3000 characters, usually less than 1000 words.
-    if len(content) > 2000:
-        # If there are more than 10 keywords, we only keep the last 10 keywords
-        if len(list_match_pos) > 10:
-            list_match_pos = list_match_pos[-10:]
-        # Find every keyword index in the whole text
-        slice_len = 200
-        list_slices = [(max(0, i - slice_len), min(i + slice_len, len(content))) for i in list_match_pos]
-        # For each slice, expand to both sides to find one blank space
-        for i in range(len(list_slices)):
-            start, end = list_slices[i]
-            # Expand to the left
-            while start > 0 and content[start - 1] != " ":
-                start -= 1
-            # Expand to the right
-            while end < len(content) and content[end] != " ":
-                end += 1
-            list_slices[i] = (start, end)
-        merged_slices = []
-        for start, end in list_slices:
-            # If the merged_slices is empty, add the first slice
-            if merged_slices and merged_slices[-1][1] >= start:
-                merged_slices[-1][1] = max(merged_slices[-1][1], end)
-            else:
-                merged_slices.append([start, end])
+    res = re.search(r"\d+", content)
+    if res:
+        return int(res.group())
+    return None
 
-        # Extract the content around the keywords
-        context_list = []
-        for start, end in merged_slices:
-            context_list.append(content[start:end])
-        content = " ".join(context_list)
-    return content
+def is_valid_label(content: str) -> bool:
+    return parse_label(content) is not None
 
 def request_llm_and_get_response(payload):
     """
     Request the LLM and get the response.
     """
-    retry_count = 0
-    res = None
-    while res is None:
-        try:
-            response = requests.request("POST", API_URL, json=payload, headers=API_HEADER)
-            response_dict = response.json()
-            content = response_dict["choices"][0]["message"]["content"]
-            # find the first number in the result
-            res = re.search(r"\d+", content)
-        except Exception as e:
-            res = None
-            retry_count += 1
-            time.sleep(retry_count)
-            if retry_count > 5:
-                break
-    if res:
-        pred = int(res.group())
-    else:
-        pred = None
-    return pred
+    return parse_label(LLM_CLIENT.chat(payload, is_valid_label))
 
-def prompted_binary_classification(html_text):
+def build_classification_payload(stage: int, html_text: str) -> dict:
     """
-    通过提示模型进行两次二分类
+    Stage 1: unrelated (1) or LG related (2); stage 2: LG related (1) or direct LG service (2).
     """
-    new_base_prompt_1 = {
-        "model": "Pro/deepseek-ai/DeepSeek-V3",
-        "stream": False,
-        "max_tokens": 256,
-        "temperature": 0.5,
-        "top_p": 0.7,
-        "top_k": 50,
-        "frequency_penalty": 0.5,
-        "n": 1,
-        "messages": []
-    }
-    new_base_prompt_1["messages"].append({
-        "content": "Categorize webpage content: 1. Unrelated; 2. Looking Glass-related (links to LG or similar network tools). Example A: ```Innovative Technological Solutions ### Network Tools * Network Status * Looking Glass * DNS Lookup * IP Lookup * WhoIs``` contains word Looking Glass, but no related links -> classify as 1. Example B: ```Welcome to the webserver of RLP-NET. The only public service offered so far on this server is a [traceroute](/cgi-bin/tracer.cgi) server.``` contains link to traceroute server -> classify as 2. Output 1 or 2 only.",
-        "role": "system"
-    })
-    
-    new_base_prompt_2 = {
-        "model": "Pro/deepseek-ai/DeepSeek-V3",
+    new_base_prompt = {
+        "model": LLM_MODEL,
         "stream": False,
         "max_tokens": 256,
         "temperature": 0.5,
@@ -247,32 +453,463 @@ def prompted_binary_classification(html_text):
         "n": 1,
         "messages": []
     }
-    
-    new_base_prompt_2["messages"].append({
-        "content": """Categorize webpage content: 1. Looking Glass related (link to LG or similar webpages) but no direct service; 2. Direct LG service. If it allows commands (traceroute, ping, etc.), selection of parameters (addresses, etc.), it should be class 2. If it is a whois or network information page or only provide links to LG or similar services, it should be class 1. The input starts with its url, and hyperlinks are presented as `[text](link)`.
-        Example A: ```[Ping Testi](https://atlantisnet.com.tr/internet-ping-testi/) *  ##### Yardım * [ Atlantis Looking Glass ](https://lg.atlantisnet.com.tr/)``` All commands are links to other pages but no direct service -> class 1; 
-        Example B: ```The only public service offered so far on this server is a [traceroute](/cgi-bin/tracer.cgi) server.``` contains command keywords but only links -> class 1; 
-        Example C: ```[Meta]:og:title:INS BGP looking glass [Meta]:description:International Network Services Network Looking Glass [Meta]:hyperglass * ## FRA Marseille, MRS1 FM * ## ZAF Durban, DMO ZD``` contains `hyperglass` from template LG webpage. -> class 2.
-        Example D: ```www.ip2location.com:...``` or ``` www.peeringdb.com: ...``` are likely information pages -> class 1.
-        Output 1 or 2 only.""",
-        "role": "system"
-    })
-    
-    new_base_prompt_1["messages"].append({
+    if stage == 1:
+        new_base_prompt["messages"].append({
+            "content": CLASSIFY_PROMPT_1,
+            "role": "system"
+        })
+    else:
+        new_base_prompt["messages"].append({
+            "content": CLASSIFY_PROMPT_2,
+            "role": "system"
+        })
+    new_base_prompt["messages"].append({
         "content": html_text,
         "role": "user"
     })
-    result = request_llm_and_get_response(new_base_prompt_1)
+    return new_base_prompt
+
+def prompted_binary_classification(html_text):
+    """
+    通过提示模型进行两次二分类
+    """
+    result = request_llm_and_get_response(build_classification_payload(1, html_text))
     if result == 2:
-        new_base_prompt_2["messages"].append({
-            "content": html_text,
-            "role": "user"
-        })
-        result = request_llm_and_get_response(new_base_prompt_2)
+        result = request_llm_and_get_response(build_classification_payload(2, html_text))
+        if result is not None:
+            result += 1
+    return result
+
+async def prompted_binary_classification_async(client: AsyncLLMClient, html_text):
+    """
+    Same as prompted_binary_classification, on the shared asynchronous client.
+    """
+    result = parse_label(await client.chat(build_classification_payload(1, html_text), is_valid_label))
+    if result == 2:
+        result = parse_label(await client.chat(build_classification_payload(2, html_text), is_valid_label))
         if result is not None:
             result += 1
     return result
 
+# For batched classification, several pages in one request with one indexed answer per page.
+BATCH_INSTRUCTION = """The input contains {} webpages, each starting with `### Page <index>`. Categorize every page independently by the rules above.
+Output exactly one line per page in the format `<index>: <class>`, e.g. `1: 2`, in the order of the pages. No more explanations."""
+PTN_BATCH_ANSWER = re.compile(r"^\W*(?:page\s*)?(\d+)\s*[:\-=]\s*(\d+)", re.IGNORECASE | re.MULTILINE)
+
+# Recorded with every result, changes whenever one of the classification prompts changes
+PROMPT_VERSION = hashlib.md5("\n".join((CLASSIFY_PROMPT_1, CLASSIFY_PROMPT_2, BATCH_INSTRUCTION)).encode()).hexdigest()[:12]
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def pack_batches(dataset: list, text_index=0) -> list:
+    """
+    Greedily pack the samples into batches within LLM_BATCH_MAX_PAGES and LLM_BATCH_TOKEN_BUDGET.
+    A sample larger than the budget gets a batch of its own.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for data in dataset:
+        tokens = estimate_tokens(data[text_index])
+        if batch and (len(batch) >= LLM_BATCH_MAX_PAGES or batch_tokens + tokens > LLM_BATCH_TOKEN_BUDGET):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(data)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def build_batch_classification_payload(stage: int, html_text_list: list) -> dict:
+    """
+    Same prompt as build_classification_payload, with all pages indexed in one user message.
+    """
+    new_base_prompt = build_classification_payload(stage, "")
+    new_base_prompt["max_tokens"] = 16 * len(html_text_list) + 32
+    new_base_prompt["messages"].insert(1, {
+        "content": BATCH_INSTRUCTION.format(len(html_text_list)),
+        "role": "system"
+    })
+    new_base_prompt["messages"][-1]["content"] = "\n\n".join(
+        f"### Page {i}\n{html_text}" for i, html_text in enumerate(html_text_list, 1)
+    )
+    return new_base_prompt
+
+def parse_batch_labels(content: str | None, num_pages: int) -> list:
+    """
+    Validate the indexed answers, a page gets None if its answer is missing, out of (1, 2) or conflicting.
+    """
+    labels = [None] * num_pages
+    if content is None:
+        return labels
+    conflicted = set()
+    for index, label in PTN_BATCH_ANSWER.findall(content):
+        index, label = int(index) - 1, int(label)
+        if not 0 <= index < num_pages or label not in (1, 2):
+            continue
+        if labels[index] is not None and labels[index] != label:
+            conflicted.add(index)
+        labels[index] = label
+    for index in conflicted:
+        labels[index] = None
+    return labels
+
+async def classify_stage_batch_async(client: AsyncLLMClient, stage: int, html_text_list: list) -> list:
+    """
+    One batched request for the stage, pages without a valid answer fall back to single-page requests.
+    """
+    if len(html_text_list) == 1:
+        return [parse_label(await client.chat(build_classification_payload(stage, html_text_list[0]), is_valid_label))]
+    # A batch answer is cached only if every page has a valid label
+    is_valid_batch = lambda content: None not in parse_batch_labels(content, len(html_text_list))
+    content = await client.chat(build_batch_classification_payload(stage, html_text_list), is_valid_batch)
+    labels = parse_batch_labels(content, len(html_text_list))
+    for i, label in enumerate(labels):
+        if label is None:
+            labels[i] = parse_label(await client.chat(build_classification_payload(stage, html_text_list[i]), is_valid_label))
+    return labels
+
+async def batched_binary_classification_async(client: AsyncLLMClient, html_text_list: list) -> list:
+    """
+    Batched version of prompted_binary_classification_async, returns the labels in the input order.
+    Pages classified as related in stage 1 are batched again for stage 2.
+    """
+    results = await classify_stage_batch_async(client, 1, html_text_list)
+    related_index = [i for i, result in enumerate(results) if result == 2]
+    if related_index:
+        stage_2_results = await classify_stage_batch_async(client, 2, [html_text_list[i] for i in related_index])
+        for i, result in zip(related_index, stage_2_results):
+            results[i] = result + 1 if result is not None else None
+    return results
+
+# For near-duplicate detection of the processed pages.
+def simhash_fingerprint(contents: str) -> int:
+    """
+    Compute the SimHash fingerprint of the page text.
+    Every feature is a shingle of consecutive words, hashed into SIMHASH_BITS bits.
+    """
+    words = re.findall(r"\w+", contents.lower())
+    if len(words) == 0:
+        return 0
+    k = min(SIMHASH_SHINGLE_SIZE, len(words))
+    shingles = {" ".join(words[i:i+k]) for i in range(len(words) - k + 1)}
+    digest_size = SIMHASH_BITS // 8
+    hashes = np.frombuffer(b"".join(
+        hashlib.blake2b(shingle.encode(), digest_size=digest_size).digest() for shingle in shingles
+    ), dtype=np.uint8).reshape(len(shingles), digest_size)
+    # Vote for each bit by all features, keep the bits voted by the majority
+    bit_votes = np.unpackbits(hashes, axis=1).sum(axis=0)
+    fingerprint_bits = (2 * bit_votes > len(shingles)).astype(np.uint8)
+    return int.from_bytes(np.packbits(fingerprint_bits).tobytes(), "big")
+
+class NearDuplicateIndex:
+    """
+    SimHash index to tag each page with a duplicate-group ID.
+    Fingerprints are split into SIMHASH_MAX_DISTANCE + 1 blocks, two fingerprints within the
+    distance must share at least one block, so only the pages in the same bucket are compared.
+    """
+    def __init__(self):
+        self.num_blocks = SIMHASH_MAX_DISTANCE + 1
+        block_len = SIMHASH_BITS // self.num_blocks
+        self.block_shifts = [i * block_len for i in range(self.num_blocks)]
+        self.block_masks = [(1 << block_len) - 1] * (self.num_blocks - 1)
+        self.block_masks.append((1 << (SIMHASH_BITS - block_len * (self.num_blocks - 1))) - 1)
+        self.buckets = [{} for _ in range(self.num_blocks)]
+        self.fingerprints = {}
+        self.groups = {}
+
+    def _blocks(self, fingerprint: int):
+        return [(fingerprint >> shift) & mask for shift, mask in zip(self.block_shifts, self.block_masks)]
+
+    def _insert(self, url: str, fingerprint: int, group_id: str):
+        self.fingerprints[url] = fingerprint
+        self.groups[url] = group_id
+        for bucket, block in zip(self.buckets, self._blocks(fingerprint)):
+            bucket.setdefault(block, []).append(url)
+
+    def query(self, fingerprint: int) -> str | None:
+        """
+        Return the group ID of the closest indexed page within the distance, or None.
+        """
+        best_url = None
+        best_distance = SIMHASH_MAX_DISTANCE + 1
+        for bucket, block in zip(self.buckets, self._blocks(fingerprint)):
+            for url in bucket.get(block, []):
+                distance = (self.fingerprints[url] ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best_distance = distance
+                    best_url = url
+        if best_url is None:
+            return None
+        return self.groups[best_url]
+
+    def add(self, url: str, contents: str) -> str:
+        """
+        Index the page and return its duplicate-group ID.
+        A page without near-duplicates starts a new group named by its own URL.
+        """
+        return self.add_fingerprint(url, simhash_fingerprint(contents))
+
+    def add_fingerprint(self, url: str, fingerprint: int) -> str:
+        """
+        Same as add, with the fingerprint already computed (e.g. by a worker process).
+        """
+        if self.fingerprints.get(url) == fingerprint:
+            return self.groups[url]
+        group_id = self.query(fingerprint)
+        if group_id is None:
+            group_id = url
+        self._insert(url, fingerprint, group_id)
+        return group_id
+
+    def group_of(self, url: str) -> str | None:
+        return self.groups.get(url)
+
+    def save(self, filepath: str):
+        with open(filepath, "w") as f:
+            json.dump({
+                url: {"fingerprint": format(fingerprint, "x"), "group": self.groups[url]}
+                for url, fingerprint in self.fingerprints.items()
+            }, f)
+
+    @classmethod
+    def load(cls, filepath: str) -> "NearDuplicateIndex":
+        index = cls()
+        if os.path.exists(filepath):
+            with open(filepath, "r") as f:
+                for url, info in json.load(f).items():
+                    index._insert(url, int(info["fingerprint"], 16), info["group"])
+        return index
+
+# For the parallel keyword filter of the crawled pages.
+def filter_page_chunk(lg_info_list: list) -> list:
+    """
+    Process pool worker, extract the context around keywords of a chunk of pages into PROCS_DIR.
+    The contexts are extracted in one batch, the fingerprints for near-duplicate detection are computed here as well.
+    """
+    records, context_list, cleaned_list, to_extract = [], [], [], []
+    for lg_info in lg_info_list:
+        record = {"url": lg_info["url"], "filename": lg_info["filename"], "has_context": False, "fingerprint": None}
+        records.append(record)
+        context_list.append(None)
+        dst_filepath = os.path.join(PROCS_DIR, lg_info["filename"])
+        try:
+            if os.path.exists(dst_filepath):
+                context_list[-1] = open(dst_filepath, "r", encoding="utf-8").read()
+            else:
+                html_str = open(os.path.join(SAVE_DIR, lg_info["filename"]), "r", encoding="utf-8").read()
+                cleaned_str = collect_text_in_order(html_str)
+                if cleaned_str:
+                    to_extract.append(len(records) - 1)
+                    cleaned_list.append(cleaned_str)
+        except Exception as e:
+            # Not recorded in the state file, so it will be retried in the next run
+            record["error"] = str(e)
+    for i, context_content in zip(to_extract, extract_context_batch(cleaned_list)):
+        if context_content:
+            try:
+                with open(os.path.join(PROCS_DIR, records[i]["filename"]), "w", encoding="utf-8") as f:
+                    f.write(context_content)
+            except Exception as e:
+                records[i]["error"] = str(e)
+                continue
+            context_list[i] = context_content
+    for record, context_content in zip(records, context_list):
+        if context_content and "error" not in record:
+            record["has_context"] = True
+            record["fingerprint"] = format(simhash_fingerprint(context_content), "x")
+    return records
+
+def load_filter_state(state_path: str) -> dict:
+    """
+    Load the processed pages of the keyword filter, a torn last line is ignored.
+    """
+    state = {}
+    if not os.path.exists(state_path):
+        return state
+    with open(state_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            state[record["filename"]] = record
+    return state
+
+def keyword_filter_pages(page_list: list, state_path: str):
+    """
+    Run filter_page_chunk over a process pool, yield (lg_info, record) in the order of page_list.
+    Every finished page is appended to the state file, pages already in it are not processed again.
+    """
+    state = load_filter_state(state_path)
+    pending_list = []
+    set_pending = set()
+    for lg_info in page_list:
+        if lg_info["filename"] not in state and lg_info["filename"] not in set_pending:
+            set_pending.add(lg_info["filename"])
+            pending_list.append(lg_info)
+    print(f"{len(page_list) - len(pending_list)} pages already processed, {len(pending_list)} pages to process.")
+    os.makedirs(PROCS_DIR, exist_ok=True)
+    with open(state_path, "a", encoding="utf-8") as state_file:
+        with ProcessPoolExecutor(max_workers=NUM_PROCESSES) as executor:
+            chunks = [pending_list[i:i + FILTER_CHUNK_SIZE] for i in range(0, len(pending_list), FILTER_CHUNK_SIZE)]
+            results = chain.from_iterable(executor.map(filter_page_chunk, chunks))
+            failed = {}
+            for count, lg_info in enumerate(page_list, 1):
+                record = state.get(lg_info["filename"]) or failed.get(lg_info["filename"])
+                if record is None:
+                    record = next(results)
+                    if "error" in record:
+                        failed[lg_info["filename"]] = record
+                        print(f"{lg_info['filename']} failed: {record['error']}")
+                    else:
+                        state[lg_info["filename"]] = record
+                        state_file.write(json.dumps(record) + "\n")
+                if count % 1000 == 0:
+                    state_file.flush()
+                yield lg_info, record
+
+# For streaming extraction of candidate hyperlinks.
+PTN_ABS_URL = re.compile(r'https?://[^\s\'"<>]+')
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+LG_TEXT_WORDS = ("looking glass", "lookingglass")
+
+class CandidateLinkExtractor(HTMLParser):
+    """
+    SAX-style extractor emitting candidate links with their context in one pass, without building a tree.
+    Related page: all links under the parent tag of any text containing "looking glass" (the anchor itself included).
+    LG page: all absolute URLs (in text, scripts, attributes or comments) containing URL_FILTER_WORDS.
+    """
+    def __init__(self, url: str, is_lg=False):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.is_lg = is_lg
+        self.candidates = []
+        self.seen_links = set()
+        # All links in document order, each open tag only keeps its start index in this list
+        self.links = []
+        self.stack = []
+        self.anchor = None
+        # Text may be split across chunks, buffer it until the next tag
+        self.text_buffer = []
+
+    def _emit(self, link: str, anchor: str, context: str):
+        if link in self.seen_links:
+            return
+        self.seen_links.add(link)
+        self.candidates.append({
+            "url": link,
+            "anchor": anchor,
+            "context": context,
+            "source": self.url,
+            "is_lg": self.is_lg,
+        })
+
+    def _scan_abs_urls(self, text: str, context: str):
+        for link in PTN_ABS_URL.findall(text):
+            link_lower = link.lower()
+            if any(word in link_lower for word in URL_FILTER_WORDS):
+                self._emit(link, "", context)
+
+    def _close_frame(self):
+        tag, start, lg_context = self.stack.pop()
+        if lg_context is not None:
+            for link, anchor in self.links[start:]:
+                self._emit(link, anchor, lg_context)
+
+    def _flush_text(self):
+        if not self.text_buffer:
+            return
+        data = "".join(self.text_buffer)
+        self.text_buffer = []
+        if self.is_lg:
+            if "://" in data:
+                self._scan_abs_urls(data, "text")
+            return
+        if self.anchor is not None:
+            self.anchor[1].append(data.strip())
+        text_lower = data.lower()
+        if self.stack and any(word in text_lower for word in LG_TEXT_WORDS):
+            tag, start, lg_context = self.stack[-1]
+            if lg_context is None:
+                self.stack[-1] = (tag, start, data.strip()[:TEXT_LEN_MAX_THRESHOLD])
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if self.is_lg:
+            for _, value in attrs:
+                if value and "://" in value:
+                    self._scan_abs_urls(value, tag)
+            return
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href is not None:
+                try:
+                    link = urljoin(self.url, href.rstrip("/"))
+                except Exception:
+                    link = None
+                if link:
+                    self.anchor = [link, []]
+            return
+        if tag not in VOID_TAGS:
+            self.stack.append((tag, len(self.links), None))
+
+    def handle_startendtag(self, tag, attrs):
+        if self.is_lg:
+            self.handle_starttag(tag, attrs)
+        elif tag == "a":
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if self.is_lg:
+            return
+        if tag == "a":
+            if self.anchor is not None:
+                link, texts = self.anchor
+                self.links.append((link, " ".join(texts).strip()))
+                self.anchor = None
+            return
+        # Implicitly close the unclosed tags, ignore the end tag without start tag
+        if not any(frame[0] == tag for frame in self.stack):
+            return
+        while self.stack:
+            is_matched = self.stack[-1][0] == tag
+            self._close_frame()
+            if is_matched:
+                break
+
+    def handle_data(self, data):
+        self.text_buffer.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+        if self.is_lg and "://" in data:
+            self._scan_abs_urls(data, "comment")
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        if self.anchor is not None:
+            self.handle_endtag("a")
+        while self.stack:
+            self._close_frame()
+
+def extract_candidate_links(filepath: str, url: str, is_lg=False, chunk_size=65536) -> list:
+    """
+    Stream the HTML file into the extractor chunk by chunk, return the candidate links with context.
+    """
+    extractor = CandidateLinkExtractor(url, is_lg)
+    with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            extractor.feed(chunk)
+    extractor.close()
+    return extractor.candidates
+
 def fetch_one_page(url, session: requests.Session, retry_count=0) -> dict:
     header = BASE_HEADER
     header["User-Agent"] = random.choice(USER_AGENT_LIST)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils import extract_context_batch
+
+def long_page(keyword: str, num_filler=3000) -> str:
+    filler = " ".join(f"w{i}" for i in range(num_filler))
+    return f"{filler} {keyword} {filler}"
+
+def test_batch_matches_single_pages():
+    contents = [long_page("traceroute"), "", "short ping page", "no related words", long_page("[Input]:host")]
+    batch = extract_context_batch(contents)
+    assert batch == [extract_context_batch([content])[0] for content in contents]
+    assert batch[1] is None and batch[2] == "short ping page" and batch[3] is None
+
+def test_context_stays_within_its_page():
+    # The last tokens of a page and the first tokens of the next one are both kept, but not joined
+    first = "w " * 2000 + "ping end1"
+    second = "start2 traceroute " + "w " * 2000
+    context_1, context_2 = extract_context_batch([first, second])
+    assert "start2" not in context_1 and context_1.endswith("ping end1")
+    assert "end1" not in context_2 and context_2.startswith("start2 traceroute")
@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils import collect_text_in_order
+
+def test_self_closing_script_keeps_following_text():
+    text = collect_text_in_order('<p>before</p><script src="a.js"/><p>after ping</p>')
+    assert "before" in text and "after ping" in text
+
+def test_self_closing_svg_keeps_following_text():
+    text = collect_text_in_order('<p>before</p><svg viewBox="0 0 1 1"/><p>after traceroute</p>')
+    assert "before" in text and "after traceroute" in text
+
+def test_open_script_is_still_skipped():
+    text = collect_text_in_order('<p>before</p><script>var x = "hidden";</script><p>after</p>')
+    assert "hidden" not in text and "after" in text
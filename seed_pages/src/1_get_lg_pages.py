@@ -15,7 +15,9 @@
 
 # Import necessary libraries
 import random
+import sys
 import time
+import hashlib
 from urllib.parse import urljoin
 import requests
 import json
@@ -268,6 +270,12 @@ def check_availabilty_and_download(lg_url_list: list) -> list:
     available_lg_page_list = []
     failed_lg_page_list = []
     redirected_lg_page_list = {}
+    # Tag each downloaded page with its near-duplicate group
+    near_dup_path = os.path.join(OUTPUT_DIR, NEAR_DUP_FILE)
+    near_dup_index = NearDuplicateIndex.load(near_dup_path)
+    # Keep the validators of each page for later conditional refresh
+    crawl_state_path = os.path.join(OUTPUT_DIR, CRAWL_STATE_FILE)
+    crawl_state = CrawlState.load(crawl_state_path)
     # random shuffle the list to avoid being blocked
     random.shuffle(lg_url_list)
     
@@ -287,16 +295,20 @@ def check_availabilty_and_download(lg_url_list: list) -> list:
                         filename = url_to_filename(result['final_url'])
                         filepath = os.path.join(SAVE_DIR, filename)
                         redirected_lg_page_list[result["original_url"]] = result["final_url"]
+                        cleaned_html = str(cleaned_soup)
                         with open(filepath, 'w', encoding='utf-8') as f:
-                            f.write(str(cleaned_soup))
+                            f.write(cleaned_html)
+                        crawl_state.update(result['final_url'], result, hashlib.md5(cleaned_html.encode()).hexdigest())
                         seed_contents = collect_text_in_order(cleaned_soup)
                         # save to the output directory
                         with open(os.path.join(PROCS_DIR, filename), "w") as f:
                             f.write("\n".join(seed_contents))                            
+                        dup_group = near_dup_index.add(result['final_url'], "\n".join(seed_contents))
                         succ_cnt += 1
                         available_lg_page_list.append({
                             "url": result['final_url'],
                             "filename": filename,
+                            "dup_group": dup_group,
                         })
                     else:
                         failed_cnt += 1
@@ -312,8 +324,89 @@ def check_availabilty_and_download(lg_url_list: list) -> list:
                     })            
                 if processed_cnt % 200 == 0:
                     print("{} processed, {} success, {} failed".format(processed_cnt, succ_cnt, failed_cnt))
+    near_dup_index.save(near_dup_path)
+    crawl_state.end_pass()
+    crawl_state.save(crawl_state_path)
     return available_lg_page_list, failed_lg_page_list
 
+def refresh_available_pages(available_lg_page_list: list) -> list:
+    """
+    Refresh the downloaded LG pages with conditional GETs.
+    Only the pages due by the recrawl interval of their host are requested,
+    and only the pages whose content hash changed are re-written.
+    A failed page keeps its files, it is only dropped when it is gone (404 / 410)
+    or after REFRESH_MAX_FAILURES consecutive failed refreshes.
+    """
+    stats = {"not_modified": 0, "unchanged": 0, "changed": 0, "failed": 0, "dropped": 0}
+    failed_lg_page_list = []
+    dropped_url_set = set()
+    crawl_state_path = os.path.join(OUTPUT_DIR, CRAWL_STATE_FILE)
+    crawl_state = CrawlState.load(crawl_state_path)
+    near_dup_path = os.path.join(OUTPUT_DIR, NEAR_DUP_FILE)
+    near_dup_index = NearDuplicateIndex.load(near_dup_path)
+    now = time.time()
+    due_page_list = [page for page in available_lg_page_list if crawl_state.is_due(page["url"], now)]
+    print(f"{len(due_page_list)} of {len(available_lg_page_list)} LG pages are due for refresh.")
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        with requests.Session() as session:
+            futures = {
+                executor.submit(fetch_one_page, page["url"], session, 0, crawl_state.validators(page["url"])): page
+                for page in due_page_list
+            }
+            for future in as_completed(futures):
+                page = futures[future]
+                result = future.result()
+                if result['success'] and result['not_modified']:
+                    crawl_state.update(page["url"], result)
+                    stats["not_modified"] += 1
+                    continue
+                status_code = result.get("status_code")
+                if not result['success']:
+                    err = str(result["error"])
+                elif not 200 <= status_code < 300:
+                    err = f"HTTP {status_code}"
+                else:
+                    soup = parse_webpages(result['content'])
+                    err = None if soup is not None else "Cannot parse the webpage."
+                if err is not None:
+                    stats["failed"] += 1
+                    failures = crawl_state.record_failure(page["url"], err)
+                    dropped = status_code in REFRESH_GONE_STATUS or failures >= REFRESH_MAX_FAILURES
+                    if dropped:
+                        stats["dropped"] += 1
+                        dropped_url_set.add(page["url"])
+                    failed_lg_page_list.append({
+                        "url": page["url"],
+                        "err": err,
+                        "failures": failures,
+                        "dropped": dropped,
+                    })
+                    continue
+                cleaned_soup = remove_script_and_style(soup)
+                cleaned_html = str(cleaned_soup)
+                changed = crawl_state.update(page["url"], result, hashlib.md5(cleaned_html.encode()).hexdigest())
+                if not changed:
+                    stats["unchanged"] += 1
+                    continue
+                stats["changed"] += 1
+                with open(os.path.join(SAVE_DIR, page["filename"]), 'w', encoding='utf-8') as f:
+                    f.write(cleaned_html)
+                seed_contents = "\n".join(collect_text_in_order(cleaned_soup))
+                with open(os.path.join(PROCS_DIR, page["filename"]), "w") as f:
+                    f.write(seed_contents)
+                page["dup_group"] = near_dup_index.add(page["url"], seed_contents)
+    crawl_state.end_pass()
+    crawl_state.save(crawl_state_path)
+    near_dup_index.save(near_dup_path)
+    print("Refresh results: {} not modified, {} unchanged, {} changed, {} failed ({} dropped)".format(
+        stats["not_modified"], stats["unchanged"], stats["changed"], stats["failed"], stats["dropped"]))
+    
+    # The failures of the crawl in FAIL_FILE are kept
+    with open(os.path.join(OUTPUT_DIR, REFRESH_FAIL_FILE), "w") as f:
+        json.dump(failed_lg_page_list, f, indent=4)
+    return [page for page in available_lg_page_list if page["url"] not in dropped_url_set]
+
 def get_candidate_urls(page_info):
     """
     Parse the HTML source file, search for tags containing "looking glass" or "lookingglass" among all text nodes,
@@ -353,6 +446,15 @@ def get_candidate_urls(page_info):
     return candidate_urls
 
 if __name__ == "__main__":
+    # Refresh mode: only re-check the liveness and changes of the available LG pages
+    if len(sys.argv) > 1 and sys.argv[1] == "refresh":
+        available_lg_page_list = json.load(open(os.path.join(OUTPUT_DIR, AVAI_FILE), "r"))
+        available_lg_page_list = refresh_available_pages(available_lg_page_list)
+        with open(os.path.join(OUTPUT_DIR, AVAI_FILE), "w") as f:
+            json.dump(available_lg_page_list, f, indent=4)
+        print(f"Get {len(available_lg_page_list)} available LG pages after refresh.")
+        exit(0)
+    
     raw_lg_page_list = []
     for func in lg_collection_funcs:
         tmp_lg_list = func()
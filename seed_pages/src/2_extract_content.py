@@ -21,11 +21,13 @@ def clear_directories():
             os.remove(os.path.join(dir_path, filename))
 
 def get_unique_urls(pages):
-    """Calculate hash values and return unique URLs."""
-    hash_to_urls = {}
+    """Group the pages by near-duplicate fingerprints and return unique URLs."""
+    group_to_urls = {}
     page_contents = {}
+    near_dup_path = os.path.join(OUTPUT_DIR, NEAR_DUP_FILE)
+    near_dup_index = NearDuplicateIndex.load(near_dup_path)
     
-    # Calculate hash for each page
+    # Find the near-duplicate group for each page
     for page in pages:
         try:
             with open(os.path.join(PROCS_DIR, page["filename"]), "r") as f:
@@ -43,14 +45,15 @@ def get_unique_urls(pages):
                 f.write(content)
         page_contents[page["url"]] = content
         
-        hash_val = hashlib.md5(content.encode()).hexdigest()
-        if hash_val not in hash_to_urls:
-            hash_to_urls[hash_val] = []
-        hash_to_urls[hash_val].append(page["url"])
+        dup_group = near_dup_index.add(page["url"], content)
+        if dup_group not in group_to_urls:
+            group_to_urls[dup_group] = []
+        group_to_urls[dup_group].append(page["url"])
+    near_dup_index.save(near_dup_path)
     
-    # Select shortest non-IP URL for each hash
+    # Select shortest non-IP URL for each group
     unique_urls = {min(urls, key=lambda url: (bool(re.search(r'\b([0-9]{1,3}\.){3}[0-9]{1,3}\b', url)), len(url)))
-                  for urls in hash_to_urls.values()}
+                  for urls in group_to_urls.values()}
     
     return unique_urls, page_contents
 
@@ -18,6 +18,9 @@ FAIL_FILE = "failed_lg_page_list.json"
 UNIQ_FILE = "unique_lg_page_list.json"
 SIM_FILE = "similar_matrix_{}.bin"
 DUP_FILE = "dict_hash_contents.json"
+NEAR_DUP_FILE = "near_duplicate_index.json"
+CRAWL_STATE_FILE = "crawl_state.json"
+REFRESH_FAIL_FILE = "refresh_failed_lg_page_list.json"
 
 # ====================== Crawler Configs ====================== #
 
@@ -67,6 +70,19 @@ SIMPLE_STOP_WORDS = {
 }
 FILE_NAME_MAX_LENGTH = 200
 
+# refresh configs, the recrawl interval of each host adapts to its observed change frequency
+RECRAWL_INIT_INTERVAL = 30 * 24 * 3600
+RECRAWL_MIN_INTERVAL = 7 * 24 * 3600
+RECRAWL_MAX_INTERVAL = 180 * 24 * 3600
+RECRAWL_BACKOFF = 1.5  # Multiply the interval if the host is unchanged, divide it by 2 if changed
+REFRESH_MAX_FAILURES = 3  # Consecutive failed refreshes before a page is dropped
+REFRESH_GONE_STATUS = {404, 410}  # Status codes dropping a page at the first failed refresh
+
+# ====================== Near-duplicate Configs ====================== #
+SIMHASH_BITS = 64
+SIMHASH_SHINGLE_SIZE = 3  # Number of consecutive words hashed as one feature
+SIMHASH_MAX_DISTANCE = 3  # Pages whose fingerprints differ in at most this many bits are near-duplicates
+
 # ====================== Clustering Configs ====================== #
 PTN_CHAR = r'^[^\p{L}\u4e00-\u9fff\u0400-\u04FF]*$'
 PTN_IP = r'\b([0-9]{1,3}\.){3}[0-9]{1,3}\b'
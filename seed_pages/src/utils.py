@@ -1,4 +1,6 @@
 import time
+import json
+import hashlib
 from bs4 import BeautifulSoup, NavigableString
 import warnings
 import random
@@ -10,6 +12,7 @@ from difflib import SequenceMatcher
 from niteru.html_parser import parse_html
 import zstandard as zstd
 import io
+from urllib.parse import urlparse
 
 from configs import *
 
@@ -29,12 +32,31 @@ def request_with_random_header(url: str) -> BeautifulSoup:
     soup = parse_webpages(response.text)
     return soup
 
-def fetch_one_page(url, session: requests.Session, retry_count=0) -> dict:
+def fetch_one_page(url, session: requests.Session, retry_count=0, validators: dict = None) -> dict:
+    """
+    Download one page. If the validators (etag / last_modified) of a previous crawl are given,
+    issue a conditional GET and only report "not_modified" when the server answers 304.
+    """
     try:
-        header = BASE_HEADER
+        header = BASE_HEADER.copy()
         header["User-Agent"] = random.choice(USER_AGENT_LIST)
+        if validators:
+            if validators.get("etag"):
+                header["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                header["If-Modified-Since"] = validators["last_modified"]
         # ignore the https insecure warning, and allow the redirect
         response = session.get(url, timeout=TIMEOUT, headers=header, verify=False, allow_redirects=True, stream=True)
+        if response.status_code == 304:
+            validators = validators or {}
+            return {
+                "original_url": url,
+                "final_url": url,
+                "not_modified": True,
+                "etag": response.headers.get("ETag", validators.get("etag")),
+                "last_modified": response.headers.get("Last-Modified", validators.get("last_modified")),
+                "success": True
+            }
         # check if the content encoding is zstandard
         if response.headers.get('Content-Encoding') == 'zstd':
             # decompress the content
@@ -47,7 +69,7 @@ def fetch_one_page(url, session: requests.Session, retry_count=0) -> dict:
 
     except Exception as e:
         if retry_count < MAX_RETRY:
-            return fetch_one_page(url, session, retry_count + 1)
+            return fetch_one_page(url, session, retry_count + 1, validators)
         return {
             "original_url": url,
             "error": str(e),
@@ -60,9 +82,108 @@ def fetch_one_page(url, session: requests.Session, retry_count=0) -> dict:
         "original_url": url,
         "final_url": final_url,
         "content": response_text,
+        "status_code": response.status_code,
+        "not_modified": False,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
         "success": True
     }
 
+class CrawlState:
+    """
+    Per-URL validators (ETag, Last-Modified, content hash) and per-host recrawl intervals.
+    The interval of a host shrinks when its pages change and grows when they stay the same.
+    """
+    def __init__(self):
+        self.pages = {}
+        self.hosts = {}
+        # Rechecks of each host in the current pass
+        self.pending = {}
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).hostname or url
+
+    def validators(self, url: str) -> dict | None:
+        page = self.pages.get(url)
+        if page is None or not (page.get("etag") or page.get("last_modified")):
+            return None
+        return {"etag": page.get("etag"), "last_modified": page.get("last_modified")}
+
+    def is_due(self, url: str, now: float) -> bool:
+        page = self.pages.get(url)
+        if page is None:
+            return True
+        interval = self.hosts.get(self._host(url), {}).get("interval", RECRAWL_INIT_INTERVAL)
+        # A page whose last refresh failed has no last_checked, and is retried in the next pass
+        return now - page.get("last_checked", 0) >= interval
+
+    def update(self, url: str, result: dict, content_hash: str = None, now: float = None) -> bool:
+        """
+        Record the result of one (conditional) fetch, return whether the page is changed.
+        """
+        now = now or time.time()
+        is_new = "last_checked" not in self.pages.get(url, {})
+        page = self.pages.setdefault(url, {"content_hash": None, "last_changed": now})
+        page["failures"] = 0
+        if result.get("not_modified"):
+            changed = False
+        else:
+            changed = content_hash != page["content_hash"]
+            page["content_hash"] = content_hash
+        page["etag"] = result.get("etag")
+        page["last_modified"] = result.get("last_modified")
+        page["last_checked"] = now
+        if changed:
+            page["last_changed"] = now
+        if is_new:
+            return True
+        # count the recheck for the host, the interval is adapted once per pass by end_pass
+        host_pass = self.pending.setdefault(self._host(url), {"checks": 0, "changes": 0})
+        host_pass["checks"] += 1
+        host_pass["changes"] += int(changed)
+        return changed
+
+    def record_failure(self, url: str, error: str) -> int:
+        """
+        Record a failed refresh of the page, return the number of consecutive failures.
+        The stored validators and content are kept, the page stays due for the next pass.
+        """
+        page = self.pages.setdefault(url, {"content_hash": None, "last_changed": time.time()})
+        page.pop("last_checked", None)
+        page["failures"] = page.get("failures", 0) + 1
+        page["last_error"] = error
+        return page["failures"]
+
+    def end_pass(self):
+        """
+        Adapt the recrawl interval of every host rechecked in this pass, once per host:
+        halved if any of its pages changed, multiplied by RECRAWL_BACKOFF otherwise.
+        """
+        for hostname, host_pass in self.pending.items():
+            host = self.hosts.setdefault(hostname, {"interval": RECRAWL_INIT_INTERVAL, "checks": 0, "changes": 0})
+            host["checks"] += host_pass["checks"]
+            host["changes"] += host_pass["changes"]
+            if host_pass["changes"] > 0:
+                host["interval"] = max(RECRAWL_MIN_INTERVAL, host["interval"] / 2)
+            else:
+                host["interval"] = min(RECRAWL_MAX_INTERVAL, host["interval"] * RECRAWL_BACKOFF)
+        self.pending = {}
+
+    def save(self, filepath: str):
+        with open(filepath, "w") as f:
+            json.dump({"pages": self.pages, "hosts": self.hosts}, f)
+
+    @classmethod
+    def load(cls, filepath: str) -> "CrawlState":
+        state = cls()
+        if os.path.exists(filepath):
+            with open(filepath, "r") as f:
+                data = json.load(f)
+            state.pages = data.get("pages", {})
+            state.hosts = data.get("hosts", {})
+        return state
+
 def url_to_filename(url: str) -> str:
     """
     Convert the URL to a filename by replacing the special characters.
@@ -76,6 +197,13 @@ def url_to_filename(url: str) -> str:
         filename = filename[:FILE_NAME_MAX_LENGTH]
     return filename
 
+# Substring matching of all filter words in one scan, the longer word first
+PTN_FILTER_WORDS = re.compile('|'.join(re.escape(word) for word in sorted(SIMPLE_FILETER_WORDS, key=len, reverse=True)), re.IGNORECASE)
+# Filter words contained in each filter word, e.g. "traceroute" also contains "route"
+FILTER_WORD_CLOSURE = {
+    word: {other for other in SIMPLE_FILETER_WORDS if other in word} for word in SIMPLE_FILETER_WORDS
+}
+
 def count_filter_words(contents: str) -> int:
     """
     Check if the webpage is a Looking Glass page by checking the title and body.
@@ -83,10 +211,10 @@ def count_filter_words(contents: str) -> int:
     """
     # check the content to verify if it's a looking glass page
     appeared_set = set()
-    text_lower = contents.lower()
-    for word in SIMPLE_FILETER_WORDS:
-        if word.lower() in text_lower:
-            appeared_set.add(word)
+    for match in set(PTN_FILTER_WORDS.findall(contents, overlapped=True)):
+        # A case-insensitive match may not lower to a filter word (e.g. the Turkish "İ"), the plain
+        # lower-case text does not contain that word either, so the match is not counted
+        appeared_set |= FILTER_WORD_CLOSURE.get(match.lower(), set())
     return len(appeared_set)
 
 def parse_webpages(webpage) -> BeautifulSoup:
@@ -173,6 +301,100 @@ def collect_text_in_order(soup: BeautifulSoup):
             list_of_text.extend(collect_text_in_order(child))
     return filter_out_useless_text(list_of_text)
 
+# For near-duplicate detection at download time.
+def simhash_fingerprint(contents: str) -> int:
+    """
+    Compute the SimHash fingerprint of the page text.
+    Every feature is a shingle of consecutive words, hashed into SIMHASH_BITS bits.
+    """
+    words = re.findall(r"\w+", contents.lower())
+    if len(words) == 0:
+        return 0
+    k = min(SIMHASH_SHINGLE_SIZE, len(words))
+    shingles = {" ".join(words[i:i+k]) for i in range(len(words) - k + 1)}
+    digest_size = SIMHASH_BITS // 8
+    hashes = np.frombuffer(b"".join(
+        hashlib.blake2b(shingle.encode(), digest_size=digest_size).digest() for shingle in shingles
+    ), dtype=np.uint8).reshape(len(shingles), digest_size)
+    # Vote for each bit by all features, keep the bits voted by the majority
+    bit_votes = np.unpackbits(hashes, axis=1).sum(axis=0)
+    fingerprint_bits = (2 * bit_votes > len(shingles)).astype(np.uint8)
+    return int.from_bytes(np.packbits(fingerprint_bits).tobytes(), "big")
+
+class NearDuplicateIndex:
+    """
+    SimHash index to tag each page with a duplicate-group ID.
+    Fingerprints are split into SIMHASH_MAX_DISTANCE + 1 blocks, two fingerprints within the
+    distance must share at least one block, so only the pages in the same bucket are compared.
+    """
+    def __init__(self):
+        self.num_blocks = SIMHASH_MAX_DISTANCE + 1
+        block_len = SIMHASH_BITS // self.num_blocks
+        self.block_shifts = [i * block_len for i in range(self.num_blocks)]
+        self.block_masks = [(1 << block_len) - 1] * (self.num_blocks - 1)
+        self.block_masks.append((1 << (SIMHASH_BITS - block_len * (self.num_blocks - 1))) - 1)
+        self.buckets = [{} for _ in range(self.num_blocks)]
+        self.fingerprints = {}
+        self.groups = {}
+
+    def _blocks(self, fingerprint: int):
+        return [(fingerprint >> shift) & mask for shift, mask in zip(self.block_shifts, self.block_masks)]
+
+    def _insert(self, url: str, fingerprint: int, group_id: str):
+        self.fingerprints[url] = fingerprint
+        self.groups[url] = group_id
+        for bucket, block in zip(self.buckets, self._blocks(fingerprint)):
+            bucket.setdefault(block, []).append(url)
+
+    def query(self, fingerprint: int) -> str | None:
+        """
+        Return the group ID of the closest indexed page within the distance, or None.
+        """
+        best_url = None
+        best_distance = SIMHASH_MAX_DISTANCE + 1
+        for bucket, block in zip(self.buckets, self._blocks(fingerprint)):
+            for url in bucket.get(block, []):
+                distance = (self.fingerprints[url] ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best_distance = distance
+                    best_url = url
+        if best_url is None:
+            return None
+        return self.groups[best_url]
+
+    def add(self, url: str, contents: str) -> str:
+        """
+        Index the page and return its duplicate-group ID.
+        A page without near-duplicates starts a new group named by its own URL.
+        """
+        fingerprint = simhash_fingerprint(contents)
+        if self.fingerprints.get(url) == fingerprint:
+            return self.groups[url]
+        group_id = self.query(fingerprint)
+        if group_id is None:
+            group_id = url
+        self._insert(url, fingerprint, group_id)
+        return group_id
+
+    def group_of(self, url: str) -> str | None:
+        return self.groups.get(url)
+
+    def save(self, filepath: str):
+        with open(filepath, "w") as f:
+            json.dump({
+                url: {"fingerprint": format(fingerprint, "x"), "group": self.groups[url]}
+                for url, fingerprint in self.fingerprints.items()
+            }, f)
+
+    @classmethod
+    def load(cls, filepath: str) -> "NearDuplicateIndex":
+        index = cls()
+        if os.path.exists(filepath):
+            with open(filepath, "r") as f:
+                for url, info in json.load(f).items():
+                    index._insert(url, int(info["fingerprint"], 16), info["group"])
+        return index
+
 # For structure similarity computation.
 class StructuralComparator(SequenceMatcher):
     _instance = None
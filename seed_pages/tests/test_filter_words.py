@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils import count_filter_words
+
+def test_count_filter_words_counts_contained_words():
+    # "traceroute" also contains "trace" and "route"
+    assert count_filter_words("TraceRoute and PING") == count_filter_words("traceroute and ping")
+
+def test_count_filter_words_skips_turkish_dotted_i():
+    # "PİNG".lower() is not "ping", counted as by the plain lower-case scan
+    assert count_filter_words("TRACEROUTE PİNG") == count_filter_words("traceroute")
+
+def test_count_filter_words_empty():
+    assert count_filter_words("no related words here") == 0
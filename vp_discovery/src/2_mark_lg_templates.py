@@ -1,6 +1,9 @@
 # According to the clustered result, analyze the LG webpages and discover their VPs.
+# The pages are parsed by a process pool, one task per cluster (or chunk of a large cluster), and the VPs
+# are geolocated in batches and streamed to the output files in the order of the clusters.
 
 from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import json
 from niteru.html_parser import parse_html
 
@@ -8,58 +11,100 @@ from configs import *
 from utils import *
 from templates import *
 
-def analyse_template_by_cluster(clusters):
+def build_cluster_tasks(clusters, chunk_size=MARK_CHUNK_SIZE):
     """
-    Analyse the templates of the webpages in each cluster.
+    Split the clusters into tasks of at most chunk_size pages, each chunk learns its own extraction plan.
     """
-    total_vp_list = []
-    total_process_count = 0
+    tasks = []
     for cluster_id, cluster in clusters.items():
         if cluster_id == "structure_cluster_0":
             print(f"Skip the bgp.he.net cluster.")
             continue
-        print(f"Cluster {cluster_id}:")
-        for url in cluster:
-            total_process_count += 1
-            if total_process_count % 100 == 0:
-                print(f"Processing {total_process_count} urls, {len(total_vp_list)} VPs found.")
-            file_name = url_to_filename(url)
-            file_path = os.path.join(SAVE_DIR, file_name)
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    html_text = f.read()
-                    soup = parse_webpages(html_text)
-                    vp_list = parse_one_template(soup, url)
-                    # update to the total_vp_dict
-                    total_vp_list.extend(vp_list)
-    return total_vp_list
+        for start in range(0, len(cluster), chunk_size):
+            tasks.append((cluster_id, cluster[start:start + chunk_size]))
+    return tasks
+
+def analyse_one_cluster(task, use_plan=CLUSTER_PLAN_ENABLED):
+    """
+    Analyse the templates of the webpages in one cluster task, returns the VPs and the parsing stats.
+    With use_plan, only the representatives of a cluster are fully parsed, see ClusterTemplateInference.
+    """
+    cluster_id, cluster = task
+    vp_list_of_cluster = []
+    inference = ClusterTemplateInference(TemplateDispatcher())
+    for url in cluster:
+        file_name = url_to_filename(url)
+        file_path = os.path.join(SAVE_DIR, file_name)
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            html_text = f.read()
+        try:
+            if use_plan:
+                vp_list = inference.parse(html_text, url, cluster_id)
+            else:
+                soup = parse_webpages(html_text)
+                vp_list = inference.dispatcher.dispatch(soup, url, cluster_id)[1]
+                for vp_info in vp_list:
+                    vp_info['url'] = url
+        except Exception as e:
+            print(f"Error parsing {url}: {e}")
+            continue
+        vp_list_of_cluster.extend(vp_list)
+    return vp_list_of_cluster, inference.get_stats()
+
+def analyse_template_by_cluster(clusters, use_plan=CLUSTER_PLAN_ENABLED, max_workers=MARK_WORKERS):
+    """
+    Analyse the templates of the webpages in each cluster, yield the VPs in the order of the clusters.
+    """
+    tasks = build_cluster_tasks(clusters)
+    total_stats = ClusterTemplateInference(TemplateDispatcher())
+    total_process_count = 0
+    total_vp_count = 0
+    # Each worker keeps one browser for the Hyperglass pages of all its tasks
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_hyperglass_worker) as executor:
+        # Ordered results, the tasks still run in parallel
+        for (cluster_id, cluster), (vp_list, stats) in zip(tasks, executor.map(partial(analyse_one_cluster, use_plan=use_plan), tasks)):
+            total_stats.merge_stats(stats)
+            total_process_count += len(cluster)
+            total_vp_count += len(vp_list)
+            print(f"Cluster {cluster_id}: {len(vp_list)} VPs, processed {total_process_count} urls, {total_vp_count} VPs found.")
+            yield from vp_list
+    total_stats.report()
+
+def batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 if __name__ == "__main__":
     with open(os.path.join(OUTPUT_DIR, "final_clusters.json"), "r") as f:
         clusters = json.load(f)
-    raw_total_vp_list = analyse_template_by_cluster(clusters)
-    # dump the raw total vp list
-    with open(os.path.join(OUTPUT_DIR, "raw_total_vp_list.json"), "w") as f:
-        json.dump(raw_total_vp_list, f, indent=2)
-    # load the raw total vp list
-    # raw_total_vp_list = json.load(open(os.path.join(OUTPUT_DIR, "raw_total_vp_list.json"), "r"))
-    known_vp_list = []      # with IP and geolocation
-    unknown_vp_list = []    # without IP
-    print(f"Total {len(raw_total_vp_list)} VPs found.")
+    total_count = 0
+    known_count = 0
     # Geolocate the VPS by IP or Hint.
     geo_by_hint_count = 0
-    for vp_info in raw_total_vp_list:
-        location, is_hint = geolocate_one_vp(vp_info)
-        if is_hint:
-            geo_by_hint_count += 1
-        if vp_info["ip_addr"] and (not is_bogon(vp_info["ip_addr"])):
-            vp_info["location"] = location
-            known_vp_list.append(vp_info)
-        else:
-            unknown_vp_list.append(vp_info)
+    # All three lists are streamed to the files: raw VPs, VPs with IP and geolocation, VPs without IP
+    with JSONArrayWriter(os.path.join(OUTPUT_DIR, "raw_total_vp_list.json"), indent=2) as raw_writer, \
+        JSONArrayWriter(os.path.join(OUTPUT_DIR, "known_vp_list.json")) as known_writer, \
+        JSONArrayWriter(os.path.join(OUTPUT_DIR, "unknown_vp_list.json")) as unknown_writer:
+        for vp_batch in batched(analyse_template_by_cluster(clusters), GEO_BATCH_SIZE):
+            for vp_info in vp_batch:
+                raw_writer.write(vp_info)
+            for vp_info, (location, is_hint) in zip(vp_batch, geolocate_vps(vp_batch)):
+                if is_hint:
+                    geo_by_hint_count += 1
+                if vp_info["ip_addr"] and (not is_bogon(vp_info["ip_addr"])):
+                    vp_info["location"] = location
+                    known_writer.write(vp_info)
+                    known_count += 1
+                else:
+                    unknown_writer.write(vp_info)
+            total_count += len(vp_batch)
+    print(f"Total {total_count} VPs found, {known_count} with IP.")
     print(f"Total {geo_by_hint_count} VPs geolocated by hint.")
-    # write to files
-    with open(os.path.join(OUTPUT_DIR, "known_vp_list.json"), "w") as f:
-        json.dump(known_vp_list, f, indent=4)
-    with open(os.path.join(OUTPUT_DIR, "unknown_vp_list.json"), "w") as f:
-        json.dump(unknown_vp_list, f, indent=4)
\ No newline at end of file
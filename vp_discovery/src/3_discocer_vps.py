@@ -1,17 +1,23 @@
 # For those VPs without unknown IP, we can use the Geo-Hint to find their location
 # Schedule the unknown VPS to be geolocated, make them ping to hosted machine
+# Usage: python 3_discocer_vps.py [--live]
+#   --live: stream the captures over SSH and attribute the IPs during the campaign, see live_capture.py
+import asyncio
+import sys
 import os
 import random
 import time
 import json
 import requests
 from functools import partial
-import concurrent.futures
-import time
 
 from templates import *
 from configs import *
 from utils import *
+from ping_campaign import run_ping_campaign, write_send_files, count_window_overlaps
+from ping_planner import build_slot_plan, plan_to_rounds, save_plan, summarize_plan, decode_threshold
+from live_capture import LiveCapture, LiveAttributor
+from host_manager import HostManager
 
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 requests_get = partial(requests.get, timeout=10, verify=False)
@@ -22,54 +28,64 @@ if __name__ == "__main__":
     # unknown_vp_list = unknown_vp_list[2500:2550]  # for test
     vp_num = len(unknown_vp_list)
     print('Total unknown VPS:', vp_num)
-    # generate tasks at random order
-    task_params = [(m_idx, lg_idx) for m_idx in range(len(HOSTS)) for lg_idx in range(vp_num)]
-    timestamp_list = [[0 for _ in range(2 * vp_num)] for _ in range(len(HOSTS))]
+    # tasks are scheduled at random order by the campaign
     random.seed(time.time())
-    random.shuffle(task_params)
-    print(f"Total tasks: {len(task_params)}")
+    print(f"Total tasks: {len(HOSTS) * vp_num}")
+
+    live = "--live" in sys.argv[1:]
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    plan, rounds = None, None
+    if PING_PLAN_ENABLED:
+        plan = build_slot_plan(vp_num, len(HOSTS))
+        save_plan(plan)
+        print(f"Slot plan: {summarize_plan(plan)}")
+        rounds = plan_to_rounds(plan)
+    attributor = LiveAttributor(vp_num, len(HOSTS), decode_threshold(plan, vp_num, len(HOSTS))) if live else None
+
+    pids, captures = [None] * len(HOSTS), [None] * len(HOSTS)
 
-    clients, pids = [], []
-    for host in HOSTS:
-        if "passwd" in host:
-            client = CustomSSHClient(host["public_ip"], host["username"], host.get("port", 22), host["passwd"])
+    def start_capture(m_idx, client):
+        host = HOSTS[m_idx]
+        if live:
+            captures[m_idx] = LiveCapture(client, m_idx, host, attributor.add_events, os.path.join(OUTPUT_DIR, host['local_path']))
+            pids[m_idx] = captures[m_idx].start()
         else:
-            client = CustomSSHClient(host["public_ip"], host["username"], host.get("port", 22))
-        pid = start_tcpdump(client, host["pcap_path"], host['public_ip'], host['private_ip'])
-        print(f"[{host['public_ip']}] tcpdump started with PID {pid}")
-        clients.append(client)
-        pids.append(pid)
-    os.makedirs(OUTPUT_DIR, exist_ok=True)    
-    try:
-        TASK_NUM = 12
-        futures = []
-        finish_count = 0
-        with concurrent.futures.ProcessPoolExecutor(max_workers=TASK_NUM) as executor:
-            for m_idx, lg_idx in task_params:
-                futures.append(executor.submit(ping_to_one_lg, m_idx, lg_idx, unknown_vp_list[lg_idx]))
-            
-            # get the result and write to file
-            for future in concurrent.futures.as_completed(futures):
-                finish_count += 1
-                m_idx, lg_idx, start_time = future.result()
-                end_time = time.time()
-                ingress_tolerance = 1
-                egress_tolerance = max(0, 2 - (end_time - start_time))
-                timestamp_list[m_idx][2 * lg_idx] = str(start_time - ingress_tolerance)
-                timestamp_list[m_idx][2 * lg_idx + 1] = str(end_time + egress_tolerance)
-                if finish_count % 500 == 0:
-                    print(f"Finish {finish_count} tasks, {len(futures) - finish_count} tasks left")
-                
-        for m_idx in range(len(HOSTS)):
-            time_list = timestamp_list[m_idx]
-            with open(os.path.join(OUTPUT_DIR, f'{m_idx}_send.txt'), 'w') as time_file:
-                time_file.writelines('\n'.join(time_list))
-        print(f'Finish all probing')
-    finally:
-        for client, host, pid in zip(clients, HOSTS, pids):
-            print(f"[{host['public_ip']}] Stopping tcpdump...")
-            stop_tcpdump(client, pid)
+            pids[m_idx] = start_tcpdump(client, host["pcap_path"], host['public_ip'], host['private_ip'])
+        print(f"[{host['public_ip']}] tcpdump started with PID {pids[m_idx]}")
+
+    def stop_capture(m_idx, client):
+        host = HOSTS[m_idx]
+        if pids[m_idx] is None:
+            return
+        print(f"[{host['public_ip']}] Stopping tcpdump...")
+        if live:
+            # The stream was saved to the local path during the campaign
+            captures[m_idx].stop()
+        else:
+            stop_tcpdump(client, pids[m_idx])
             local_path = os.path.join(OUTPUT_DIR, host['local_path'])
             download_pcap(client, host["pcap_path"], local_path)
-            client.close()
-            print(f"[{host['public_ip']}] Done.")
\ No newline at end of file
+        print(f"[{host['public_ip']}] Done.")
+
+    live_result_path = os.path.join(OUTPUT_DIR, LIVE_RESULT_FILE)
+    with HostManager(HOSTS) as manager:
+        manager.connect_all()
+        try:
+            manager.map(start_capture, raise_error=True)
+            if live:
+                attributor.start_reporting(live_result_path)
+            on_window = attributor.add_window if live else None
+            window_list = asyncio.run(run_ping_campaign(unknown_vp_list, HOSTS, os.path.join(OUTPUT_DIR, PING_LOG_FILE), rounds, on_window))
+            write_send_files(window_list)
+            if rounds is None:
+                print(f'Overlapping windows per host: {count_window_overlaps(window_list)}')
+            print(f'Finish all probing')
+        finally:
+            if live:
+                # Keep the stream until the windows of the last requests are over
+                time.sleep(LIVE_ATTRIBUTE_LAG)
+                attributor.stop_reporting()
+            manager.map(stop_capture)
+            manager.report()
+            if live:
+                attributor.report(live_result_path, watermark=float("inf"))
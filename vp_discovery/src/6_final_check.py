@@ -1,21 +1,15 @@
 # Accroding to the result in 3_discover_vps.py and all the tcpdump files, 
 # cross check to find the ip of unknown VPs
-import dpkt
-import socket
-import sys
 import os
 import json
 
+import numpy as np
+
 from configs import *
 from utils import *
+from pcap_decoder import read_icmp_events, int_to_ip
 
 
-def get_valid_ip(src, dst, idx):
-    if (src == HOSTS[idx]['public_ip']) or (src == HOSTS[idx]['private_ip']):
-        return dst
-    else:
-        return src
-    
 def get_the_responsive_vps(dict_intersection_candidates, dict_threshold_candidates, set_confirmed_ip):
     new_lg_dict = {}
     for lg_idx in dict_intersection_candidates:
@@ -36,40 +30,19 @@ def get_the_responsive_vps(dict_intersection_candidates, dict_threshold_candidat
 if __name__ == "__main__":
     known_vp_list = json.load(open(os.path.join(OUTPUT_DIR, "known_vp_list.json"), "r"))
     known_vp_list = known_vp_list
-    # start_time & end_time timestamp list
-    time_lists = []
     vp_num = len(known_vp_list)
-    # read the start_time and end_time from the tcpdump file
     print("Start reading pcap files...")
 
-    # log the timestamp of the icmp packet
-    read_count = 0
+    # the peers of the icmp packets at all the hosts
     bad_count = 0
-    shown_ip_set = set()
+    shown_peers = []
     for m_idx in range(0, len(HOSTS)):
-        with open(os.path.join(OUTPUT_DIR, HOSTS[m_idx]['local_path']), 'rb') as fr:
-            pcap = dpkt.pcap.Reader(fr)
-            for timestamp, buffer in pcap:
-                try:
-                    ethernet = dpkt.ethernet.Ethernet(buffer)
-                except:
-                    bad_count += 1
-                    continue
-                if not isinstance(ethernet.data, dpkt.ip.IP):
-                    continue
-                ip = ethernet.data
-                if not isinstance(ip.data, dpkt.icmp.ICMP):
-                    continue
-
-                icmp = ip.data
-                src_ip = socket.inet_ntoa(ip.src)
-                dst_ip = socket.inet_ntoa(ip.dst)
-                this_ip = get_valid_ip(src_ip, dst_ip, m_idx)
-                # mark the timestamp of the icmp packet
-                shown_ip_set.add(this_ip)
-                read_count += 1
-                if read_count % 100000 == 0:
-                    print(f"{read_count} packets have been read.")
+        local_ips = (HOSTS[m_idx]['public_ip'], HOSTS[m_idx]['private_ip'])
+        events, stats = read_icmp_events(os.path.join(OUTPUT_DIR, HOSTS[m_idx]['local_path']), local_ips)
+        print(f"[{HOSTS[m_idx]['public_ip']}] {stats}")
+        bad_count += stats["bad"]
+        shown_peers.append(np.unique(events["peer"]))
+    shown_ip_set = {int_to_ip(peer) for peer in np.unique(np.concatenate(shown_peers)).tolist()} if shown_peers else set()
     print("Bad packets:", bad_count)
     print("Finished reading pcap files.")
     # intersection the icmp timestamp with time_list duration 
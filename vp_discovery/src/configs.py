@@ -76,6 +76,51 @@ TEXT_LEN_MIN_THRESHOLD = 10  # The threshold of the text length, remove the text
 CORPUS_THRESHOLD = 0.4  # The threshold of the Jaccard similarity for clustering
 STRUC_THRESHOLD = 0.8  # The threshold of the Jaccard similarity for clustering
 
+# ====================== Template Configs ====================== #
+CLUSTER_PLAN_ENABLED = True  # Learn an extraction plan per cluster, parse the other members by the plan
+CLUSTER_PLAN_SAMPLES = 3  # Representatives fully parsed per cluster, they must agree on the template
+MARK_WORKERS = os.cpu_count()  # Processes parsing the LG pages
+MARK_CHUNK_SIZE = 256  # Max pages of one cluster in one task, large clusters are split for load balance
+GEO_BATCH_SIZE = 1024  # VPs geolocated in one reverse_geocoder query
+
+# ====================== Hyperglass Configs ====================== #
+# Endpoints returning the UI config, relative to the LG page, tried when __NEXT_DATA__ is missing
+HYPERGLASS_CONFIG_PATHS = ["api/config", "ui/props/"]
+HYPERGLASS_BROWSER_MAX_PAGES = 50  # Pages parsed by one browser before it is restarted
+HYPERGLASS_LOAD_TIMEOUT = 15  # Seconds to load a page
+HYPERGLASS_RENDER_TIMEOUT = 10  # Seconds for the UI to be rendered after the page is loaded
+HYPERGLASS_WAIT_TIMEOUT = 3  # Seconds for a menu or a selection to be updated after a click
+
+# ====================== Ping Campaign Configs ====================== #
+PING_CONCURRENCY = 64  # Max LG requests in flight
+PING_SITE_CONCURRENCY = 2  # Max requests in flight to one LG site (hostname)
+PING_INGRESS_TOLERANCE = 1  # Seconds before the send time in which the ICMP packets may arrive at the host
+PING_EGRESS_TOLERANCE = 2  # Min seconds of a window from the send time, short responses may precede the pings
+PING_HOST_GUARD = 0.1  # Extra seconds between the windows (with tolerances) of two requests at the same host
+PING_LOG_FILE = "ping_campaign_log.jsonl"  # Send / response / end timestamps of every request
+PING_PLAN_ENABLED = True  # Ping in the time slots of the polynomial design of ping_planner.py
+PING_PLAN_DEGREE = 2  # Two VPs share a slot on at most DEGREE - 1 hosts, needs more than DEGREE hosts
+PING_PLAN_FILE = "ping_plan.json"
+PING_SLOT_GAP = 3  # Seconds between two rounds, covers the ingress (1s) and egress (2s) tolerances
+
+# ====================== Pcap Configs ====================== #
+PCAP_CHUNK_SIZE = 16 * 1024 * 1024  # Bytes of the capture decoded at once
+
+# ====================== SSH Configs ====================== #
+SSH_CONNECT_TIMEOUT = 10  # Seconds of the TCP connect, banner and authentication
+SSH_COMMAND_TIMEOUT = 30  # Seconds of a remote command run by the host manager
+SSH_CONNECT_RETRY = 2  # Extra connect attempts of a host before it is reported as failed
+SSH_KEEPALIVE = 10  # Seconds between two keepalive packets of a connection
+SSH_MAX_WORKERS = 32  # Hosts connected / commanded at once
+
+# ====================== Live Capture Configs ====================== #
+LIVE_SNAPLEN = 64  # Bytes kept of each packet, covers the Ethernet (+ VLAN) and IPv4 headers
+LIVE_RECV_SIZE = 65536  # Bytes read from the SSH channel at once
+LIVE_PID_PATH = "/tmp/glassminer_live_{m_idx}.pid"  # PID file of the remote tcpdump
+LIVE_ATTRIBUTE_LAG = 5  # Seconds after the end of a window before it is joined, covers the capture delay
+LIVE_REPORT_INTERVAL = 30  # Seconds between two attributions during the campaign
+LIVE_RESULT_FILE = "live_vp_ips.json"  # lg_idx -> IP attributed during the campaign
+
 # Define the info of the self-controlled hosts
 HOSTS = [
     {
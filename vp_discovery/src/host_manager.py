@@ -0,0 +1,202 @@
+# Concurrent management of the measurement hosts over SSH.
+# 1. All hosts are connected at once by a thread pool, with SSH_CONNECT_RETRY retries per host.
+# 2. One SSH connection per host is kept for the whole campaign, every command opens a channel on it, and a
+#    dead connection is reconnected before the next command.
+# 3. Commands (or any function of a client, e.g. start_tcpdump) run on all hosts in parallel; the latency of
+#    every command and health probe is recorded in the metrics of the host.
+# Usage: python host_manager.py            (health of the hosts in HOSTS)
+#        python host_manager.py --mock 16  (self-check against 16 in-process mock SSH servers, see mock_ssh_server.py)
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from configs import *
+from utils import CustomSSHClient, ensure_connected
+
+class HostManager:
+    def __init__(self, hosts=HOSTS, max_workers=SSH_MAX_WORKERS):
+        self.hosts = hosts
+        self.clients = [None] * len(hosts)
+        self.locks = [threading.Lock() for _ in hosts]
+        self.metrics = [{
+            "connected": False,
+            "connect_time": None,  # Seconds of the last successful connect
+            "connects": 0,
+            "commands": 0,
+            "failures": 0,
+            "latency_last": None,  # Seconds of the last command / probe
+            "latency_mean": None,
+            "latency_max": None,
+            "last_error": None,
+        } for _ in hosts]
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts))))
+
+    def _label(self, m_idx: int) -> str:
+        return self.hosts[m_idx]["public_ip"]
+
+    def _connect_one(self, m_idx: int, retry=SSH_CONNECT_RETRY) -> CustomSSHClient:
+        host = self.hosts[m_idx]
+        metrics = self.metrics[m_idx]
+        for attempt in range(retry + 1):
+            start_time = time.time()
+            try:
+                client = CustomSSHClient(host["public_ip"], host["username"], host.get("port", 22), host.get("passwd", None))
+            except Exception as e:
+                metrics["last_error"] = str(e) or type(e).__name__
+                if attempt == retry:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            metrics["connect_time"] = time.time() - start_time
+            metrics["connects"] += 1
+            metrics["connected"] = True
+            return client
+
+    def client(self, m_idx: int) -> CustomSSHClient:
+        """
+        The connection of the host, connected or reconnected if needed.
+        """
+        with self.locks[m_idx]:
+            client = self.clients[m_idx]
+            try:
+                if client is None:
+                    self.clients[m_idx] = client = self._connect_one(m_idx)
+                elif not client.is_alive():
+                    ensure_connected(client)
+                    self.metrics[m_idx]["connects"] += 1
+            except Exception:
+                self.metrics[m_idx]["connected"] = False
+                raise
+            return client
+
+    def connect_all(self, required=True) -> list:
+        """
+        Connect all the hosts at once, returns the indexes of the failed hosts.
+        With required, any failure closes the connections and raises.
+        """
+        start_time = time.time()
+        results = list(self.executor.map(self._try_client, range(len(self.hosts))))
+        failed = [m_idx for m_idx, error in enumerate(results) if error is not None]
+        print(f"Connected {len(self.hosts) - len(failed)}/{len(self.hosts)} hosts in {time.time() - start_time:.2f}s.")
+        for m_idx in failed:
+            print(f"[{self._label(m_idx)}] Connect failed: {results[m_idx]}")
+        if failed and required:
+            self.close_all()
+            raise ConnectionError(f"{len(failed)} hosts failed to connect")
+        return failed
+
+    def _try_client(self, m_idx: int):
+        try:
+            self.client(m_idx)
+        except Exception as e:
+            return e
+        return None
+
+    def _record(self, m_idx: int, latency: float, error=None):
+        metrics = self.metrics[m_idx]
+        with self.locks[m_idx]:
+            metrics["commands"] += 1
+            if error is not None:
+                metrics["failures"] += 1
+                metrics["last_error"] = str(error) or type(error).__name__
+                return
+            metrics["latency_last"] = latency
+            num_ok = metrics["commands"] - metrics["failures"]
+            mean = metrics["latency_mean"] or 0.0
+            metrics["latency_mean"] = mean + (latency - mean) / num_ok
+            metrics["latency_max"] = max(metrics["latency_max"] or 0.0, latency)
+
+    def run(self, m_idx: int, cmd: str, stdin_data: str = None, timeout=SSH_COMMAND_TIMEOUT):
+        """
+        Run one command on the host, returns (exit status, stdout, stderr).
+        """
+        start_time = time.time()
+        try:
+            stdin, stdout, stderr = self.client(m_idx).exec_command(cmd, timeout=timeout)
+            if stdin_data is not None:
+                stdin.write(stdin_data)
+                stdin.flush()
+            stdin.channel.shutdown_write()
+            out = stdout.read().decode(errors="ignore")
+            err = stderr.read().decode(errors="ignore")
+            exit_status = stdout.channel.recv_exit_status()
+        except Exception as e:
+            self._record(m_idx, time.time() - start_time, e)
+            raise
+        self._record(m_idx, time.time() - start_time)
+        return exit_status, out, err
+
+    def run_all(self, cmd, stdin_data: str = None, timeout=SSH_COMMAND_TIMEOUT) -> list:
+        """
+        Run a command on all the hosts in parallel, cmd is a string or a function (m_idx, host) -> string.
+        Returns the results in the order of the hosts, the exception of a failed host in its place.
+        """
+        def run_one(m_idx):
+            host_cmd = cmd(m_idx, self.hosts[m_idx]) if callable(cmd) else cmd
+            return self.run(m_idx, host_cmd, stdin_data, timeout)
+        return self.map(lambda m_idx, client: run_one(m_idx))
+
+    def map(self, func, raise_error=False) -> list:
+        """
+        func(m_idx, client) on all the hosts in parallel, results in the order of the hosts.
+        A failed host gives its exception, or raises it with raise_error.
+        """
+        def call_one(m_idx):
+            try:
+                return func(m_idx, self.client(m_idx))
+            except Exception as e:
+                if raise_error:
+                    raise
+                print(f"[{self._label(m_idx)}] {type(e).__name__}: {e}")
+                return e
+        return list(self.executor.map(call_one, range(len(self.hosts))))
+
+    def check_health(self, timeout=SSH_CONNECT_TIMEOUT) -> list:
+        """
+        Probe all the hosts by a no-op command, returns the metrics with the result of the probe.
+        """
+        results = self.run_all("echo ok", timeout=timeout)
+        for metrics, result in zip(self.metrics, results):
+            metrics["healthy"] = not isinstance(result, Exception) and result[0] == 0 and result[1].strip() == "ok"
+            if isinstance(result, Exception):
+                metrics["connected"] = False
+        return self.metrics
+
+    def report(self):
+        print('----------------------')
+        for m_idx, metrics in enumerate(self.metrics):
+            latency = f"{metrics['latency_mean'] * 1000:.1f}ms" if metrics["latency_mean"] is not None else "-"
+            print(f"[{self._label(m_idx)}] healthy: {metrics.get('healthy')}, connects: {metrics['connects']}, "
+                  f"commands: {metrics['commands']}, failures: {metrics['failures']}, latency: {latency}, "
+                  f"last error: {metrics['last_error']}")
+
+    def close_all(self):
+        for m_idx, client in enumerate(self.clients):
+            if client is not None:
+                client.close()
+                self.clients[m_idx] = None
+                self.metrics[m_idx]["connected"] = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close_all()
+        self.executor.shutdown(wait=False)
+
+if __name__ == "__main__":
+    hosts, mock_hosts = HOSTS, []
+    if len(sys.argv) > 2 and sys.argv[1] == "--mock":
+        from mock_ssh_server import start_mock_hosts
+        mock_hosts, hosts = start_mock_hosts(int(sys.argv[2]), latency=0.2)
+    start_time = time.time()
+    with HostManager(hosts) as manager:
+        manager.connect_all(required=False)
+        manager.check_health()
+        results = manager.run_all("sleep 1; echo done")
+        print(f"Parallel command on {len(hosts)} hosts: {sum(not isinstance(r, Exception) and r[0] == 0 for r in results)} succeeded.")
+        manager.report()
+    print(f"Total {time.time() - start_time:.2f}s.")
+    for mock_host in mock_hosts:
+        mock_host.stop()
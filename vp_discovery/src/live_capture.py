@@ -0,0 +1,177 @@
+# Live capture of the ICMP packets at the measurement hosts, instead of tcpdump to a remote file + SCP afterwards.
+# 1. tcpdump writes the pcap to stdout (-w -) over the SSH channel, only the first LIVE_SNAPLEN bytes of each
+#    packet are kept (the headers up to IPv4), and the stream is decoded incrementally by PcapICMPDecoder.
+# 2. The stream is also saved to the local_path of the host, 4_crosscheck_vps.py / 6_final_check.py still work.
+# 3. LiveAttributor joins the windows of the finished requests with the events as they arrive, so the IPs of
+#    the VPs are attributed (and written to LIVE_RESULT_FILE) during the campaign.
+import json
+import shlex
+import threading
+import time
+
+import numpy as np
+
+from configs import *
+from utils import CustomSSHClient, find_capture_device, stop_tcpdump
+from pcap_decoder import PcapICMPDecoder, ICMP_EVENT_DTYPE, join_windows, attribute_candidates, resolve_vp_ips
+
+class LiveCapture:
+    """
+    tcpdump -w - on one host, read from the SSH channel by a thread.
+    on_events(m_idx, events) is called with the ICMP events of every piece received.
+    """
+    def __init__(self, client: CustomSSHClient, m_idx: int, host: dict, on_events=None, local_path=None):
+        self.client = client
+        self.m_idx = m_idx
+        self.host = host
+        self.on_events = on_events
+        self.local_path = local_path
+        self.decoder = PcapICMPDecoder((host['public_ip'], host['private_ip']))
+        self.pid_path = LIVE_PID_PATH.format(m_idx=m_idx)
+        self.channel = None
+        self.thread = None
+        self.pid = None
+        self.bytes_received = 0
+        self.error = None
+
+    def start(self):
+        device = find_capture_device(self.client, self.host['public_ip'], self.host['private_ip'])
+        pid_q = shlex.quote(self.pid_path)
+        # The shell writes its PID then becomes tcpdump, so stop_tcpdump can kill it like the file capture
+        capture = f"echo $$ > {pid_q}; exec tcpdump -U -n -s {LIVE_SNAPLEN} -i {device} -w - icmp 2>/dev/null"
+        if self.client.need_password:
+            cmd = f"echo {self.client.password} | sudo -S sh -c {shlex.quote(capture)}"
+        else:
+            cmd = f"sudo -n sh -c {shlex.quote(capture)}"
+        self.channel = self.client.get_transport().open_session()
+        self.channel.exec_command(cmd)
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+        self.pid = self._read_pid()
+        return self.pid
+
+    def _read_pid(self, retry=10) -> str:
+        for _ in range(retry):
+            _, stdout, _ = self.client.exec_command(f"cat {shlex.quote(self.pid_path)} 2>/dev/null")
+            pid = stdout.read().decode().strip()
+            if pid.isdigit():
+                return pid
+            time.sleep(0.5)
+        raise RuntimeError(f"[{self.host['public_ip']}] Live capture did not start")
+
+    def _read_loop(self):
+        local_file = open(self.local_path, "wb") if self.local_path else None
+        try:
+            while True:
+                data = self.channel.recv(LIVE_RECV_SIZE)
+                if not data:
+                    break
+                self.bytes_received += len(data)
+                if local_file is not None:
+                    local_file.write(data)
+                events = self.decoder.feed(data)
+                if len(events) and self.on_events is not None:
+                    self.on_events(self.m_idx, events)
+        except Exception as e:
+            self.error = e
+            print(f"[{self.host['public_ip']}] Live capture failed: {e}")
+        finally:
+            if local_file is not None:
+                local_file.close()
+
+    def stop(self, timeout=10):
+        """
+        Stop tcpdump, and wait for the rest of the stream.
+        """
+        if self.pid is not None:
+            stop_tcpdump(self.client, self.pid)
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.channel is not None:
+            self.channel.close()
+        print(f"[{self.host['public_ip']}] Live capture stopped, {self.bytes_received} bytes received, {self.decoder.stats}")
+
+class LiveAttributor:
+    """
+    Incremental crosscheck of 4_crosscheck_vps.py. A window is joined with the events of its host once closed,
+    i.e. LIVE_ATTRIBUTE_LAG seconds after its end, and its (VP, peer) pairs are kept for the attributions.
+    """
+    def __init__(self, vp_num: int, num_hosts: int, threshold: float):
+        self.vp_num = vp_num
+        self.num_hosts = num_hosts
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.new_events = [[] for _ in range(num_hosts)]
+        self.events = [np.empty(0, dtype=ICMP_EVENT_DTYPE) for _ in range(num_hosts)]
+        self.open_windows = [[] for _ in range(num_hosts)]
+        self.host_pairs = [[] for _ in range(num_hosts)]
+        self.num_joined = 0
+        self.reporter = None
+        self.stop_event = threading.Event()
+
+    def add_events(self, m_idx: int, events: np.ndarray):
+        with self.lock:
+            self.new_events[m_idx].append(events)
+
+    def add_window(self, m_idx: int, lg_idx: int, start: float, end: float):
+        with self.lock:
+            self.open_windows[m_idx].append((lg_idx, start, end))
+
+    def update(self, watermark=None) -> int:
+        """
+        Join the windows closed before the watermark (now - LIVE_ATTRIBUTE_LAG by default), returns their number.
+        """
+        if watermark is None:
+            watermark = time.time() - LIVE_ATTRIBUTE_LAG
+        num_joined = 0
+        for m_idx in range(self.num_hosts):
+            with self.lock:
+                new_events, self.new_events[m_idx] = self.new_events[m_idx], []
+                closed = [window for window in self.open_windows[m_idx] if window[2] < watermark]
+                self.open_windows[m_idx] = [window for window in self.open_windows[m_idx] if window[2] >= watermark]
+            if new_events:
+                # The stream is in capture order, the stable sort is cheap on the nearly sorted events
+                events = np.concatenate([self.events[m_idx]] + new_events)
+                self.events[m_idx] = events[np.argsort(events["ts"], kind="stable")]
+            if not closed:
+                continue
+            lg_idx = np.array([window[0] for window in closed], dtype=np.int64)
+            starts = np.array([window[1] for window in closed], dtype=np.float64)
+            ends = np.array([window[2] for window in closed], dtype=np.float64)
+            window_idx, peers = join_windows(self.events[m_idx], starts, ends)
+            self.host_pairs[m_idx].append((lg_idx[window_idx], peers))
+            num_joined += len(closed)
+        self.num_joined += num_joined
+        return num_joined
+
+    def attribute(self):
+        """
+        {vp index: IP} from the windows joined so far, and the background noise IPs.
+        """
+        host_pairs = []
+        for pairs in self.host_pairs:
+            if pairs:
+                host_pairs.append((np.concatenate([p[0] for p in pairs]), np.concatenate([p[1] for p in pairs])))
+        candidates = attribute_candidates(host_pairs, self.num_hosts, self.threshold)
+        return resolve_vp_ips(*candidates, self.vp_num)
+
+    def report(self, output_path=None, watermark=None) -> dict:
+        self.update(watermark)
+        dict_vp_ip, set_noise_ip = self.attribute()
+        print(f"Live attribution: {self.num_joined} windows joined, {len(dict_vp_ip)} VPs found, {len(set_noise_ip)} noise IPs.")
+        if output_path is not None:
+            with open(output_path, "w") as f:
+                json.dump(dict_vp_ip, f, indent=2)
+        return dict_vp_ip
+
+    def start_reporting(self, output_path=None, interval=LIVE_REPORT_INTERVAL):
+        def report_loop():
+            while not self.stop_event.wait(interval):
+                self.report(output_path)
+        self.reporter = threading.Thread(target=report_loop, daemon=True)
+        self.reporter.start()
+
+    def stop_reporting(self):
+        self.stop_event.set()
+        if self.reporter is not None:
+            self.reporter.join()
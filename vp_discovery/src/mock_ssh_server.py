@@ -0,0 +1,169 @@
+# In-process stand-in of the measurement hosts, paramiko SSH servers on localhost for the host manager self-check.
+# 1. Any username is accepted with the given password (the SSH client has no "none" authentication).
+# 2. Commands are not run by a shell, a few are emulated: "echo ...", "sleep N", "true", "hostname", "sudo -n true",
+#    separated by ";". Other commands exit with 127.
+# 3. Every command waits for the given latency first, so the benefit of the parallel commands is visible.
+# Usage: python mock_ssh_server.py --num-hosts 4 --port 2200  (serve until Ctrl-C)
+import argparse
+import shlex
+import socket
+import threading
+import time
+
+import paramiko
+
+from configs import *
+
+# The reply to an exec request is sent after check_channel_exec_request returns, an answer closing the channel
+# before that reply makes the client fail with "Channel closed", so the answer waits at least this long
+EXEC_REPLY_DELAY = 0.05
+
+_HOST_KEY = None
+_HOST_KEY_LOCK = threading.Lock()
+
+def get_host_key() -> paramiko.RSAKey:
+    # One key for all the mock hosts, the generation is slow
+    global _HOST_KEY
+    with _HOST_KEY_LOCK:
+        if _HOST_KEY is None:
+            _HOST_KEY = paramiko.RSAKey.generate(2048)
+        return _HOST_KEY
+
+def emulate_command(command: str, hostname: str):
+    """
+    Returns (exit status, stdout) of the emulated command.
+    """
+    output = []
+    for part in command.split(";"):
+        args = shlex.split(part)
+        if not args:
+            continue
+        if args[0] == "echo":
+            output.append(" ".join(args[1:]) + "\n")
+        elif args[0] == "sleep" and len(args) == 2:
+            time.sleep(float(args[1]))
+        elif args[0] == "hostname":
+            output.append(hostname + "\n")
+        elif args in (["true"], ["sudo", "-n", "true"]):
+            continue
+        else:
+            return 127, "".join(output)
+    return 0, "".join(output)
+
+class MockSSHInterface(paramiko.ServerInterface):
+    def __init__(self, mock_host):
+        self.mock_host = mock_host
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if password == self.mock_host.password else paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_FAILED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.mock_host.handle_exec, args=(channel, command.decode(errors="ignore")), daemon=True).start()
+        return True
+
+class MockSSHHost:
+    """
+    One mock host listening on 127.0.0.1:port, port 0 picks a free one.
+    """
+    def __init__(self, port=0, password="mock", latency=0.0, name="mock"):
+        self.password = password
+        self.latency = latency
+        self.name = name
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        self.stats = {"connections": 0, "commands": 0}
+        self.running = True
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(get_host_key())
+            try:
+                transport.start_server(server=MockSSHInterface(self))
+            except (paramiko.SSHException, EOFError):
+                transport.close()
+                continue
+            self.transports.append(transport)
+            self.stats["connections"] += 1
+
+    def handle_exec(self, channel, command: str):
+        self.stats["commands"] += 1
+        try:
+            time.sleep(max(self.latency, EXEC_REPLY_DELAY))
+            exit_status, output = emulate_command(command, self.name)
+            channel.sendall(output.encode())
+            channel.send_exit_status(exit_status)
+        finally:
+            channel.close()
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
+
+def start_mock_hosts(num_hosts: int, base_port=0, password="mock", latency=0.0):
+    """
+    Start num_hosts mock hosts, returns them and their entries in the format of HOSTS.
+    """
+    get_host_key()
+    mock_hosts, hosts = [], []
+    for m_idx in range(num_hosts):
+        port = base_port + m_idx if base_port else 0
+        mock_host = MockSSHHost(port, password, latency, name=f"mock-{m_idx}").start()
+        mock_hosts.append(mock_host)
+        host = {
+            "public_ip": "127.0.0.1",
+            "private_ip": "127.0.0.1",
+            "username": "mock",
+            "port": mock_host.port,
+            "pcap_path": f"/tmp/{m_idx}_receive.pcap",
+            "local_path": f"{m_idx}_receive.pcap",
+            "passwd": password,
+        }
+        hosts.append(host)
+    return mock_hosts, hosts
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock SSH measurement hosts.")
+    parser.add_argument("--num-hosts", type=int, default=4)
+    parser.add_argument("--port", type=int, default=2200, help="Port of the first host, the others follow")
+    parser.add_argument("--password", default="mock", help="Password of the hosts")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every command is answered")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    mock_hosts, hosts = start_mock_hosts(args.num_hosts, args.port, args.password, args.latency)
+    for host in hosts:
+        print(f"Mock host on 127.0.0.1:{host['port']}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for mock_host in mock_hosts:
+            mock_host.stop()
@@ -0,0 +1,225 @@
+# Streaming decoder of the tcpdump captures into NumPy arrays, and the window joins of the crosscheck.
+# 1. The pcap is read by chunks, only the record offsets are found in Python, every field (timestamp, IPv4
+#    src / dst, protocol) is then read for the whole chunk at once by NumPy indexing.
+# 2. Link types: Ethernet (1, with 802.1Q tags), Linux cooked capture (113) and raw IP (101),
+#    with micro- or nanosecond timestamps in either byte order.
+# 3. ICMP events are kept as a structured array (ts, peer), peer is the IPv4 of the other side as uint32.
+# 4. The windows of all VPs are joined with the events by searchsorted, no per-VP Python scan.
+import ipaddress
+import struct
+
+import numpy as np
+
+from configs import *
+
+ICMP_EVENT_DTYPE = np.dtype([("ts", "f8"), ("peer", "u4")])
+
+# Magic number -> (byte order, timestamp fraction unit)
+PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+IP_PROTO_ICMP = 1
+
+def ip_to_int(ip_addr: str) -> int:
+    return int(ipaddress.IPv4Address(ip_addr))
+
+def int_to_ip(value: int) -> str:
+    return str(ipaddress.IPv4Address(int(value)))
+
+def _read_u16_be(data: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    return (data[idx].astype(np.uint32) << 8) | data[idx + 1]
+
+def _read_u32(data: np.ndarray, idx: np.ndarray, byte_order: str) -> np.ndarray:
+    b = [data[idx + k].astype(np.uint32) for k in range(4)]
+    if byte_order == ">":
+        return (b[0] << 24) | (b[1] << 16) | (b[2] << 8) | b[3]
+    return (b[3] << 24) | (b[2] << 16) | (b[1] << 8) | b[0]
+
+class PcapICMPDecoder:
+    """
+    Incremental decoder, feed() takes any piece of the capture (file chunks, or a live stream) and returns
+    the ICMP events of the complete records in it.
+    """
+    def __init__(self, local_ips=()):
+        self.local_ips = np.array([ip_to_int(ip) for ip in local_ips if ip], dtype=np.uint32)
+        self.buffer = b""
+        self.byte_order = None
+        self.frac_unit = None
+        self.linktype = None
+        self.stats = {"packets": 0, "ipv4": 0, "icmp": 0, "bad": 0}
+
+    def _parse_global_header(self) -> bool:
+        if len(self.buffer) < 24:
+            return False
+        magic = self.buffer[:4]
+        if magic not in PCAP_MAGIC:
+            raise ValueError(f"Not a pcap file, magic {magic.hex()}")
+        self.byte_order, self.frac_unit = PCAP_MAGIC[magic]
+        self.linktype = struct.unpack_from(self.byte_order + "I", self.buffer, 20)[0] & 0x0FFFFFFF
+        if self.linktype not in (LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL):
+            raise ValueError(f"Unsupported link type {self.linktype}")
+        self.buffer = self.buffer[24:]
+        return True
+
+    def _record_offsets(self):
+        """
+        Offsets of the complete records in the buffer, the rest is kept for the next feed.
+        """
+        buffer = self.buffer
+        unpack_incl = struct.Struct(self.byte_order + "I").unpack_from
+        offsets, incl_lens = [], []
+        pos, size = 0, len(buffer)
+        while pos + 16 <= size:
+            incl_len = unpack_incl(buffer, pos + 8)[0]
+            if pos + 16 + incl_len > size:
+                break
+            offsets.append(pos)
+            incl_lens.append(incl_len)
+            pos += 16 + incl_len
+        return np.array(offsets, dtype=np.int64), np.array(incl_lens, dtype=np.int64), pos
+
+    def feed(self, data: bytes) -> np.ndarray:
+        self.buffer += data
+        if self.byte_order is None and not self._parse_global_header():
+            return np.empty(0, dtype=ICMP_EVENT_DTYPE)
+        offsets, incl_lens, consumed = self._record_offsets()
+        # Pad the buffer so that reading the fixed headers never goes out of bounds
+        data = np.frombuffer(self.buffer[:consumed] + b"\x00" * 64, dtype=np.uint8)
+        self.buffer = self.buffer[consumed:]
+        self.stats["packets"] += len(offsets)
+        if len(offsets) == 0:
+            return np.empty(0, dtype=ICMP_EVENT_DTYPE)
+
+        ts = _read_u32(data, offsets, self.byte_order) + _read_u32(data, offsets + 4, self.byte_order) * self.frac_unit
+        start = offsets + 16
+        # Offset of the IPv4 header in the packet, and whether the link layer carries IPv4
+        if self.linktype == LINKTYPE_ETHERNET:
+            ethertype = _read_u16_be(data, start + 12)
+            is_vlan = np.isin(ethertype, ETHERTYPE_VLAN)
+            l2_len = np.where(is_vlan, 18, 14)
+            ethertype = np.where(is_vlan, _read_u16_be(data, start + 16), ethertype)
+            is_ipv4 = ethertype == ETHERTYPE_IPV4
+        elif self.linktype == LINKTYPE_LINUX_SLL:
+            l2_len = np.full(len(offsets), 16)
+            is_ipv4 = _read_u16_be(data, start + 14) == ETHERTYPE_IPV4
+        else:
+            l2_len = np.zeros(len(offsets), dtype=np.int64)
+            is_ipv4 = np.ones(len(offsets), dtype=bool)
+        # Truncated packets without a complete IPv4 header are bad
+        is_complete = incl_lens >= l2_len + 20
+        self.stats["bad"] += int((~is_complete).sum())
+        ip_start = np.where(is_complete, start + l2_len, 0)
+        is_ipv4 &= is_complete & ((data[ip_start] >> 4) == 4)
+        self.stats["ipv4"] += int(is_ipv4.sum())
+        is_icmp = is_ipv4 & (data[ip_start + 9] == IP_PROTO_ICMP)
+        self.stats["icmp"] += int(is_icmp.sum())
+
+        ip_start = ip_start[is_icmp]
+        src = _read_u32(data, ip_start + 12, ">")
+        dst = _read_u32(data, ip_start + 16, ">")
+        events = np.empty(len(ip_start), dtype=ICMP_EVENT_DTYPE)
+        events["ts"] = ts[is_icmp]
+        # The peer is the side that is not the measurement host
+        events["peer"] = np.where(np.isin(src, self.local_ips), dst, src)
+        return events
+
+def read_icmp_events(pcap_path: str, local_ips=(), chunk_size=PCAP_CHUNK_SIZE):
+    """
+    ICMP events of a capture sorted by time, and the decoder stats.
+    """
+    decoder = PcapICMPDecoder(local_ips)
+    chunks = []
+    with open(pcap_path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            chunks.append(decoder.feed(data))
+    events = np.concatenate(chunks) if chunks else np.empty(0, dtype=ICMP_EVENT_DTYPE)
+    events = events[np.argsort(events["ts"], kind="stable")]
+    return events, decoder.stats
+
+def join_windows(events: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+    """
+    All the distinct (window index, peer) pairs with an event in start < ts < end, events sorted by ts.
+    """
+    lo = np.searchsorted(events["ts"], starts, side="right")
+    hi = np.searchsorted(events["ts"], ends, side="left")
+    counts = np.maximum(hi - lo, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint32)
+    window_idx = np.repeat(np.arange(len(starts)), counts)
+    # Index of every event in its window: lo of the window + rank inside the window
+    rank = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    peers = events["peer"][np.repeat(lo, counts) + rank]
+    pairs = np.unique((window_idx.astype(np.uint64) << np.uint64(32)) | peers.astype(np.uint64))
+    return (pairs >> np.uint64(32)).astype(np.int64), (pairs & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+def load_send_windows(m_idx: int, vp_num: int, output_dir=OUTPUT_DIR):
+    """
+    The (start, end) windows of the VPs at one host from {m_idx}_send.txt, as two arrays.
+    """
+    times = np.loadtxt(os.path.join(output_dir, f'{m_idx}_send.txt'), dtype=np.float64, ndmin=1)
+    return times[0:2 * vp_num:2], times[1:2 * vp_num:2]
+
+def attribute_candidates(host_pairs: list, num_hosts: int, threshold: float):
+    """
+    Candidate IPs of each VP from the (vp index, peer) pairs of every host.
+    An IP is an intersection candidate of a VP if it shows up in the windows of the VP at all hosts,
+    and a threshold candidate if at no less than max(2, threshold) hosts.
+    Returns the two candidate dicts {vp index: set of IP}, and the number of (host, VP) windows of each IP.
+    """
+    vp_idx = np.concatenate([pairs[0] for pairs in host_pairs]) if host_pairs else np.empty(0, dtype=np.int64)
+    peers = np.concatenate([pairs[1] for pairs in host_pairs]) if host_pairs else np.empty(0, dtype=np.uint32)
+    keys, show_up_count = np.unique((vp_idx.astype(np.uint64) << np.uint64(32)) | peers.astype(np.uint64), return_counts=True)
+    key_vp = (keys >> np.uint64(32)).astype(np.int64)
+    key_peer = (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    dict_intersection_candidates = {}
+    dict_threshold_candidates = {}
+    for mask, candidates in ((show_up_count == num_hosts, dict_intersection_candidates),
+                             (show_up_count >= max(2, threshold), dict_threshold_candidates)):
+        for vp, peer in zip(key_vp[mask].tolist(), key_peer[mask].tolist()):
+            candidates.setdefault(vp, set()).add(int_to_ip(peer))
+    total_peers, total_count = np.unique(peers, return_counts=True)
+    dict_total_ip_count = {int_to_ip(peer): int(count) for peer, count in zip(total_peers.tolist(), total_count.tolist())}
+    return dict_intersection_candidates, dict_threshold_candidates, dict_total_ip_count
+
+def get_the_responsive_vps(dict_intersection_candidates, dict_threshold_candidates, set_confirmed_ip):
+    new_lg_dict = {}
+    for lg_idx in dict_intersection_candidates:
+        ip_addr = None
+        intersection_candidates = dict_intersection_candidates[lg_idx] - set_confirmed_ip
+        threshold_candidates = dict_threshold_candidates.get(lg_idx, set()) - set_confirmed_ip
+        if len(intersection_candidates) == 1:
+            ip_addr = intersection_candidates.pop()
+        elif len(threshold_candidates) == 1:
+            ip_addr = threshold_candidates.pop()
+        if ip_addr:
+            set_confirmed_ip.add(ip_addr)
+            new_lg_dict[lg_idx] = ip_addr
+    return new_lg_dict, set_confirmed_ip
+
+def resolve_vp_ips(dict_intersection_candidates, dict_threshold_candidates, dict_total_ip_count, vp_num: int):
+    """
+    Assign the candidate IPs to the VPs, returns {vp index: IP} and the background noise IPs.
+    The noise (IPs in no less than max(2, 0.3 * vp_num) windows) is removed first, then the VPs with a single
+    candidate left are assigned, round by round, an assigned IP is no longer a candidate of the others.
+    """
+    dict_intersection_candidates = {lg_idx: dict_intersection_candidates.get(lg_idx, set()) for lg_idx in range(vp_num)}
+    set_noise_ip = {ip for ip, count in dict_total_ip_count.items() if count >= 0.3 * vp_num and count >= 2}
+    set_confirmed_ip = set(set_noise_ip)
+    dict_vp_ip = {}
+    new_lg_dict, set_confirmed_ip = get_the_responsive_vps(dict_intersection_candidates, dict_threshold_candidates, set_confirmed_ip)
+    while len(new_lg_dict) > 0:
+        dict_vp_ip.update(new_lg_dict)
+        new_lg_dict, set_confirmed_ip = get_the_responsive_vps(dict_intersection_candidates, dict_threshold_candidates, set_confirmed_ip)
+    return dict_vp_ip, set_noise_ip
@@ -0,0 +1,201 @@
+# Asynchronous ping campaign: every LG of the unknown VPs pings every measurement host once.
+# 1. Requests to one LG site are limited to PING_SITE_CONCURRENCY, so that no LG is flooded.
+# 2. Requests targeting one measurement host are sent one at a time, the next one only after the window (with
+#    tolerances) of the previous one is over, so the time windows at one host are disjoint. The windows are
+#    only known once the LG finished its ping, so the spacing follows the actual window length.
+# 3. The send / response / end timestamps of every request are logged, the end is taken after the whole
+#    response is read, i.e. after the LG finished its ping.
+# With a slot plan (ping_planner.py), the tasks run round by round instead, the windows in one round overlap
+# by design and are decoded across hosts, so the host spacing is not applied.
+# count_window_overlaps measures the overlap actually achieved from the windows of the campaign.
+import asyncio
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse, urlencode, parse_qsl
+
+import aiohttp
+import regex as re
+
+from configs import *
+from utils import process_params
+
+PTN_CSRF_TOKEN = re.compile(r'name="csrfToken" value="([a-f0-9]+)"')
+
+def lg_site_of(vp_info) -> str:
+    return urlparse(vp_info["url"]).hostname or vp_info["url"]
+
+class HostSlot:
+    """
+    Serializes the requests targeting one measurement host, so that their windows with tolerances are disjoint.
+    With disjoint=False, the requests are neither serialized nor spaced.
+    """
+    def __init__(self, disjoint=True):
+        self.lock = asyncio.Lock() if disjoint else None
+        self.next_send_time = 0.0
+
+    @asynccontextmanager
+    async def turn(self):
+        if self.lock is None:
+            yield
+            return
+        async with self.lock:
+            delay = self.next_send_time - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            send_time = time.time()
+            try:
+                yield
+            finally:
+                # The request is over (or failed), its window ends at end_time + egress tolerance,
+                # the window of the next one starts ingress tolerance before its send time
+                window_end = window_with_tolerance(send_time, time.time())[1]
+                self.next_send_time = window_end + PING_INGRESS_TOLERANCE + PING_HOST_GUARD
+
+async def ping_one_lg_async(session: aiohttp.ClientSession, vp_info, target_ip, host_slot: HostSlot) -> dict:
+    """
+    Same request as ping_to_one_lg, on the asynchronous session. The CSRF token / redirection is resolved
+    before waiting for the turn of the host, so only the ping request itself is in the time window.
+    """
+    ping_url, query = process_params(vp_info, target_ip)
+    header = BASE_HEADER.copy()
+    header["User-Agent"] = random.choice(USER_AGENT_LIST)
+    method = vp_info["method"]
+    data = None
+    if method == "post":
+        get_resp = await session.get(vp_info["url"], headers=header, allow_redirects=True)
+        async with get_resp:
+            get_text = await get_resp.text(errors="ignore")
+            redirected_url = str(get_resp.url)
+        if 'csrfToken' in vp_info.get("params", {}):
+            get_resp.raise_for_status()
+            m = PTN_CSRF_TOKEN.search(get_text)
+            if m:
+                params_dict = dict(parse_qsl(query))
+                params_dict['csrfToken'] = m.group(1)
+                query = urlencode(params_dict)
+        else:
+            # Looking House type, need redirect to the action URL first
+            ping_url = ping_url.replace(vp_info['url'], redirected_url)
+        header['Content-Type'] = vp_info['content-type']
+        if vp_info['content-type'] == 'application/json':
+            query = json.dumps(dict(parse_qsl(query)))
+        header['Origin'] = vp_info["url"].rstrip('/')
+        header['Referer'] = vp_info["url"] if vp_info["url"].endswith('/') else vp_info["url"] + '/'
+        data = query
+    elif method == "get":
+        ping_url = ping_url + '?' + query
+    else:
+        raise ValueError(f"Unknown method {method}")
+
+    async with host_slot.turn():
+        record = {"send_time": time.time()}
+        async with session.request(method.upper(), ping_url, data=data, headers=header, allow_redirects=True) as response:
+            record["response_time"] = time.time()
+            record["status"] = response.status
+            # Read the whole output, the LG may stream it while pinging
+            async for _ in response.content.iter_chunked(65536):
+                pass
+        record["end_time"] = time.time()
+    return record
+
+def window_with_tolerance(send_time: float, end_time: float):
+    """
+    The window in which the ICMP packets of a request are expected at the host.
+    """
+    egress_tolerance = max(0, PING_EGRESS_TOLERANCE - (end_time - send_time))
+    return send_time - PING_INGRESS_TOLERANCE, end_time + egress_tolerance
+
+def count_window_overlaps(window_list) -> list:
+    """
+    Returns the number of overlapping pairs of windows (with tolerances) at each host.
+    """
+    overlap_counts = []
+    for windows in window_list:
+        intervals = sorted(window_with_tolerance(*window) for window in windows if window is not None)
+        count = 0
+        active_ends = []
+        for start, end in intervals:
+            # Windows sorted by start overlap the current one iff they end after its start
+            active_ends = [active_end for active_end in active_ends if active_end > start]
+            count += len(active_ends)
+            active_ends.append(end)
+        overlap_counts.append(count)
+    return overlap_counts
+
+async def run_ping_campaign(vp_list, hosts=HOSTS, log_path=None, rounds=None, on_window=None) -> list:
+    """
+    Ping every host from every LG, returns the (send_time, end_time) windows as window_list[m_idx][lg_idx].
+    Failed requests keep their send time and the failure time as the window.
+    rounds: the (m_idx, lg_idx) tasks of each time slot by plan_to_rounds, all tasks at once if not given.
+    on_window: called with (m_idx, lg_idx, start, end) of the window with tolerances once a request finishes.
+    """
+    task_params = [(m_idx, lg_idx) for m_idx in range(len(hosts)) for lg_idx in range(len(vp_list))]
+    random.shuffle(task_params)
+    window_list = [[None] * len(vp_list) for _ in hosts]
+    site_semaphores = {}
+    if rounds is None:
+        host_slots = [HostSlot() for _ in hosts]
+    else:
+        host_slots = [HostSlot(disjoint=False) for _ in hosts]
+    global_semaphore = asyncio.Semaphore(PING_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=0, ssl=False)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    finish_count = 0
+    start_time = time.time()
+    log_file = open(log_path, "w") if log_path else None
+
+    async def ping_task(m_idx, lg_idx):
+        nonlocal finish_count
+        vp_info = vp_list[lg_idx]
+        site = lg_site_of(vp_info)
+        site_semaphore = site_semaphores.setdefault(site, asyncio.Semaphore(PING_SITE_CONCURRENCY))
+        async with site_semaphore, global_semaphore:
+            record = {"m_idx": m_idx, "lg_idx": lg_idx, "site": site}
+            task_start = time.time()
+            # Each task has its own cookies (CSRF sessions), the connections are shared
+            async with aiohttp.ClientSession(connector=connector, connector_owner=False, timeout=timeout,
+                                             cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
+                try:
+                    record.update(await ping_one_lg_async(session, vp_info, hosts[m_idx]['public_ip'], host_slots[m_idx]))
+                except Exception as e:
+                    record.setdefault("send_time", task_start)
+                    record["end_time"] = time.time()
+                    record["error"] = str(e) or type(e).__name__
+        window_list[m_idx][lg_idx] = (record["send_time"], record["end_time"])
+        if on_window is not None:
+            on_window(m_idx, lg_idx, *window_with_tolerance(record["send_time"], record["end_time"]))
+        if log_file is not None:
+            log_file.write(json.dumps(record) + "\n")
+        finish_count += 1
+        if finish_count % 500 == 0:
+            print(f"Finish {finish_count} tasks, {len(task_params) - finish_count} tasks left, time elapsed: {time.time() - start_time:.2f}s")
+
+    try:
+        if rounds is None:
+            await asyncio.gather(*(ping_task(m_idx, lg_idx) for m_idx, lg_idx in task_params))
+        else:
+            for round_idx, round_tasks in enumerate(rounds):
+                await asyncio.gather(*(ping_task(m_idx, lg_idx) for m_idx, lg_idx in round_tasks))
+                print(f"Round {round_idx + 1}/{len(rounds)} finished, {len(round_tasks)} tasks.")
+                # Keep the windows (with tolerances) of two rounds disjoint
+                await asyncio.sleep(PING_SLOT_GAP)
+    finally:
+        await connector.close()
+        if log_file is not None:
+            log_file.close()
+    return window_list
+
+def write_send_files(window_list, output_dir=OUTPUT_DIR):
+    """
+    Write the windows with the tolerances to {m_idx}_send.txt, two lines (start, end) per LG.
+    """
+    for m_idx, windows in enumerate(window_list):
+        time_list = []
+        for send_time, end_time in windows:
+            start, end = window_with_tolerance(send_time, end_time)
+            time_list.append(str(start))
+            time_list.append(str(end))
+        with open(os.path.join(output_dir, f'{m_idx}_send.txt'), 'w') as time_file:
+            time_file.writelines('\n'.join(time_list))
@@ -0,0 +1,110 @@
+# Time slot planner of the ping campaign, a polynomial (Reed-Solomon like) design over GF(p).
+# VP i is given a distinct polynomial f_i of degree < d over GF(p), and pings host m in slot f_i(m).
+# Two distinct polynomials agree on at most d - 1 points, so two VPs share a slot on at most d - 1 hosts:
+# an IP seen in the windows of VP i on at least d hosts can only be the IP of VP i (besides noise).
+# The slots run in rounds, all hosts at the same time, with a gap so that the windows of two rounds are disjoint.
+# Usage: python ping_planner.py 5000 3  (plan for 5000 VPs and 3 hosts, print the summary)
+import json
+import random
+import sys
+from collections import Counter
+
+from configs import *
+
+def is_prime(n: int) -> bool:
+    if n < 2:
+        return False
+    i = 2
+    while i * i <= n:
+        if n % i == 0:
+            return False
+        i += 1
+    return True
+
+def next_prime(n: int) -> int:
+    while not is_prime(n):
+        n += 1
+    return n
+
+def choose_field(num_vps: int, num_hosts: int, degree=PING_PLAN_DEGREE) -> int:
+    """
+    The smallest prime p with p >= num_hosts (distinct evaluation points) and p ** degree >= num_vps.
+    Every host has p slots of about num_vps / p VPs each.
+    """
+    p = max(2, num_hosts)
+    while p ** degree < num_vps:
+        p += 1
+    return next_prime(p)
+
+def build_slot_plan(num_vps: int, num_hosts: int, degree=PING_PLAN_DEGREE, seed=0) -> dict:
+    """
+    slots[lg_idx][m_idx] is the slot in which the LG lg_idx pings the host m_idx.
+    The VPs are mapped to the polynomials in a random order, so that the VPs of one LG site are spread.
+    """
+    if degree >= num_hosts:
+        raise ValueError(f"Degree {degree} needs more than {degree} hosts to be decoded, got {num_hosts}")
+    p = choose_field(num_vps, num_hosts, degree)
+    order = list(range(num_vps))
+    random.Random(seed).shuffle(order)
+    slots = [None] * num_vps
+    for poly_idx, lg_idx in enumerate(order):
+        # Coefficients are the base-p digits of the polynomial index
+        coeffs = [(poly_idx // p ** k) % p for k in range(degree)]
+        slots[lg_idx] = [sum(c * pow(m_idx, k, p) for k, c in enumerate(coeffs)) % p for m_idx in range(num_hosts)]
+    return {"prime": p, "degree": degree, "num_hosts": num_hosts, "slots": slots}
+
+def plan_to_rounds(plan: dict) -> list:
+    """
+    The (m_idx, lg_idx) tasks of each slot, slot s of all hosts is one round.
+    """
+    rounds = [[] for _ in range(plan["prime"])]
+    for lg_idx, host_slots in enumerate(plan["slots"]):
+        for m_idx, slot in enumerate(host_slots):
+            rounds[slot].append((m_idx, lg_idx))
+    return [tasks for tasks in rounds if tasks]
+
+def summarize_plan(plan: dict) -> dict:
+    """
+    Size of the design, and the max number of hosts on which two VPs share a slot (checked on a sample).
+    """
+    slots = plan["slots"]
+    occupancy = Counter((m_idx, slot) for host_slots in slots for m_idx, slot in enumerate(host_slots))
+    sample = random.Random(0).sample(range(len(slots)), min(len(slots), 300))
+    max_shared = 0
+    for i in range(len(sample)):
+        for j in range(i + 1, len(sample)):
+            shared = sum(a == b for a, b in zip(slots[sample[i]], slots[sample[j]]))
+            max_shared = max(max_shared, shared)
+    return {
+        "vps": len(slots),
+        "hosts": plan["num_hosts"],
+        "prime": plan["prime"],
+        "degree": plan["degree"],
+        "rounds": len(plan_to_rounds(plan)),
+        "max_vps_per_slot": max(occupancy.values()) if occupancy else 0,
+        "max_shared_hosts": max_shared,
+        "decode_threshold": plan["degree"],
+    }
+
+def save_plan(plan: dict, filepath=os.path.join(OUTPUT_DIR, PING_PLAN_FILE)):
+    with open(filepath, "w") as f:
+        json.dump(plan, f)
+
+def load_plan(filepath=os.path.join(OUTPUT_DIR, PING_PLAN_FILE)):
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, "r") as f:
+        return json.load(f)
+
+def decode_threshold(plan, num_vps: int, num_hosts: int) -> float:
+    """
+    Min number of hosts an IP shows up in the windows of a VP to be its candidate.
+    With the slot plan, two VPs share a window on at most degree - 1 hosts.
+    """
+    if plan is not None and plan["num_hosts"] == num_hosts and len(plan["slots"]) == num_vps:
+        return plan["degree"]
+    return 2 * num_hosts / 3
+
+if __name__ == "__main__":
+    num_vps, num_hosts = int(sys.argv[1]), int(sys.argv[2])
+    print(json.dumps(summarize_plan(build_slot_plan(num_vps, num_hosts)), indent=2))
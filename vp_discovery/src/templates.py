@@ -12,6 +12,8 @@
 # 7. ip_addr: the ipv4 address of the VP
 
 
+from bs4 import SoupStrainer
+
 from configs import *
 from utils import *
 
@@ -447,10 +449,21 @@ def parse_template_hyperglass(soup: BeautifulSoup, url: str = None) -> list:
     # Hyperglass might be in script tags, comments, or attributes not visible in get_text()
     if not re.search(r'hyperglass', str(soup), re.IGNORECASE):
         return None
+    return parse_hyperglass_vps(url, soup=soup)
 
-    # Use the Selenium parser
+def parse_hyperglass_vps(url: str, soup: BeautifulSoup = None, html_text: str = None) -> list:
+    """
+    The VPs of a page already detected as Hyperglass.
+    The config is read from the __NEXT_DATA__ of the downloaded page or the config endpoint,
+    the Selenium parser is only used if both are missing.
+    """
+    next_data = None
+    if soup is not None:
+        script = soup.find('script', id='__NEXT_DATA__')
+        if script is not None:
+            next_data = script.string
     try:
-        hg_data = parse_hyperglass_url(url)
+        hg_data = parse_hyperglass_url(url, html_text=html_text, next_data=next_data)
     except Exception as e:
         print(f"Hyperglass parser failed for {url}: {e}")
         return None
@@ -489,22 +502,277 @@ template_hook_list = [
     parse_template_hyperglass,
 ]
 
-def parse_one_template(soup: BeautifulSoup, url: str):
+PTN_SINGLE_NETWORK = re.compile(r'SingleNetwork')
+HYPERGLASS_MARKER = 'hyperglass'
+
+def extract_template_features(soup: BeautifulSoup) -> dict:
+    """
+    Collect everything the templates are recognized by, in one pass over the soup.
+    """
+    features = {
+        'select': set(),        # names of the select elements
+        'input': set(),         # names of the input elements
+        'button': set(),        # names of the button elements
+        'radio': False,         # any radio input
+        'single_network': False,  # any button with SingleNetwork in onclick
+        'next_data': False,     # the __NEXT_DATA__ script of Next.js
+        'hyperglass': False,    # 'hyperglass' in any tag name, attribute or text
+    }
+    for node in soup.descendants:
+        if isinstance(node, str):
+            if not features['hyperglass'] and HYPERGLASS_MARKER in node.lower():
+                features['hyperglass'] = True
+            continue
+        name = node.get('name')
+        if node.name == 'select':
+            if name:
+                features['select'].add(name)
+        elif node.name == 'input':
+            if name:
+                features['input'].add(name)
+            if node.get('type') == 'radio':
+                features['radio'] = True
+        elif node.name == 'button':
+            if name:
+                features['button'].add(name)
+            onclick = node.get('onclick')
+            if onclick and PTN_SINGLE_NETWORK.search(onclick):
+                features['single_network'] = True
+        elif node.name == 'script' and node.get('id') == '__NEXT_DATA__':
+            features['next_data'] = True
+        if not features['hyperglass']:
+            if HYPERGLASS_MARKER in node.name.lower():
+                features['hyperglass'] = True
+            else:
+                for attr_name, attr_value in node.attrs.items():
+                    attr_value = ' '.join(attr_value) if isinstance(attr_value, list) else str(attr_value)
+                    if HYPERGLASS_MARKER in attr_name.lower() or HYPERGLASS_MARKER in attr_value.lower():
+                        features['hyperglass'] = True
+                        break
+    return features
+
+# Template name -> (parser, the elements the parser needs), in the order of template_hook_list.
+# A page is only given to the parsers whose requirements it meets.
+TEMPLATE_RULES = {
+    'template_1': (parse_template_1, lambda f, url: 'cmd' in f['select'] and 'host' in f['input']),
+    'template_2': (parse_template_2, lambda f, url: f['single_network']),
+    'template_3': (parse_template_3, lambda f, url: {'csrfToken', 'targetHost'} <= f['input'] and 'backendMethod' in f['select'] and 'submitForm' in f['button']),
+    'template_4': (parse_template_4, lambda f, url: {'routers', 'query'} <= f['select']),
+    'template_5': (parse_template_5, lambda f, url: f['radio'] and 'router' in f['select']),
+    'template_6': (parse_template_6, lambda f, url: 'cmd' in f['select'] and 'req' in f['input']),
+    'template_minimum': (parse_template_minimum, lambda f, url: 'test' in f['select'] and 'destination' in f['input']),
+    # Detection is already done by the features, skip the check on the whole source
+    'template_hyperglass': (lambda soup, url: parse_hyperglass_vps(url, soup=soup), lambda f, url: bool(url) and f['hyperglass']),
+}
+
+class TemplateDispatcher:
+    """
+    Route each page straight to its template by the extracted features.
+    Pages of one cluster share the structure, the template found for a cluster is tried first for its other pages
+    that meet its requirements.
+    """
+    def __init__(self, rules=TEMPLATE_RULES):
+        self.rules = rules
+        self.cluster_template = {}
+        self.stats = {name: {'calls': 0, 'hits': 0, 'vps': 0, 'time': 0.0} for name in rules}
+        self.stats['features'] = {'calls': 0, 'time': 0.0}
+        self.stats['cluster_cache'] = {'calls': 0, 'hits': 0}
+        self.stats['no_template'] = {'calls': 0}
+
+    def run_template(self, name: str, soup: BeautifulSoup, url: str) -> list:
+        parser, _ = self.rules[name]
+        stats = self.stats[name]
+        start = time.perf_counter()
+        vp_list = parser(soup, url)
+        stats['time'] += time.perf_counter() - start
+        stats['calls'] += 1
+        if vp_list:
+            stats['hits'] += 1
+            stats['vps'] += len(vp_list)
+        return vp_list
+
+    def dispatch(self, soup: BeautifulSoup, url: str, cluster_id: str = None):
+        """
+        Returns (template name, vp list), the name is None if no template matches.
+        """
+        start = time.perf_counter()
+        features = extract_template_features(soup)
+        self.stats['features']['time'] += time.perf_counter() - start
+        self.stats['features']['calls'] += 1
+
+        # The template of the cluster is tried first, still only if the page meets its requirements
+        cached_name = self.cluster_template.get(cluster_id) if cluster_id is not None else None
+        if cached_name is not None and self.rules[cached_name][1](features, url):
+            self.stats['cluster_cache']['calls'] += 1
+            vp_list = self.run_template(cached_name, soup, url)
+            if vp_list:
+                self.stats['cluster_cache']['hits'] += 1
+                return cached_name, vp_list
+
+        for name, (_, is_candidate) in self.rules.items():
+            if name == cached_name or not is_candidate(features, url):
+                continue
+            vp_list = self.run_template(name, soup, url)
+            if vp_list:
+                if cluster_id is not None:
+                    self.cluster_template[cluster_id] = name
+                return name, vp_list
+        self.stats['no_template']['calls'] += 1
+        return None, []
+
+    def report(self):
+        for name, stats in self.stats.items():
+            line = ', '.join(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}" for key, value in stats.items())
+            print(f"{name}: {line}")
+
+TEMPLATE_DISPATCHER = TemplateDispatcher()
+
+def parse_one_template(soup: BeautifulSoup, url: str, cluster_id: str = None):
     """
     Parse one template from the soup.
     """
-    vp_list_with_url = []
-    for template_hook in template_hook_list:
+    _, vp_list = TEMPLATE_DISPATCHER.dispatch(soup, url, cluster_id)
+    for vp_info in vp_list:
+        vp_info['url'] = url
+    return vp_list
+
+def name_pattern(name: str):
+    return re.compile(r'name\s*=\s*["\']?' + re.escape(name) + r'(?=["\'\s/>])', flags=re.IGNORECASE)
+
+# Patterns every page of a template contains in its source, the cheap check before parsing a cluster member
+TEMPLATE_SIGNATURES = {
+    'template_1': [name_pattern('cmd'), name_pattern('host')],
+    'template_2': [PTN_SINGLE_NETWORK],
+    'template_3': [name_pattern('csrfToken'), name_pattern('targetHost'), name_pattern('backendMethod'), name_pattern('submitForm')],
+    'template_4': [name_pattern('routers'), name_pattern('query')],
+    'template_5': [re.compile(r'type\s*=\s*["\']?radio', flags=re.IGNORECASE), name_pattern('router')],
+    'template_6': [name_pattern('cmd'), name_pattern('req')],
+    'template_minimum': [name_pattern('test'), name_pattern('destination')],
+    'template_hyperglass': [re.compile(HYPERGLASS_MARKER, flags=re.IGNORECASE)],
+}
+# Templates whose parser only reads the form elements, their pages are parsed without the other tags
+FORM_ONLY_TEMPLATES = {'template_3', 'template_4', 'template_6', 'template_minimum'}
+FORM_TAGS = ['form', 'select', 'option', 'input', 'button', 'label']
+
+def plan_field_values(vp_info: dict) -> dict:
+    """
+    The fields of a VP that are expected to be the same for all the pages of one template.
+    """
+    return {
+        'method': vp_info.get('method'),
+        'content-type': vp_info.get('content-type'),
+        'action': vp_info.get('action'),
+        'input': (vp_info.get('input') or {}).get('name'),
+        'command': (vp_info.get('command') or {}).get('name'),
+        'params': tuple(sorted(vp_info.get('params') or {})),
+    }
+
+class ExtractionPlan:
+    """
+    The template of a cluster learnt from its representatives, and the field values they all agree on.
+    Members are checked by the template signature before parsing, and by the field values after.
+    """
+    def __init__(self, template: str, vp_lists: list):
+        self.template = template
+        values = [plan_field_values(vp_info) for vp_list in vp_lists for vp_info in vp_list]
+        self.fields = {key: value for key, value in values[0].items() if all(v[key] == value for v in values)}
+
+    def match_source(self, html_text: str) -> bool:
+        return all(ptn.search(html_text) for ptn in TEMPLATE_SIGNATURES[self.template])
+
+    def validate(self, vp_list: list) -> bool:
+        if not vp_list:
+            return False
+        for vp_info in vp_list:
+            values = plan_field_values(vp_info)
+            if any(values[key] != value for key, value in self.fields.items()):
+                return False
+        return True
+
+    def apply(self, html_text: str, url: str):
+        """
+        The VPs of a member page by the plan, None if the page does not fit the plan.
+        """
+        if not self.match_source(html_text):
+            return None
+        parser, _ = TEMPLATE_RULES[self.template]
+        if self.template == 'template_hyperglass':
+            # The signature already confirms the template, and the VPs come from the page config
+            return parse_hyperglass_vps(url, html_text=html_text) or None
+        if self.template in FORM_ONLY_TEMPLATES:
+            soup = BeautifulSoup(html_text, "html.parser", parse_only=SoupStrainer(FORM_TAGS))
+        else:
+            soup = parse_webpages(html_text)
+            if soup is None:
+                return None
+        vp_list = parser(soup, url)
+        if not self.validate(vp_list):
+            return None
+        return vp_list
+
+class ClusterTemplateInference:
+    """
+    Fully parse the first representatives of each cluster, if they agree on the template the other members
+    are parsed by the learnt ExtractionPlan, and fall back to the dispatcher on mismatch.
+    """
+    def __init__(self, dispatcher=TEMPLATE_DISPATCHER, num_samples=CLUSTER_PLAN_SAMPLES):
+        self.dispatcher = dispatcher
+        self.num_samples = num_samples
+        self.samples = {}
+        self.plans = {}
+        self.stats = {'plans': 0, 'no_plan': 0, 'full_parse': 0, 'plan_hits': 0, 'plan_fallbacks': 0, 'time': 0.0}
+
+    def learn(self, cluster_id: str):
+        samples = self.samples[cluster_id]
+        names = {name for name, _ in samples}
+        if len(names) == 1 and None not in names:
+            self.plans[cluster_id] = ExtractionPlan(samples[0][0], [vp_list for _, vp_list in samples])
+            self.stats['plans'] += 1
+        else:
+            self.stats['no_plan'] += 1
+
+    def parse(self, html_text: str, url: str, cluster_id: str) -> list:
+        start = time.perf_counter()
         try:
-            vp_list = template_hook(soup, url)
-        except TypeError:
-            # Fallback for hooks that don't accept url yet
-            vp_list = template_hook(soup)
-            
-        if vp_list:
+            plan = self.plans.get(cluster_id)
+            if plan is not None:
+                vp_list = plan.apply(html_text, url)
+                if vp_list is not None:
+                    self.stats['plan_hits'] += 1
+                    for vp_info in vp_list:
+                        vp_info['url'] = url
+                    return vp_list
+                self.stats['plan_fallbacks'] += 1
+
+            self.stats['full_parse'] += 1
+            soup = parse_webpages(html_text)
+            if soup is None:
+                return []
+            name, vp_list = self.dispatcher.dispatch(soup, url, cluster_id)
             for vp_info in vp_list:
                 vp_info['url'] = url
-                vp_list_with_url.append(vp_info)
-            return vp_list_with_url
-    return vp_list_with_url
+            samples = self.samples.setdefault(cluster_id, [])
+            if plan is None and len(samples) < self.num_samples:
+                samples.append((name, vp_list))
+                if len(samples) == self.num_samples:
+                    self.learn(cluster_id)
+            return vp_list
+        finally:
+            self.stats['time'] += time.perf_counter() - start
+
+    def get_stats(self) -> dict:
+        return {'dispatcher': self.dispatcher.stats, 'inference': self.stats}
+
+    def merge_stats(self, stats: dict):
+        """
+        Add up the stats of the inference in another process.
+        """
+        for name, values in stats['dispatcher'].items():
+            for key, value in values.items():
+                self.dispatcher.stats[name][key] += value
+        for key, value in stats['inference'].items():
+            self.stats[key] += value
 
+    def report(self):
+        self.dispatcher.report()
+        print(', '.join(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}" for key, value in self.stats.items()))
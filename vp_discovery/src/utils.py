@@ -17,6 +17,9 @@ import reverse_geocoder
 import ipaddress
 import paramiko
 import time
+import threading
+import atexit
+import multiprocessing.util
 from scp import SCPClient
 from typing import Tuple
 from urllib.parse import urlencode, urljoin, parse_qsl
@@ -25,7 +28,7 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException, StaleElementReferenceException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
@@ -71,19 +74,24 @@ class StructuralComparator(SequenceMatcher):
 
 
 class CustomSSHClient(paramiko.SSHClient):
-    def __init__(self, hostname: str, username: str, port: int, password: str = None):
+    def __init__(self, hostname: str, username: str, port: int, password: str = None, timeout=SSH_CONNECT_TIMEOUT):
         super().__init__()
         self.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self.connect(hostname, username=username, port=port, look_for_keys=True)
         self.password = password
         self.port = port
         self.hostname = hostname
         self.username = username
-        self.need_password = password is not None
+        self.timeout = timeout
+        self._connect()
+
+    def _connect(self):
+        # Keys are tried first, the password (if any) is the fallback
+        self.connect(self.hostname, username=self.username, port=self.port, password=self.password,
+                     look_for_keys=True, timeout=self.timeout, banner_timeout=self.timeout, auth_timeout=self.timeout)
         
         # Enable keepalive to prevent connection timeout
         transport = self.get_transport()
-        transport.set_keepalive(10)  # Send keepalive every 30 seconds
+        transport.set_keepalive(SSH_KEEPALIVE)
         
         # execute a dummy sudo command to cache the sudo permission
         stdin, stdout, stderr = self.exec_command("sudo -n true")
@@ -99,8 +107,24 @@ class CustomSSHClient(paramiko.SSHClient):
             if res != 0:
                 raise Exception("Sudo permission denied or incorrect password")
 
-def start_tcpdump(client: CustomSSHClient, pcap_path: str, public_ip: str = None, private_ip: str = None) -> str:
-    # first, need to find the device with the public IP or private IP
+    def is_alive(self) -> bool:
+        transport = self.get_transport()
+        return transport is not None and transport.is_active()
+
+    def reconnect(self):
+        self.close()
+        self._connect()
+
+def ensure_connected(client: CustomSSHClient) -> CustomSSHClient:
+    if not client.is_alive():
+        print(f"Connection to {client.hostname} lost, attempting to reconnect...")
+        client.reconnect()
+    return client
+
+def find_capture_device(client: CustomSSHClient, public_ip: str = None, private_ip: str = None) -> str:
+    """
+    The device with the public IP or private IP of the host.
+    """
     device = None
     cmd = f"ip addr show"
     stdin, stdout, _ = client.exec_command(cmd, get_pty=True)
@@ -115,6 +139,11 @@ def start_tcpdump(client: CustomSSHClient, pcap_path: str, public_ip: str = None
         if ip == public_ip or ip == private_ip:
             device = dev
     print(f"[{client.hostname}] Using device: {device} for tcpdump")
+    return device
+
+def start_tcpdump(client: CustomSSHClient, pcap_path: str, public_ip: str = None, private_ip: str = None) -> str:
+    # first, need to find the device with the public IP or private IP
+    device = find_capture_device(client, public_ip, private_ip)
     
     # Build command using nohup to ensure persistence, with better error handling
     pcap_q = shlex.quote(pcap_path)
@@ -134,12 +163,7 @@ def start_tcpdump(client: CustomSSHClient, pcap_path: str, public_ip: str = None
 def stop_tcpdump(client: CustomSSHClient, pid: str):
     try:
         # Check connection and reconnect if necessary
-        try:
-            client.exec_command("echo test")
-        except:
-            print(f"Connection to {client.hostname} lost, attempting to reconnect...")
-            client.close()
-            client.connect(client.hostname, username=client.username, port=client.port, look_for_keys=True)
+        ensure_connected(client)
         
         # First try to kill the process group if setsid was used
         if client.password:
@@ -535,6 +559,48 @@ def geolocate_one_vp(vp_info):
                 is_hint = True
     return location, is_hint
 
+def raw_coordinate_of_vp(vp_info):
+    """
+    The coordinate of one VP by IP or Geo-Hint before normalization, and whether it comes from the hint.
+    Returns ({}, False) if the VP has neither, (None, is_hint) if it cannot be geolocated.
+    """
+    ip_addr = vp_info["ip_addr"]
+    if ip_addr:
+        try:
+            response = GEOLITE_READER.city(ip_addr)
+        except:
+            return None, False
+        return (response.location.latitude, response.location.longitude), False
+    hint = vp_info["hint"]
+    if not hint:
+        return {}, False
+    geo_info = check_raw_word(hint)
+    if not geo_info:
+        return None, False
+    return geo_info[0], True
+
+def geolocate_vps(vp_list):
+    """
+    Same as geolocate_one_vp for a batch of VPs, with one reverse_geocoder query for all the coordinates.
+    """
+    raw_coords = [raw_coordinate_of_vp(vp_info) for vp_info in vp_list]
+    query_index = [i for i, (coord, _) in enumerate(raw_coords) if isinstance(coord, tuple) and None not in coord]
+    results = []
+    if query_index:
+        try:
+            results = reverse_geocoder.search([raw_coords[i][0] for i in query_index], mode=1)
+        except Exception as e:
+            print(f"Error normalizing {len(query_index)} geolocations: {e}")
+    geo_results = [(coord if coord == {} else None, False) for coord, _ in raw_coords]
+    for i, result in zip(query_index, results):
+        geo_results[i] = ({
+            "country_code": result['cc'],
+            "city": result['name'],
+            "latitude": result['lat'],
+            "longitude": result['lon'],
+        }, raw_coords[i][1])
+    return geo_results
+
 BOGON_NETWORKS = [
     "0.0.0.0/8",
     "10.0.0.0/8",
@@ -569,6 +635,31 @@ except Exception as e:
     print(f"Error installing Chrome driver: {e}")
     driver_path = "chromedriver"  # Fallback
 
+class JSONArrayWriter:
+    """
+    Write a JSON array item by item, so the output is streamed instead of dumped at the end.
+    """
+    def __init__(self, filepath, indent=4):
+        self.filepath = filepath
+        self.indent = indent
+        self.count = 0
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.filepath, "w")
+        self.file.write("[")
+        return self
+
+    def write(self, item):
+        item_text = json.dumps(item, indent=self.indent)
+        prefix = " " * self.indent if self.indent else ""
+        self.file.write(("," if self.count else "") + "\n" + prefix + item_text.replace("\n", "\n" + prefix))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.write("\n]" if self.count else "]")
+        self.file.close()
+
 def location_text_to_value(text):
     """
     Convert location placeholder text to value format
@@ -618,6 +709,137 @@ def extract_query_type_value(browser):
     except:
         return None
 
+PTN_NEXT_DATA = re.compile(r'<script[^>]*\bid=["\']?__NEXT_DATA__["\']?[^>]*>(.*?)</script>', flags=re.IGNORECASE | re.DOTALL)
+
+def hyperglass_config_to_vps(config: dict) -> list:
+    """
+    Build the VPs from the hyperglass UI config, from __NEXT_DATA__ or the config endpoint.
+    1.x: networks -> locations (with VRFs), the queries are shared by all locations.
+    2.x: devices grouped by network, each location has its own directives.
+    """
+    vps = []
+    queries = config.get('queries', {})
+    queries_list = queries.get('list', []) if isinstance(queries, dict) else queries
+    query_types = []
+    for q in queries_list or []:
+        if isinstance(q, dict) and q.get('enable'):
+            query_types.append({
+                'value': q.get('name'),
+                'placeholder': q.get('display_name')
+            })
+    if query_types:
+        for net in config.get('networks', []):
+            for loc in net.get('locations', []):
+                # Find default VRF
+                vrfs = loc.get('vrfs', [])
+                default_vrf = next((v['_id'] for v in vrfs if v.get('default')), None)
+                if not default_vrf and vrfs:
+                    default_vrf = vrfs[0]['_id']
+                
+                params = {
+                    'query_location': loc.get('_id')
+                }
+                if default_vrf:
+                    params['query_vrf'] = default_vrf
+
+                vps.append({
+                    'params': params,
+                    'command': {
+                        'name': 'query_type',
+                        'options': query_types
+                    },
+                    'input': {
+                        'name': 'query_target',
+                        'placeholder': ''
+                    },
+                    'hint': loc.get('name')
+                })
+
+    for group in config.get('devices', []):
+        if not isinstance(group, dict):
+            continue
+        for loc in group.get('locations', []):
+            directives = [{
+                'value': directive.get('id'),
+                'placeholder': directive.get('name')
+            } for directive in loc.get('directives', []) if directive.get('id')]
+            if not directives:
+                continue
+            vps.append({
+                'params': {
+                    'queryLocation': loc.get('id')
+                },
+                'command': {
+                    'name': 'queryType',
+                    'options': directives
+                },
+                'input': {
+                    'name': 'queryTarget',
+                    'placeholder': '',
+                    'is_list': True
+                },
+                'hint': loc.get('name')
+            })
+    return vps
+
+def hyperglass_config_from_json(data: dict) -> dict:
+    """
+    The UI config in the __NEXT_DATA__ of the page, or in the response of a config endpoint.
+    """
+    if not isinstance(data, dict):
+        return {}
+    if 'props' in data:
+        return data.get('props', {}).get('appProps', {}).get('config', {}) or {}
+    if isinstance(data.get('config'), dict):
+        return data['config']
+    return data
+
+def parse_hyperglass_static(url, html_text=None, next_data=None):
+    """
+    Parse a Hyperglass page without a browser:
+    1. __NEXT_DATA__ of the given (or downloaded) HTML, or the given __NEXT_DATA__ text.
+    2. The config endpoints in HYPERGLASS_CONFIG_PATHS.
+    Returns None if the config is not found, the page then needs the interactive parser.
+    """
+    header = dict(BASE_HEADER)
+    header["User-Agent"] = random.choice(USER_AGENT_LIST)
+    candidates = []
+    if next_data is not None:
+        candidates.append(('next_data', next_data))
+    elif html_text is not None:
+        match = PTN_NEXT_DATA.search(html_text)
+        if match:
+            candidates.append(('next_data', match.group(1)))
+    with requests.Session() as session:
+        if not candidates:
+            try:
+                response = session.get(url, timeout=TIMEOUT, headers=header, verify=False)
+                match = PTN_NEXT_DATA.search(response.text)
+                if match:
+                    candidates.append(('next_data', match.group(1)))
+            except Exception:
+                pass
+        for source, text in candidates:
+            try:
+                vps = hyperglass_config_to_vps(hyperglass_config_from_json(json.loads(text)))
+            except (ValueError, AttributeError, KeyError, TypeError):
+                continue
+            if vps:
+                return {'url': url, 'type': source, 'vps': vps, 'success': True, 'error': None}
+
+        base_url = url if url.endswith('/') else url + '/'
+        for path in HYPERGLASS_CONFIG_PATHS:
+            try:
+                response = session.get(urljoin(base_url, path), timeout=TIMEOUT, headers=header, verify=False)
+                if response.status_code != 200:
+                    continue
+                vps = hyperglass_config_to_vps(hyperglass_config_from_json(response.json()))
+            except Exception:
+                continue
+            if vps:
+                return {'url': url, 'type': 'config_api', 'vps': vps, 'success': True, 'error': None}
+    return None
+
 class HyperglassParser:
     """
     Parser for Hyperglass pages with dynamic CSS selectors
@@ -632,6 +854,9 @@ class HyperglassParser:
             headless (bool): Whether to run browser in headless mode
         """
         self.browser = None
+        # The URL currently loaded and untouched, read-only steps on the same URL reuse it
+        self.loaded_url = None
+        self.pages_parsed = 0
         
     def init_browser(self):
         """Initialize Chrome browser with optimized settings for dynamic content"""
@@ -654,16 +879,77 @@ class HyperglassParser:
     def close_browser(self):
         """Close the browser"""
         if self.browser:
-            self.browser.quit()
+            try:
+                self.browser.quit()
+            except Exception:
+                pass
             self.browser = None
+        self.loaded_url = None
+        self.pages_parsed = 0
+
+    def load_page(self, url, fresh=False):
+        """
+        Load the URL and wait for the document, skipped if it is already loaded and not modified.
+        """
+        self.init_browser()
+        if fresh or self.loaded_url != url:
+            self.loaded_url = None
+            self.browser.get(url)
+            self._wait(HYPERGLASS_LOAD_TIMEOUT).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
+            self.loaded_url = url
+
+    def _wait(self, timeout=HYPERGLASS_WAIT_TIMEOUT):
+        return WebDriverWait(self.browser, timeout, poll_frequency=0.05, ignored_exceptions=(StaleElementReferenceException,))
+
+    def _visible_menu(self, d):
+        for m in d.find_elements(By.CSS_SELECTOR, "div[class*='-menu'][id*='react-select'][id*='listbox']"):
+            if m.is_displayed():
+                return m
+        return False
+
+    def _wait_menu_closed(self):
+        try:
+            self._wait().until_not(self._visible_menu)
+        except TimeoutException:
+            pass
+
+    def _close_menu(self):
+        self.browser.find_element(By.TAG_NAME, "body").click()
+        self._wait_menu_closed()
+
+    def _hidden_value(self, selector):
+        elements = self.browser.find_elements(By.CSS_SELECTOR, selector)
+        return elements[0].get_attribute('value') if elements else None
+
+    def _select_option(self, option, hidden_selector=None):
+        """
+        Click one option of an open menu, and wait until the selection is committed:
+        the menu is closed, and the hidden input (if any) has a new value.
+        Returns the value of the hidden input, None if there is no such input.
+        """
+        old_value = self._hidden_value(hidden_selector) if hidden_selector else None
+        self.browser.execute_script("arguments[0].scrollIntoView({block: 'center'});", option)
+        self._wait().until(EC.element_to_be_clickable(option))
+        ActionChains(self.browser).move_to_element(option).click().perform()
+        self._wait_menu_closed()
+        if not hidden_selector:
+            return None
+        def committed(d):
+            value = self._hidden_value(hidden_selector)
+            return value if value and value != old_value else False
+        try:
+            return self._wait().until(committed)
+        except TimeoutException:
+            return self._hidden_value(hidden_selector)
             
     def parse_nextjs_data(self, url):
         """
         Parse Hyperglass Next.js data directly from script tag
         """
         try:
-            self.init_browser()
-            self.browser.get(url)
+            self.load_page(url)
             
             try:
                 script = self.browser.find_element(By.ID, "__NEXT_DATA__")
@@ -671,51 +957,9 @@ class HyperglassParser:
                 return None
 
             data = json.loads(script.get_attribute('innerHTML'))
-            config = data.get('props', {}).get('appProps', {}).get('config', {})
-            
-            # Extract Query Types
-            query_types = []
-            queries_list = config.get('queries', {}).get('list', [])
-            
-            if not queries_list:
+            vps = hyperglass_config_to_vps(hyperglass_config_from_json(data))
+            if not vps:
                 return None
-            
-            for q in queries_list:
-                if q.get('enable'):
-                    query_types.append({
-                        'value': q.get('name'),
-                        'placeholder': q.get('display_name')
-                    })
-            
-            # Extract Locations and VRFs
-            vps = []
-            networks = config.get('networks', [])
-            for net in networks:
-                for loc in net.get('locations', []):
-                    # Find default VRF
-                    vrfs = loc.get('vrfs', [])
-                    default_vrf = next((v['_id'] for v in vrfs if v.get('default')), None)
-                    if not default_vrf and vrfs:
-                        default_vrf = vrfs[0]['_id']
-                    
-                    params = {
-                        'query_location': loc.get('_id')
-                    }
-                    if default_vrf:
-                        params['query_vrf'] = default_vrf
-
-                    vps.append({
-                        'params': params,
-                        'command': {
-                            'name': 'query_type',
-                            'options': query_types
-                        },
-                        'input': {
-                            'name': 'query_target',
-                            'placeholder': ''
-                        },
-                        'hint': loc.get('name')
-                    })
 
             return {
                 'url': url,
@@ -733,21 +977,15 @@ class HyperglassParser:
         Helper to open a dropdown menu and return the menu element.
         Simplified logic: If a menu is already visible, use it. Otherwise click and wait.
         """
-        menus = self.browser.find_elements(By.CSS_SELECTOR, "div[class*='-menu'][id*='react-select'][id*='listbox']")
-        for m in menus:
-            if m.is_displayed():
-                return m
+        menu = self._visible_menu(self.browser)
+        if menu:
+            return menu
         
         ActionChains(self.browser).move_to_element(control_element).click().perform()
-        
-        def wait_for_menu(d):
-            candidates = d.find_elements(By.CSS_SELECTOR, "div[class*='-menu'][id*='react-select'][id*='listbox']")
-            for c in candidates:
-                if c.is_displayed():
-                    return c
-            return False
-
-        return WebDriverWait(self.browser, 5).until(wait_for_menu)
+        # The menu and its options are rendered after the click
+        menu = self._wait(5).until(self._visible_menu)
+        self._wait().until(lambda d: menu.find_elements(By.CSS_SELECTOR, "div[class*='option']"))
+        return menu
 
     def detect_hyperglass_type(self, url):
         """
@@ -757,14 +995,15 @@ class HyperglassParser:
         
         for attempt in range(max_retries):
             try:
-                self.init_browser()
-                self.browser.get(url)
+                self.load_page(url, fresh=attempt > 0)
                 
-                # Wait for page to load
-                WebDriverWait(self.browser, 15).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                time.sleep(1)
+                # Wait until the UI of either type is rendered
+                try:
+                    self._wait(HYPERGLASS_RENDER_TIMEOUT).until(
+                        lambda d: d.find_elements(By.CSS_SELECTOR, "li[class*='chakra-wrap'], input[id*='react-select']")
+                    )
+                except TimeoutException:
+                    pass
                                 
                 # Check for Chakra UI list style (Type 2)
                 # Look for li elements with class starting with chakra-wrap
@@ -783,8 +1022,6 @@ class HyperglassParser:
                     
                 if attempt == max_retries - 1:
                     return 'react_select'
-                    
-                time.sleep(1)
                 
             except Exception as e:
                 if self.browser:
@@ -792,8 +1029,6 @@ class HyperglassParser:
                     
                 if attempt == max_retries - 1:
                     return 'react_select'
-                    
-                time.sleep(1)
             
     def parse_react_select_options(self, url):
         """
@@ -815,13 +1050,15 @@ class HyperglassParser:
         Fallback interactive parser for React Select
         """
         try:
-            self.init_browser()
-            self.browser.get(url)
-            
-            WebDriverWait(self.browser, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            time.sleep(1)
+            self.load_page(url)
+            # The page is modified from now on
+            self.loaded_url = None
+            try:
+                self._wait(HYPERGLASS_RENDER_TIMEOUT).until(
+                    lambda d: d.find_elements(By.CSS_SELECTOR, "input[id*='react-select']")
+                )
+            except TimeoutException:
+                pass
             
             locations = []
             target_placeholder = ''
@@ -855,17 +1092,9 @@ class HyperglassParser:
                     opt = options[i]
                     name = opt.text.strip()
                     
-                    # Scroll into view and click
-                    self.browser.execute_script("arguments[0].scrollIntoView({block: 'center'});", opt)
-                    time.sleep(0.2)
-                    ActionChains(self.browser).move_to_element(opt).click().perform()
-                    time.sleep(0.5)
-                    
-                    # Get value
-                    try:
-                        val_input = self.browser.find_element(By.CSS_SELECTOR, "input[name='queryLocation'][type='hidden']")
-                        value = val_input.get_attribute('value')
-                    except:
+                    # Click and wait for the hidden value
+                    value = self._select_option(opt, "input[name='queryLocation'][type='hidden']")
+                    if not value:
                         value = location_text_to_value(name)
                         
 
@@ -892,16 +1121,9 @@ class HyperglassParser:
                             q_opt = q_options[j]
                             q_text = q_opt.text.strip()
                             
-                            # Scroll into view and click
-                            self.browser.execute_script("arguments[0].scrollIntoView({block: 'center'});", q_opt)
-                            time.sleep(0.2)
-                            ActionChains(self.browser).move_to_element(q_opt).click().perform()
-                            time.sleep(0.5)
-                            
-                            try:
-                                q_val_input = self.browser.find_element(By.CSS_SELECTOR, "input[name='queryType'][type='hidden']")
-                                q_value = q_val_input.get_attribute('value')
-                            except:
+                            # Click and wait for the hidden value
+                            q_value = self._select_option(q_opt, "input[name='queryType'][type='hidden']")
+                            if not q_value:
                                 q_value = q_text.lower().replace(' ', '_')
                                 
                             current_query_types.append({'placeholder': q_text, 'value': q_value})
@@ -911,8 +1133,7 @@ class HyperglassParser:
                             try:
                                 input_elem = query_control.find_element(By.CSS_SELECTOR, "input[aria-expanded]")
                                 if input_elem.get_attribute("aria-expanded") == "true":
-                                    self.browser.find_element(By.TAG_NAME, "body").click()
-                                    time.sleep(0.5)
+                                    self._close_menu()
                             except:
                                 pass
 
@@ -922,14 +1143,16 @@ class HyperglassParser:
                     # Try to find clear button globally
                     clear_btns = self.browser.find_elements(By.CSS_SELECTOR, "div[role='button']")
                     clear_btns[0].click()
-                    time.sleep(0.5)
+                    try:
+                        self._wait().until(lambda d: not self._hidden_value("input[name='queryLocation'][type='hidden']"))
+                    except TimeoutException:
+                        pass
                 except Exception as e:
                     print(f"Error processing location {i}: {e}")
                     try:
                         input_elem = loc_control.find_element(By.CSS_SELECTOR, "input[aria-expanded]")
                         if input_elem.get_attribute("aria-expanded") == "true":
-                            self.browser.find_element(By.TAG_NAME, "body").click()
-                            time.sleep(0.5)
+                            self._close_menu()
                     except:
                         pass
             
@@ -982,13 +1205,15 @@ class HyperglassParser:
         Parse Chakra UI list style Hyperglass page (Type 2)
         """
         try:
-            self.init_browser()
-            self.browser.get(url)
-            
-            WebDriverWait(self.browser, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            time.sleep(2)
+            self.load_page(url)
+            # The page is modified from now on
+            self.loaded_url = None
+            try:
+                self._wait(HYPERGLASS_RENDER_TIMEOUT).until(
+                    lambda d: d.find_elements(By.CSS_SELECTOR, "li[class*='chakra-wrap']")
+                )
+            except TimeoutException:
+                pass
             
             locations = []
             query_types = []
@@ -1038,7 +1263,14 @@ class HyperglassParser:
 
             if location_items:
                 ActionChains(self.browser).move_to_element(location_items[0]).click().perform()
-                time.sleep(1)
+                # The query form is rendered after a location is selected
+                try:
+                    self._wait(HYPERGLASS_RENDER_TIMEOUT).until(
+                        lambda d: d.find_elements(By.XPATH, "//div[contains(@class, 'placeholder')]/following-sibling::div//input")
+                        or d.find_elements(By.CSS_SELECTOR, "input[aria-label='Query Type']")
+                    )
+                except TimeoutException:
+                    pass
             
             try:
                 # Find the query type control
@@ -1066,8 +1298,7 @@ class HyperglassParser:
                     
                     # Close menu to reset state before iteration
                     try:
-                        self.browser.find_element(By.TAG_NAME, "body").click()
-                        time.sleep(0.5)
+                        self._close_menu()
                     except:
                         pass
                         
@@ -1102,14 +1333,15 @@ class HyperglassParser:
                             option_text = option.text.strip()
                             
                             if option_text:
-                                # Scroll into view and click
-                                self.browser.execute_script("arguments[0].scrollIntoView({block: 'center'});", option)
-                                time.sleep(0.2)
-                                ActionChains(self.browser).move_to_element(option).click().perform()
-                                time.sleep(0.5) # Wait for React state update
-                                
-                                # Extract real value from hidden input
-                                actual_value = extract_query_type_value(self.browser)
+                                # Click and wait for the React state update
+                                old_value = extract_query_type_value(self.browser)
+                                self._select_option(option)
+                                try:
+                                    actual_value = self._wait().until(
+                                        lambda d: extract_query_type_value(d) if extract_query_type_value(d) != old_value else False
+                                    )
+                                except TimeoutException:
+                                    actual_value = extract_query_type_value(self.browser)
                                 
                                 # Fallback
                                 if not actual_value:
@@ -1174,38 +1406,77 @@ class HyperglassParser:
                 'error': str(e)
             }
 
-    def parse_hyperglass_page(self, url):
+    def parse_hyperglass_page(self, url, keep_browser=False):
         """
         Main method to parse any Hyperglass page
         Auto-detects the type and uses appropriate parser
+        With keep_browser, the browser is reused by the next page, and only recycled after a failure
+        or HYPERGLASS_BROWSER_MAX_PAGES pages.
         """
+        result = None
         try:
             page_type = self.detect_hyperglass_type(url)
             
             if page_type == 'react_select':
-                return self.parse_react_select_options(url)
+                result = self.parse_react_select_options(url)
             elif page_type == 'chakra_list':
-                return self.parse_chakra_list_options(url)
+                result = self.parse_chakra_list_options(url)
             else:
-                return {
+                result = {
                     'url': url,
                     'type': 'unknown',
                     'success': False,
                     'error': 'Not a recognized Hyperglass page'
                 }
         except Exception as e:
-            return {
+            result = {
                 'url': url,
                 'success': False,
                 'error': str(e)
             }
         finally:
-            self.close_browser()
+            self.pages_parsed += 1
+            if not keep_browser or not (result and result.get('success')) or self.pages_parsed >= HYPERGLASS_BROWSER_MAX_PAGES:
+                self.close_browser()
+            else:
+                self.loaded_url = None
+        return result
+
+# One long-lived HyperglassParser per process, its browser is kept across the pages and the tasks of a
+# pool worker, and recycled by the parser on failure or after HYPERGLASS_BROWSER_MAX_PAGES pages.
+_HYPERGLASS_PARSER = None
+_HYPERGLASS_LOCK = threading.Lock()
+
+def parse_with_hyperglass_browser(url):
+    global _HYPERGLASS_PARSER
+    with _HYPERGLASS_LOCK:
+        if _HYPERGLASS_PARSER is None:
+            _HYPERGLASS_PARSER = HyperglassParser()
+        return _HYPERGLASS_PARSER.parse_hyperglass_page(url, keep_browser=True)
+
+def close_hyperglass_parser():
+    global _HYPERGLASS_PARSER
+    with _HYPERGLASS_LOCK:
+        if _HYPERGLASS_PARSER is not None:
+            _HYPERGLASS_PARSER.close_browser()
+            _HYPERGLASS_PARSER = None
+
+def init_hyperglass_worker():
+    """
+    Initializer of the process pool workers, the browser of the worker is closed when the worker exits.
+    atexit does not run in the workers of a process pool, the multiprocessing finalizers do.
+    """
+    multiprocessing.util.Finalize(None, close_hyperglass_parser, exitpriority=10)
+
+atexit.register(close_hyperglass_parser)
 
 # Convenience functions
-def parse_hyperglass_url(url):
-    parser = HyperglassParser()
-    try:
-        return parser.parse_hyperglass_page(url)
-    finally:
-        parser.close_browser()
\ No newline at end of file
+def parse_hyperglass_url(url, html_text=None, next_data=None):
+    """
+    Static extraction first, the browser is only started for the versions that need interaction.
+    """
+    result = parse_hyperglass_static(url, html_text, next_data)
+    if result:
+        return result
+    return parse_with_hyperglass_browser(url)
+
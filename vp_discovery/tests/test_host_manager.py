@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from host_manager import HostManager
+from mock_ssh_server import start_mock_hosts
+
+NUM_HOSTS = 3
+
+@pytest.fixture(scope="module")
+def mock_hosts():
+    mock_hosts, hosts = start_mock_hosts(NUM_HOSTS)
+    yield hosts
+    for mock_host in mock_hosts:
+        mock_host.stop()
+
+@pytest.fixture
+def manager(mock_hosts):
+    with HostManager(mock_hosts) as manager:
+        yield manager
+
+def test_connect_all(manager):
+    assert manager.connect_all() == []
+    assert all(metrics["connected"] for metrics in manager.metrics)
+
+def test_run_all_in_host_order(manager):
+    manager.connect_all()
+    results = manager.run_all(lambda m_idx, host: f"echo {m_idx}")
+    assert [(exit_status, out.strip()) for exit_status, out, _ in results] == [(0, str(m_idx)) for m_idx in range(NUM_HOSTS)]
+
+def test_check_health(manager):
+    manager.connect_all()
+    assert all(metrics["healthy"] for metrics in manager.check_health())
+
+def test_client_reconnects_closed_transport(manager):
+    manager.connect_all()
+    client = manager.client(0)
+    client.get_transport().close()
+    assert not client.is_alive()
+    assert manager.client(0).is_alive()
+    assert manager.metrics[0]["connects"] == 2
+    assert manager.run(0, "echo ok")[:2] == (0, "ok\n")